@@ -4,15 +4,26 @@ import traceback
 import json
 import os
 import csv
-import copy
+import threading
+import asyncio
 from typing import Dict
-from datetime import datetime
 from fastapi import FastAPI, HTTPException, Request, Body, Header, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from models import SpinRequest, SpinResponse, WinningLine, UserState
-from llm_client import LLMClient
+from llm_client import LLMClient, client_pool
 from outcome_engine import OutcomeEngine
+from rtp_calculator import calculate_rtp
+from monte_carlo import run_monte_carlo
+from downsample import MinMaxDownsampler, lttb
+from task_executor import BoundedExecutor, ExecutorSaturated
+from commentary_board import CommentaryBoard
+from commentary_cache import CommentaryCache
+from session_store import SessionStore
+from session_config import SessionConfig
+from logger import GameLogger
+from spin_store import SpinStore
+from player_state import PlayerState
 import logging
 
 # Configure global logging
@@ -46,35 +57,125 @@ app.add_middleware(
 
 # Global Engine Cache to avoid re-initializing for same config
 engine_cache: Dict[str, OutcomeEngine] = {}
+engine_cache_lock = threading.Lock()
 
-def get_cached_engine(config: dict) -> OutcomeEngine:
-    """获取或创建缓存的引擎实例"""
-    # 创建一个临时引擎来获取哈希（轻量级，不初始化桶）
-    temp_engine = OutcomeEngine(config_override=config)
-    config_hash = temp_engine._get_config_hash()
+def warm_up_engine(config_hash: str, engine: OutcomeEngine):
+    """
+    后台线程中加载/构建奖池。失败时 engine.build_error 记录原因，并移出缓存：
+    仍持有该引擎的会话会在下次请求时看到构建失败（见 require_ready_engine），之后重新获取引擎重试。
+    """
+    start_time = time.time()
+    try:
+        engine.ensure_ready()
+        logger.info(f"Engine {config_hash} ready in {time.time() - start_time:.2f}s")
+    except Exception as e:
+        logger.error(f"Engine warm-up failed for hash {config_hash}: {e}")
+        traceback.print_exc()
+        with engine_cache_lock:
+            if engine_cache.get(config_hash) is engine:
+                del engine_cache[config_hash]
+
+def get_cached_engine(config: SessionConfig) -> OutcomeEngine:
+    """
+    获取或创建缓存的引擎实例。
+    不会阻塞：缓存未命中时只解析并校验配置（无效时抛出异常），奖池在后台线程加载/构建，
+    就绪前 engine.is_ready 为 False。
+    """
+    # 结构化哈希在 SessionConfig 上只计算一次，命中缓存时无需构造引擎
+    config_hash = config.config_hash
     
-    if config_hash not in engine_cache:
-        logger.info(f"Engine cache miss for hash {config_hash}. Initializing...")
-        # 此时 temp_engine 已经完成了初始化（从磁盘缓存或计算）
-        engine_cache[config_hash] = temp_engine
-    else:
+    engine = engine_cache.get(config_hash)
+    if engine is not None:
         logger.info(f"Engine cache hit for hash {config_hash}.")
+        return engine
+
+    # 同一哈希只创建一个引擎、启动一次构建，其余并发请求复用
+    with engine_cache_lock:
+        engine = engine_cache.get(config_hash)
+        if engine is None:
+            logger.info(f"Engine cache miss for hash {config_hash}. Warming up in background...")
+            engine = OutcomeEngine(config_override=config.to_dict(), lazy=True)
+            engine_cache[config_hash] = engine
+            threading.Thread(
+                target=warm_up_engine, args=(config_hash, engine),
+                name=f"engine-warmup-{config_hash[:8]}", daemon=True
+            ).start()
+        else:
+            logger.info(f"Engine cache hit for hash {config_hash}.")
     
-    return engine_cache[config_hash]
+    return engine
+
+def require_ready_engine(session: "SessionData") -> OutcomeEngine:
+    """
+    返回会话的可用引擎。
+    引擎构建失败或已被移出缓存时，会话重新通过 get_cached_engine 获取引擎（重新触发构建）；
+    本次请求对构建失败返回 500 并带上失败原因，奖池未就绪返回 503，客户端稍后重试。
+    """
+    engine = session.engine
+    if engine.build_error is not None or engine_cache.get(session.config.config_hash) is not engine:
+        session.engine = get_cached_engine(session.config)
+    if engine.build_error is not None:
+        raise HTTPException(status_code=500, detail=f"Engine build failed: {engine.build_error}")
+    engine = session.engine
+    if not engine.is_ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Engine warming up, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    return engine
+
+# --- Executors ---
+# 引擎/模拟是同步的 CPU 密集任务，放到有界线程池中执行，事件循环只负责 IO。
+# 旋转是毫秒级短任务；模拟与 RTP 计算可能持续数秒，只允许少量并发。
+spin_executor = BoundedExecutor("spin", max_workers=8, max_queue=64)
+simulation_executor = BoundedExecutor("simulate", max_workers=2, max_queue=4)
+
+# Background commentary: tickets + references to running tasks (keeps them from being GC'd)
+commentary_board = CommentaryBoard()
+commentary_cache = CommentaryCache()
+background_tasks = set()
+
+# Spin audit log (game_data.csv), written in batches by a background thread
+game_logger = GameLogger()
+# Queryable spin history (SQLite) behind /history and /history/stats; the database is opened on first use
+spin_store = SpinStore()
+
+def server_busy(executor: BoundedExecutor) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"Server busy ({executor.name}), please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
+async def offload(executor: BoundedExecutor, fn, *args, **kwargs):
+    """在有界线程池中执行同步任务；池已满时返回 429"""
+    try:
+        future = executor.submit(fn, *args, **kwargs)
+    except ExecutorSaturated:
+        raise server_busy(executor)
+    return await asyncio.wrap_future(future)
 
 class SessionData:
-    def __init__(self, default_config):
-        self.id = str(uuid.uuid4())
-        self.config = copy.deepcopy(default_config)
+    def __init__(self, default_config: SessionConfig, session_id: str = None):
+        self.id = session_id or str(uuid.uuid4())
+        # 只读、写时复制：新会话直接共享默认配置，POST /config 时替换为新的 SessionConfig
+        self.config = default_config
         # 使用缓存引擎
         self.engine = get_cached_engine(self.config)
-        self.history = [] # List of dicts
-        self.total_bet = 0.0
-        self.total_payout = 0.0
+        # 服务端玩家状态（连败数、旋转数、RTP、最高余额），每次旋转 O(1) 更新
+        self.player = PlayerState()
+        # 串行化同一会话的旋转：读取玩家状态 -> 旋转 -> 更新状态 不被并发请求打断
+        self.spin_lock = asyncio.Lock()
         self.last_access = time.time()
 
+def create_session(session_id: str) -> SessionData:
+    logger.info(f"Creating new session: {session_id}")
+    return SessionData(DEFAULT_SESSION_CONFIG, session_id)
+
 # Global Sessions Store (In-Memory)
-sessions: Dict[str, SessionData] = {}
+# 空闲 30 分钟的会话由后台线程清理；超过 10000 个会话时淘汰最久未访问的
+sessions = SessionStore(create_session, idle_ttl=1800.0, max_sessions=10000, sweep_interval=60.0)
 
 # Load default config once
 DEFAULT_CONFIG = {}
@@ -88,6 +189,9 @@ if os.path.exists(config_path):
 else:
     logger.error("CRITICAL: No configuration file found!")
 
+DEFAULT_SESSION_CONFIG = SessionConfig(DEFAULT_CONFIG)
+DEFAULT_CONFIG_HASH = DEFAULT_SESSION_CONFIG.config_hash
+
 def get_session(x_session_id: str = Header(None)) -> SessionData:
     """
     Dependency to retrieve or create a session based on the X-Session-ID header.
@@ -96,16 +200,47 @@ def get_session(x_session_id: str = Header(None)) -> SessionData:
         # If no header, create a temporary one (though frontend should send it)
         x_session_id = str(uuid.uuid4())
     
-    if x_session_id not in sessions:
-        logger.info(f"Creating new session: {x_session_id}")
-        sessions[x_session_id] = SessionData(DEFAULT_CONFIG)
-    
-    session = sessions[x_session_id]
-    session.last_access = time.time()
-    return session
+    return sessions.get_or_create(x_session_id)
 
 # --- Endpoints ---
 
+@app.on_event("startup")
+async def warm_up_default_engine():
+    """启动时在后台构建默认配置的引擎，不阻塞 worker 启动"""
+    if DEFAULT_CONFIG:
+        get_cached_engine(DEFAULT_SESSION_CONFIG)
+    sessions.start_sweeper()
+
+@app.on_event("shutdown")
+async def shutdown_executors():
+    sessions.stop_sweeper()
+    spin_executor.shutdown()
+    simulation_executor.shutdown()
+    await client_pool.aclose()
+    game_logger.close()
+    spin_store.close()
+
+@app.get("/health")
+async def health():
+    """健康/就绪检查：默认引擎就绪前返回 503"""
+    default_engine = engine_cache.get(DEFAULT_CONFIG_HASH)
+    ready = default_engine is not None and default_engine.is_ready
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ok" if ready else "warming_up",
+            "is_ready": ready,
+            "engines": {h: e.is_ready for h, e in engine_cache.items()},
+            "sessions": len(sessions),
+            "session_store": sessions.stats(),
+            "executors": {ex.name: ex.stats() for ex in (spin_executor, simulation_executor)},
+            "commentary_cache": commentary_cache.stats(),
+            "llm_clients": client_pool.stats(),
+            "audit_log": game_logger.stats(),
+            "spin_store": spin_store.writer_stats()
+        }
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     error_msg = f"{type(exc).__name__}: {str(exc)}"
@@ -132,32 +267,38 @@ async def global_exception_handler(request: Request, exc: Exception):
 @app.get("/api/config")
 async def get_config_api(session: SessionData = Depends(get_session)):
     """Get current game configuration (API alias)"""
-    # Inject real bucket stats if available
-    if hasattr(session.engine, 'bucket_stats'):
-        if "buckets" in session.config:
-            for k, avg_mult in session.engine.bucket_stats.items():
-                if k in session.config["buckets"]:
-                    session.config["buckets"][k]["real_avg_mult"] = avg_mult
-    return session.config
+    return await get_config(session)
 
 @app.get("/config")
 async def get_config(session: SessionData = Depends(get_session)):
-    # Inject real bucket stats if available
-    if hasattr(session.engine, 'bucket_stats'):
-        if "buckets" in session.config:
-            for k, avg_mult in session.engine.bucket_stats.items():
-                if k in session.config["buckets"]:
-                    session.config["buckets"][k]["real_avg_mult"] = avg_mult
-    return session.engine.config
+    """Current session configuration, with real bucket stats (real_avg_mult) injected into a copy"""
+    return session.config.to_dict(getattr(session.engine, 'bucket_stats', None))
+
+@app.get("/coverage")
+async def get_coverage(session: SessionData = Depends(get_session)):
+    """当前会话引擎的奖池覆盖情况：每个奖池的样本数、目标数量与概率估计"""
+    return require_ready_engine(session).bucket_coverage
+
+@app.get("/rtp")
+async def get_rtp(session: SessionData = Depends(get_session)):
+    """
+    精确计算当前会话卷轴/赔率配置的基础游戏 RTP、命中率、方差与各奖池概率质量。
+    不依赖奖池构建，也不需要跑 /simulate。
+    """
+    try:
+        return await offload(simulation_executor, calculate_rtp, session.config)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Cannot calculate RTP: {str(e)}")
 
 @app.post("/config")
 async def update_config(config: dict = Body(...), session: SessionData = Depends(get_session)):
     logger.info(f"[{session.id}] Configuration Update Request")
     try:
-        # Update session config
-        session.config = config
-        # Reload engine with cached instance
-        session.engine = get_cached_engine(session.config)
+        # Structural parts stay shared when unchanged
+        new_config = SessionConfig.from_dict(config, current=session.config)
+        # Cached engine, or a new one validated here (bad reels/lines -> 400) and built in the background
+        engine = get_cached_engine(new_config)
+        session.config, session.engine = new_config, engine
         logger.info(f"[{session.id}] Configuration updated successfully")
         return {"status": "ok", "message": "Config updated for this session"}
     except Exception as e:
@@ -169,36 +310,53 @@ async def update_config(config: dict = Body(...), session: SessionData = Depends
 async def spin(req: SpinRequest, session: SessionData = Depends(get_session)):
     logger.info(f"[{session.id}] SPIN START | Bet: {req.bet} | Balance: {req.current_balance}")
     
+    engine = require_ready_engine(session)
+
     start_time = time.time()
     spin_id = str(uuid.uuid4())
 
-    # 0. Get History Stats (Session specific)
-    # Initial virtual stats to prevent extreme RTP swings at start
-    current_total_bet = session.total_bet + 100.0
-    current_total_payout = session.total_payout + 95.0
-    current_history_rtp = current_total_payout / current_total_bet if current_total_bet > 0 else 0.95
-    
-    # 1. Construct User State
-    user_state = req.user_state
-    if not user_state:
+    # 0-2. Server-side player state (fail streak / spins / RTP are not taken from the client).
+    # The lock makes read -> spin -> record atomic per session, so concurrent spins
+    # each see the state left by the previous one.
+    player = session.player
+    initial_balance = req.user_state.initial_balance if req.user_state else req.current_balance
+    async with session.spin_lock:
+        player.observe_balance(req.current_balance)
+        current_history_rtp = player.rtp
+        # User state for commentary (pre-spin values)
         user_state = UserState(
             current_bet=req.bet,
             wallet_balance=req.current_balance,
-            initial_balance=req.current_balance,
-            historical_rtp=current_history_rtp,
-            max_historical_balance=req.current_balance * 1.5
+            initial_balance=initial_balance,
+            total_spins=player.spins,
+            fail_streak=player.fail_streak,
+            historical_rtp=player.window_rtp,
+            max_historical_balance=player.max_balance
         )
-    
-    user_state.historical_rtp = current_history_rtp
 
-    # 2. Generate Outcome
-    try:
-        # Pass session.config as runtime_config to ensure session-specific settings (weights, RTP) are used
-        # even if the engine instance is shared/cached.
-        result = session.engine.spin(user_state.dict(), runtime_config=session.config)
-    except Exception as e:
-        logger.error(f"Engine Failed: {e}")
-        raise e
+        # Generate Outcome
+        try:
+            # Pass session.config as runtime_config to ensure session-specific settings (weights, RTP) are used
+            # even if the engine instance is shared/cached.
+            result = await offload(
+                spin_executor, engine.spin_for,
+                bet=req.bet,
+                balance=req.current_balance,
+                initial_balance=initial_balance,
+                total_spins=player.spins,
+                fail_streak=player.fail_streak,
+                max_historical_balance=player.max_balance,
+                historical_rtp=player.window_rtp,
+                runtime_config=session.config
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Engine Failed: {e}")
+            raise e
+
+        player.record(req.bet, result["total_payout"], req.current_balance + result["balance_update"])
+        new_rtp = player.rtp
 
     # 3. Create Response Object
     spin_response = SpinResponse(
@@ -213,74 +371,133 @@ async def spin(req: SpinRequest, session: SessionData = Depends(get_session)):
         fail_streak=result.get("fail_streak", 0)
     )
 
-    # 4. Generate AI Commentary
-    try:
-        commentary = LLMClient.generate_commentary(req.config, spin_response, user_state)
-        spin_response.reasoning = commentary
-    except Exception as e:
-        logger.error(f"AI Commentary Failed: {e}")
-        spin_response.reasoning = "Good luck!"
-
-    # 5. Logging (In-Memory Session History)
+    # 4. AI Commentary
+    if req.wait_commentary:
+        try:
+            spin_response.reasoning = await commentary_cache.commentary(req.config, spin_response, user_state)
+        except Exception as e:
+            logger.error(f"AI Commentary Failed: {e}")
+            spin_response.reasoning = "Good luck!"
+    else:
+        # 默认不等待 LLM：返回票据，评论在后台生成，客户端通过 GET /commentary/{ticket} 获取
+        ticket = commentary_board.create(session.id)
+        spin_response.commentary_ticket = ticket
+        task = asyncio.create_task(produce_commentary(ticket, req.config, spin_response.copy(), user_state))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    # 5. Logging (spin history store + audit log)
     latency = (time.time() - start_time) * 1000
-    
-    session.total_bet += req.bet
-    session.total_payout += spin_response.total_payout
-    
-    # Calculate new RTP
-    new_rtp = (session.total_payout + 95.0) / (session.total_bet + 100.0)
     spin_response.history_rtp = new_rtp
 
-    # Append to session history
-    session.history.append({
-        "Timestamp": datetime.now().isoformat(),
-        "Spin_ID": spin_id,
-        "Bet": req.bet,
-        "Payout": spin_response.total_payout,
-        "Is_Win": spin_response.is_win,
-        "Current_RTP": new_rtp,
-        "Latency_ms": round(latency, 2)
-    })
-    
-    # Keep history size manageable
-    if len(session.history) > 100:
-        session.history = session.history[-100:]
+    # Append to spin history (non-blocking, committed by the store's writer thread)
+    spin_store.record(session.id, time.time(), req.bet, spin_response.total_payout, spin_response.bucket_type,
+                      spin_response.fail_streak, latency, new_rtp)
+
+    # Persistent audit log (non-blocking, flushed by the logger thread)
+    game_logger.log_spin(spin_id, req.bet, spin_response.total_payout, new_rtp, req.config.provider, latency)
 
     logger.info(f"[{session.id}] SPIN END | Payout: {spin_response.total_payout} | Bucket: {spin_response.bucket_type}")
 
     return spin_response
 
+async def produce_commentary(ticket: str, config, spin_response: SpinResponse, user_state: UserState):
+    """后台生成评论并写入票据；超过截止时间时先写入兜底文案，迟到的评论到达后再覆盖"""
+    try:
+        text = await commentary_cache.commentary(
+            config, spin_response, user_state,
+            on_late=lambda late_text: commentary_board.resolve(ticket, late_text)
+        )
+    except Exception as e:
+        logger.error(f"AI Commentary Failed: {e}")
+        text = "Good luck!"
+    commentary_board.resolve(ticket, text)
+
+@app.get("/commentary/{ticket}")
+async def get_commentary(ticket: str, wait: float = 0.0, since: int = 0, session: SessionData = Depends(get_session)):
+    """
+    Commentary for a spin ticket.
+    wait > 0 long-polls (max 10s) until the ticket's revision exceeds `since`.
+    status is "pending" until the first line arrives; a late LLM line may later
+    replace the fallback line, bumping `revision`.
+    """
+    entry = await commentary_board.wait(ticket, since=since, timeout=min(max(wait, 0.0), 10.0))
+    if entry is None or entry["session_id"] != session.id:
+        raise HTTPException(status_code=404, detail="Unknown or expired commentary ticket")
+    return {k: entry[k] for k in ("ticket", "status", "reasoning", "revision")}
+
+SIMULATION_MODES = ("full", "downsample", "summary", "stream")
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+def simulation_events(engine: OutcomeEngine, bet: float, count: int, initial_balance: float, runtime_config: dict, downsampler: MinMaxDownsampler = None):
+    """
+    Runs the simulation chunk by chunk: yields ("points", [...]) for each chunk
+    (min/max downsampled when a downsampler is given), then ("summary", result).
+    Memory stays bounded by the chunk size.
+    """
+    run = engine.iter_simulation(bet, count, initial_balance, runtime_config=runtime_config)
+    offset = 0
+    while True:
+        try:
+            balances, rtps = next(run)
+        except StopIteration as done:
+            if downsampler:
+                tail = downsampler.finish()
+                if tail:
+                    yield "points", tail
+            yield "summary", done.value
+            return
+        if downsampler:
+            points = downsampler.feed(balances, rtps)
+        else:
+            points = [
+                {"spin": offset + i + 1, "balance": balance, "rtp": rtp}
+                for i, (balance, rtp) in enumerate(zip(balances.tolist(), rtps.tolist()))
+            ]
+        offset += len(balances)
+        if points:
+            yield "points", points
+
 @app.post("/simulate")
 async def simulate(params: dict = Body(...), session: SessionData = Depends(get_session)):
     """
     Fast simulation endpoint.
     Uses the session's current engine configuration.
+
+    mode:
+      full       - every spin in `history` (default)
+      downsample - about `points` points (default 2000) picked by `method`: lttb (default) or minmax
+      summary    - aggregates only, no history
+      stream     - NDJSON: {"type": "points", "points": [...]} per chunk, then one {"type": "summary", ...};
+                   min/max downsampled when `points` is given
     """
     # Support both 'spins' and 'n_spins' keys
     # Default to 1000 if not provided
     count = int(params.get("spins", params.get("n_spins", 1000)))
-    print(f"DEBUG: Received simulation request for {count} spins")
     logger.info(f"[{session.id}] SIMULATION START | Spins: {count} | Params: {params}")
     
     if count > 1000000: count = 1000000
     if count < 1: count = 1000
     bet = params.get("bet", 10)
     
+    mode = params.get("mode", "full")
+    method = params.get("method", "lttb")
+    points = int(params.get("points", 2000))
+    if mode not in SIMULATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}', expected one of {SIMULATION_MODES}")
+    if method not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown method '{method}', expected one of {DOWNSAMPLE_METHODS}")
+    if points < 3:
+        raise HTTPException(status_code=400, detail="points must be at least 3")
+    
     # 理论上模拟需要足够的本金来支撑所有旋转
     # 如果本金太少，会触发 "Max Win Ratio" 限制，导致大奖被过滤，从而拉低 RTP
     # 因此我们将初始余额设置为：旋转次数 * 单次下注
     initial_balance = count * bet
-    current_balance = initial_balance
-    max_balance = current_balance
-    
-    total_wagered = 0
-    total_won = 0
-    fail_streak = 0
-    history = []
     errors = []
     
     # Use session engine
-    engine = session.engine
+    engine = require_ready_engine(session)
     
     # Debug: Check bucket sizes
     # Force Reload Trigger
@@ -289,65 +506,158 @@ async def simulate(params: dict = Body(...), session: SessionData = Depends(get_
         loss_bucket_size = len(engine.buckets.get("Loss_Random", []))
         logger.info(f"[{session.id}] Loss_Random size: {loss_bucket_size}")
     
-    for i in range(count):
-        current_rtp = (total_won / total_wagered) if total_wagered > 0 else 0
-        
-        user_state = {
-            "current_bet": bet,
-            "wallet_balance": current_balance,
-            "initial_balance": initial_balance,
-            "max_historical_balance": max_balance,
-            "historical_rtp": current_rtp,
-            "fail_streak": fail_streak,
-            "simulation_mode": True
+    def summarize(result: dict, elapsed: float) -> dict:
+        return {
+            "final_balance": result["final_balance"],
+            "net_profit": result["final_balance"] - initial_balance,
+            "total_rtp": result["rtp"],
+            "stats": {
+                "hit_rate": result["hit_rate"],
+                "max_balance": result["max_balance"],
+                "min_balance": result["min_balance"],
+                "max_fail_streak": result["max_fail_streak"],
+                "bucket_counts": result["bucket_counts"],
+            },
+            "debug_info": {
+                "requested_spins": count,
+                "received_params": params,
+                "errors": errors,
+                "loss_bucket_size": loss_bucket_size,
+                "elapsed_seconds": elapsed
+            }
         }
-        
+    
+    start_time = time.time()
+    
+    if mode == "stream":
+        downsampler = MinMaxDownsampler(count, points) if "points" in params else None
         try:
-            # Pass session.config as runtime_config to ensure simulation uses the current session's settings
-            res = engine.spin(user_state, runtime_config=session.config)
-            fail_streak = res.get("fail_streak", 0)
-            bal_update = float(res.get("balance_update", 0))
-            current_balance += bal_update
-            max_balance = max(max_balance, current_balance)
-            total_wagered += bet
-            total_won += res["total_payout"]
-            
-            # User requested ALL data points for precision
-            history.append({
-                "spin": i + 1,
-                "balance": current_balance,
-                "rtp": (total_won / total_wagered) if total_wagered > 0 else 0
-            })
-        except Exception as e:
-            error_msg = f"Sim error at spin {i+1}: {str(e)}"
-            logger.error(error_msg)
-            errors.append(error_msg)
-            # If we have too many errors, abort
-            if len(errors) > 10:
-                break
-            
-    final_rtp = (total_won / total_wagered) if total_wagered > 0 else 0
+            # 在模拟线程池中逐段生成，事件循环只负责发送
+            events = simulation_executor.iterate(simulation_events, engine, bet, count, initial_balance, session.config, downsampler)
+        except ExecutorSaturated:
+            raise server_busy(simulation_executor)
+        
+        async def ndjson():
+            try:
+                async for kind, payload in events:
+                    if kind == "points":
+                        yield json.dumps({"type": "points", "points": payload}) + "\n"
+                    else:
+                        yield json.dumps({"type": "summary", **summarize(payload, time.time() - start_time)}) + "\n"
+                        logger.info(f"[{session.id}] SIMULATION END | Streamed {count} spins")
+            except Exception as e:
+                # 响应头已发出，只能在流中报告错误
+                logger.error(f"[{session.id}] Simulation failed: {e}")
+                yield json.dumps({"type": "error", "detail": f"Simulation failed: {str(e)}"}) + "\n"
+        
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
     
-    logger.info(f"[{session.id}] SIMULATION END | Generated {len(history)} points")
-
-    return {
-        "final_balance": current_balance,
-        "net_profit": current_balance - initial_balance,
-        "total_rtp": final_rtp,
-        "history": history,
-        "debug_info": {
-            "requested_spins": count,
-            "received_params": params,
-            "errors": errors,
-            "loss_bucket_size": loss_bucket_size
-        }
-    }
+    def run_simulation():
+        # Pass session.config as runtime_config to ensure simulation uses the current session's settings
+        if mode == "summary":
+            return engine.simulate_batch(bet, count, initial_balance, runtime_config=session.config, record_history=False), None
+        if mode == "downsample" and method == "minmax":
+            history = []
+            downsampler = MinMaxDownsampler(count, points)
+            for kind, payload in simulation_events(engine, bet, count, initial_balance, session.config, downsampler):
+                if kind == "points":
+                    history.extend(payload)
+                else:
+                    result = payload
+            return result, history
+        result = engine.simulate_batch(bet, count, initial_balance, runtime_config=session.config)
+        if mode == "downsample":
+            return result, lttb(result["balance_curve"], result["rtp_curve"], points)
+        # User requested ALL data points for precision
+        return result, [
+            {"spin": i + 1, "balance": balance, "rtp": rtp}
+            for i, (balance, rtp) in enumerate(zip(result["balance_curve"].tolist(), result["rtp_curve"].tolist()))
+        ]
+    
+    try:
+        result, history = await offload(simulation_executor, run_simulation)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"[{session.id}] Simulation failed: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Simulation failed: {str(e)}")
+    elapsed = time.time() - start_time
+    
+    logger.info(f"[{session.id}] SIMULATION END | Mode: {mode} | Returned {len(history) if history is not None else 0} points in {elapsed:.2f}s")
+
+    response = summarize(result, elapsed)
+    if history is not None:
+        response["history"] = history
+    return response
+
+@app.post("/simulate/monte_carlo")
+async def simulate_monte_carlo(params: dict = Body(...), session: SessionData = Depends(get_session)):
+    """
+    Long-run RTP verification.
+    Splits the spins across independent players (seeded streams derived from `seed`)
+    and runs them on a process pool. Same seed + players => identical results.
+    """
+    count = int(params.get("spins", params.get("n_spins", 1000000)))
+    count = min(max(count, 1), 100000000)
+    bet = params.get("bet", 10)
+    players = max(1, int(params.get("players", 16)))
+    seed = params.get("seed")
+    workers = params.get("workers")
+    confidence = float(params.get("confidence", 0.95))
+    if not 0 < confidence < 1:
+        raise HTTPException(status_code=400, detail="confidence must be between 0 and 1")
+    
+    engine = require_ready_engine(session)
+    logger.info(f"[{session.id}] MONTE CARLO START | Spins: {count} | Players: {players} | Seed: {seed}")
+    
+    try:
+        result = await offload(
+            simulation_executor, run_monte_carlo,
+            session.config.to_dict(), bet, count, players=players,
+            seed=int(seed) if seed is not None else None,
+            workers=int(workers) if workers else None,
+            confidence=confidence, engine=engine
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"[{session.id}] Monte Carlo failed: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Simulation failed: {str(e)}")
+    
+    logger.info(f"[{session.id}] MONTE CARLO END | RTP: {result['rtp']:.5f} | {result['elapsed_seconds']:.2f}s on {result['workers']} workers")
+    return result
 
 @app.get("/history")
-async def get_history(session: SessionData = Depends(get_session)):
-    """返回当前会话的历史记录"""
-    # Return reversed copy (newest first)
-    return list(reversed(session.history))
+async def get_history(limit: int = 100, before: int = None, session: SessionData = Depends(get_session)):
+    """
+    返回当前会话的历史记录（新的在前，最多 1000 条）。
+    before 传上一页最后一条记录的 Seq 可继续向前翻页。
+    """
+    def query():
+        spin_store.flush()
+        return spin_store.history(session.id, limit=min(max(limit, 1), 1000), before=before)
+    return await offload(spin_executor, query)
+
+@app.get("/history/stats")
+async def get_history_stats(scope: str = "session", points: int = 200, session: SessionData = Depends(get_session)):
+    """
+    Aggregates over the spin history store: spins, RTP, hit rate, bucket distribution
+    and latency percentiles (p50/p90/p99, from a log histogram).
+    scope=session (default) also returns an RTP curve of up to `points` points
+    and the server-side player state;
+    scope=global aggregates every session.
+    """
+    if scope not in ("session", "global"):
+        raise HTTPException(status_code=400, detail="scope must be 'session' or 'global'")
+    def query():
+        spin_store.flush()
+        return spin_store.stats(session.id if scope == "session" else None, points=points)
+    result = await offload(spin_executor, query)
+    if scope == "session":
+        result["player"] = session.player.snapshot()
+    return result
 
 @app.post("/topup")
 async def top_up(req: dict = Body(...)):
@@ -0,0 +1,438 @@
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import repeat
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union, Any
+
+import numpy as np
+
+WILD = "WILD"
+SCATTER = "SCATTER"
+FALLBACK_SYMBOL = "L1"  # 与 OutcomeEngine._get_matrix_from_stops 的兜底符号一致
+
+ROWS = 3
+COLS = 5
+CHUNK_SIZE = 1 << 18  # 每批评估的组合数，控制峰值内存（约 26 万 × 3 × 5）
+
+
+class ReelEvaluator:
+    """
+    向量化的卷轴评估器。
+    把卷轴编码为整数数组，一次性构造 (N,3,5) 的窗口张量，并批量计算所有中奖线和 Scatter 数量。
+    计算结果与 OutcomeEngine 的标量路径（_get_matrix_from_stops → _calculate_win → _classify_win）逐位一致。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config  # 并行构建时原样传给工作进程
+        self.reel_len = config["reels_length"]
+        reels = config["reel_sets"]
+        pay_table = config["pay_table"]
+        lines = config["lines"]
+
+        # 1. 符号编码（WILD / SCATTER / 兜底符号总是有编码）
+        names: List[str] = [WILD, SCATTER, FALLBACK_SYMBOL]
+        for reel in reels:
+            for s in reel:
+                if s not in names:
+                    names.append(s)
+        for s in pay_table:
+            if s not in names:
+                names.append(s)
+        self.symbol_names = names
+        self.symbol_codes = {s: i for i, s in enumerate(names)}
+        self.wild_code = self.symbol_codes[WILD]
+        self.scatter_code = self.symbol_codes[SCATTER]
+
+        # 2. 卷轴带 (5, reel_len)，越界位置按标量逻辑兜底为 L1
+        table = np.full((COLS, self.reel_len), self.symbol_codes[FALLBACK_SYMBOL], dtype=np.int16)
+        for c in range(min(COLS, len(reels))):
+            n = min(self.reel_len, len(reels[c]))
+            table[c, :n] = [self.symbol_codes[s] for s in reels[c][:n]]
+        self.reel_table = table
+
+        # 3. 中奖线（保持配置中的顺序，保证浮点累加顺序与标量一致）
+        self.line_ids: List[int] = []
+        self.line_coords: List[np.ndarray] = []
+        for line_id_str, coords in lines.items():
+            self.line_ids.append(int(line_id_str))
+            self.line_coords.append(np.array(coords, dtype=np.intp).reshape(-1, 2))
+        max_len = max([len(c) for c in self.line_coords] + [COLS])
+
+        # 4. 赔率表 pay[symbol, count]，count < 3 恒为 0；has_pay 标记赔率表中存在的条目
+        self.pay = np.zeros((len(names), max_len + 1), dtype=np.float64)
+        self.has_pay = np.zeros((len(names), max_len + 1), dtype=bool)
+        for symbol_id, pay_info in pay_table.items():
+            code = self.symbol_codes[symbol_id]
+            for count in range(3, max_len + 1):
+                if str(count) in pay_info:
+                    self.pay[code, count] = pay_info[str(count)]
+                    self.has_pay[code, count] = True
+        self.hit_base = max_len + 1
+
+    def all_stops(self, chunk_size: int = CHUNK_SIZE, first_stop: Optional[int] = None) -> Iterator[np.ndarray]:
+        """
+        按 itertools.product 的顺序分批生成所有停止位置组合 (n,5)。
+        指定 first_stop 时只生成第一列停在该位置的组合（即全序列中连续的一段），用于分片并行构建。
+        """
+        total = self.reel_len ** COLS
+        begin, end = 0, total
+        if first_stop is not None:
+            span = self.reel_len ** (COLS - 1)
+            begin, end = first_stop * span, (first_stop + 1) * span
+        weights = self.reel_len ** np.arange(COLS - 1, -1, -1, dtype=np.int64)
+        for start in range(begin, end, chunk_size):
+            idx = np.arange(start, min(start + chunk_size, end), dtype=np.int64)
+            yield (idx[:, None] // weights) % self.reel_len
+
+    def windows(self, stops: np.ndarray) -> np.ndarray:
+        """stops (N,5) -> 符号编码窗口 (N,3,5)，卷轴为环形"""
+        rows = (stops[:, None, :] + np.arange(ROWS)[None, :, None]) % self.reel_len
+        return self.reel_table[np.arange(COLS)[None, None, :], rows]
+
+    def evaluate(self, stops: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        批量计算中奖。
+        返回 (multipliers, is_near_miss, line_hits)：前两者形状为 (N,)；
+        line_hits 形状为 (N, 线数)，中奖线编码为 symbol_code * hit_base + count，未中奖为 0。
+        """
+        window = self.windows(stops)
+        n = window.shape[0]
+        total = np.zeros(n, dtype=np.float64)
+        line_hits = np.zeros((n, len(self.line_coords)), dtype=np.int32)
+        for j, coords in enumerate(self.line_coords):
+            if len(coords) == 0:
+                continue
+            line = window[:, coords[:, 0], coords[:, 1]]
+            is_wild = line == self.wild_code
+            # 首个非 WILD 符号即为匹配符号；全为 WILD 时匹配 WILD
+            first_plain = np.argmax(~is_wild, axis=1)
+            match_id = line[np.arange(n), first_plain]
+            match_id = np.where(is_wild.all(axis=1), self.wild_code, match_id)
+            ok = (line == match_id[:, None]) | is_wild
+            count = np.cumprod(ok, axis=1).sum(axis=1)
+            total += self.pay[match_id, count]
+            line_hits[:, j] = np.where(self.has_pay[match_id, count],
+                                       match_id.astype(np.int32) * self.hit_base + count, 0)
+
+        scatter_count = (window == self.scatter_code).sum(axis=(1, 2))
+        return total, scatter_count == 2, line_hits
+
+    def decode_hits(self, hits: np.ndarray, symbols: Dict[str, Any]) -> Tuple[Tuple[int, str, int, float], ...]:
+        """把一行 line_hits 还原为 ((line_id, symbol_name, count, multiplier), ...)，顺序与中奖线配置一致"""
+        result = []
+        for j, code in enumerate(hits.tolist()):
+            if code == 0:
+                continue
+            symbol_code, count = divmod(code, self.hit_base)
+            symbol_id = self.symbol_names[symbol_code]
+            symbol_name = symbols[symbol_id]["name"] if symbol_id in symbols else "Unknown"
+            result.append((self.line_ids[j], symbol_name, count, float(self.pay[symbol_code, count])))
+        return tuple(result)
+
+    @staticmethod
+    def classify(multipliers: np.ndarray, is_near_miss: np.ndarray,
+                 buckets_config: Dict[str, Dict[str, Any]]) -> np.ndarray:
+        """
+        批量分类，返回奖池在 buckets_config 中的序号（-1 表示奖池不存在）。
+        分类顺序与 OutcomeEngine._classify_win 一致。
+        """
+        names = list(buckets_config.keys())
+
+        def index_of(name: str) -> int:
+            return names.index(name) if name in names else -1
+
+        labels = np.full(multipliers.shape, index_of("Win_Tier_1"), dtype=np.int16)  # 兜底
+        is_loss = multipliers == 0
+        labels[is_loss & is_near_miss] = index_of("Loss_NearMiss")
+        labels[is_loss & ~is_near_miss] = index_of("Loss_Random")
+
+        unassigned = ~is_loss
+        for i, (tier, cfg) in enumerate(buckets_config.items()):
+            if not tier.startswith("Win_Tier"):
+                continue
+            hit = (cfg["min_win"] <= multipliers) & (multipliers < cfg["max_win"])
+            # 最后一层（max_win 可能为无穷大）
+            if cfg["max_win"] >= 1000:
+                hit |= multipliers >= cfg["min_win"]
+            hit &= unassigned
+            labels[hit] = i
+            unassigned &= ~hit
+        return labels
+
+
+def build_buckets(evaluator: ReelEvaluator, buckets_config: Dict[str, Dict[str, Any]],
+                  stop_batches: Iterator[np.ndarray],
+                  max_per_bucket: Optional[int] = 50000) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    按批评估停止位置并分桶。
+    返回 {bucket_name: (stops (n,5), multipliers (n,), line_hits (n,线数))}，
+    每个桶内保持输入顺序，最多保留 max_per_bucket 条。
+    """
+    names = list(buckets_config.keys())
+    parts: Dict[str, List[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = {k: [] for k in names}
+    sizes = {k: 0 for k in names}
+
+    for stops in stop_batches:
+        multipliers, near_miss, line_hits = evaluator.evaluate(stops)
+        labels = ReelEvaluator.classify(multipliers, near_miss, buckets_config)
+        for i, name in enumerate(names):
+            room = None if max_per_bucket is None else max_per_bucket - sizes[name]
+            if room is not None and room <= 0:
+                continue
+            sel = np.flatnonzero(labels == i)[:room]
+            if len(sel):
+                parts[name].append((stops[sel], multipliers[sel], line_hits[sel]))
+                sizes[name] += len(sel)
+
+    result = {}
+    for name in names:
+        if parts[name]:
+            result[name] = tuple(np.concatenate([p[k] for p in parts[name]]) for k in range(3))
+        else:
+            result[name] = (np.zeros((0, COLS), dtype=np.int64), np.zeros(0, dtype=np.float64),
+                            np.zeros((0, len(evaluator.line_coords)), dtype=np.int32))
+    return result
+
+
+def importance_weights(evaluator: ReelEvaluator) -> np.ndarray:
+    """
+    每列每个停止位置的抽样权重 (5, reel_len)，每行归一化。
+    窗口内高价值格子（WILD 及 5 连赔率不低于中位数的符号）越多，权重越大：(1 + 高价值格子数)^2。
+    """
+    five_pay = evaluator.pay[:, COLS]
+    paying = five_pay[five_pay > 0]
+    premium = (five_pay > 0) & (five_pay >= (np.median(paying) if len(paying) else np.inf))
+    premium[evaluator.wild_code] = True
+
+    stops = np.arange(evaluator.reel_len)
+    rows = (stops[:, None] + np.arange(ROWS)[None, :]) % evaluator.reel_len  # (reel_len, 3)
+    premium_cells = premium[evaluator.reel_table[:, rows]].sum(axis=2)  # (5, reel_len)
+    weights = (1.0 + premium_cells) ** 2
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def build_buckets_stratified(evaluator: ReelEvaluator, buckets_config: Dict[str, Dict[str, Any]],
+                             rng: np.random.Generator, target_per_bucket: int, max_draws: int,
+                             batch_size: int = 100000,
+                             max_per_bucket: int = 200000,
+                             workers: int = 1) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]], Dict[str, Any]]:
+    """
+    分层采样构建奖池（用于无法穷举的大状态空间）。
+    1. 均匀阶段：最多使用四分之一预算均匀抽样，直到所有奖池达到 target_per_bucket；
+    2. 重要性阶段：剩余预算按 importance_weights 偏向高价值符号区域抽样，只补充未达标的奖池。
+    每个奖池内的组合去重（与穷举模式一样每个组合只出现一次），最多保留 max_per_bucket 条。
+    workers > 1 时每批抽样切成 workers 段交给进程池评估；抽样与合并仍在本进程按批顺序进行，结果与串行一致。
+    返回 (built, coverage)，built 格式同 build_buckets；coverage 记录每个奖池的覆盖情况。
+    """
+    names = list(buckets_config.keys())
+    reel_len = evaluator.reel_len
+    key_weights = reel_len ** np.arange(COLS - 1, -1, -1, dtype=np.int64)
+    parts: Dict[str, List[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = {k: [] for k in names}
+    seen: Dict[str, set] = {k: set() for k in names}
+    uniform_hits = {k: 0 for k in names}
+    draws = {"uniform": 0, "importance": 0}
+
+    def under_target() -> List[str]:
+        return [k for k in names if len(seen[k]) < target_per_bucket]
+
+    def absorb(batch: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]], only: List[str]):
+        for name in names:
+            stops, multipliers, line_hits = batch[name]
+            if only is None:
+                uniform_hits[name] += len(stops)
+            elif name not in only:
+                continue
+            room = max_per_bucket - len(seen[name])
+            if room <= 0 or not len(stops):
+                continue
+            bucket_seen = seen[name]
+            fresh = []
+            for j, key in enumerate((stops @ key_weights).tolist()):
+                if key not in bucket_seen:
+                    bucket_seen.add(key)
+                    fresh.append(j)
+                    if len(fresh) >= room:
+                        break
+            if fresh:
+                parts[name].append((stops[fresh], multipliers[fresh], line_hits[fresh]))
+
+    with (_process_pool(workers) if workers > 1 else nullcontext()) as pool:
+        def evaluate(stops: np.ndarray) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+            if pool is None:
+                return build_buckets(evaluator, buckets_config, iter([stops]), max_per_bucket=None)
+            return build_buckets_parallel(evaluator.config, buckets_config, np.array_split(stops, workers),
+                                          workers, pool=pool)
+
+        # 1. 均匀阶段
+        uniform_budget = max(batch_size, max_draws // 4)
+        while draws["uniform"] < uniform_budget and under_target():
+            n = min(batch_size, uniform_budget - draws["uniform"])
+            absorb(evaluate(rng.integers(0, reel_len, size=(n, COLS))), None)
+            draws["uniform"] += n
+
+        # 2. 重要性阶段
+        if under_target():
+            weights = importance_weights(evaluator)
+            while draws["uniform"] + draws["importance"] < max_draws:
+                pending = under_target()
+                if not pending:
+                    break
+                n = min(batch_size, max_draws - draws["uniform"] - draws["importance"])
+                stops = np.stack([rng.choice(reel_len, size=n, p=weights[c]) for c in range(COLS)], axis=1)
+                absorb(evaluate(stops), pending)
+                draws["importance"] += n
+
+    built = {}
+    for name in names:
+        if parts[name]:
+            built[name] = tuple(np.concatenate([p[k] for p in parts[name]]) for k in range(3))
+        else:
+            built[name] = (np.zeros((0, COLS), dtype=np.int64), np.zeros(0, dtype=np.float64),
+                           np.zeros((0, len(evaluator.line_coords)), dtype=np.int32))
+
+    coverage = {
+        "mode": "stratified",
+        "draws": draws,
+        "buckets": {
+            name: {
+                "count": len(built[name][0]),
+                "target": target_per_bucket,
+                "covered": len(built[name][0]) >= target_per_bucket,
+                # 均匀阶段的命中率即该奖池在全部组合中的概率估计
+                "estimated_probability": uniform_hits[name] / draws["uniform"] if draws["uniform"] else 0.0,
+            }
+            for name in names
+        },
+    }
+    return built, coverage
+
+
+def _build_shard(config: Dict[str, Any], buckets_config: Dict[str, Dict[str, Any]],
+                 shard: Union[int, np.ndarray]) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    进程池中执行的分片任务。shard 为第一列停止位置（遍历模式）或一段采样好的停止位置数组（采样模式）。
+    返回的数组降为最小整数类型，减少进程间传输量。
+    """
+    evaluator = ReelEvaluator(config)
+    if isinstance(shard, (int, np.integer)):
+        batches = evaluator.all_stops(first_stop=int(shard))
+    else:
+        batches = iter([shard])
+    built = build_buckets(evaluator, buckets_config, batches, max_per_bucket=None)
+    return {k: (stops.astype(np.min_scalar_type(max(evaluator.reel_len - 1, 0))), mults,
+                hits.astype(np.min_scalar_type(int(hits.max()) if hits.size else 0)))
+            for k, (stops, mults, hits) in built.items()}
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn：避免在多线程的服务进程中 fork
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def build_buckets_parallel(config: Dict[str, Any], buckets_config: Dict[str, Dict[str, Any]],
+                           shards: Sequence[Union[int, np.ndarray]], workers: int,
+                           max_per_bucket: Optional[int] = None,
+                           pool: Optional[ProcessPoolExecutor] = None) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    在进程池中按分片构建奖池，再按分片顺序合并。
+    分片按原始遍历/采样顺序排列，因此合并结果（包括截断）与串行 build_buckets 完全一致。
+    传入 pool 时复用该进程池（分批多次调用时只启动一次进程），否则临时创建。
+    """
+    if pool is None:
+        with _process_pool(workers) as pool:
+            results = list(pool.map(_build_shard, repeat(config), repeat(buckets_config), shards))
+    else:
+        results = list(pool.map(_build_shard, repeat(config), repeat(buckets_config), shards))
+
+    merged = {}
+    for name in buckets_config:
+        parts = [r[name] for r in results]
+        stops = np.concatenate([p[0] for p in parts]).astype(np.int64)
+        mults = np.concatenate([p[1] for p in parts])
+        hits = np.concatenate([p[2] for p in parts]).astype(np.int32)
+        if max_per_bucket is not None:
+            stops, mults, hits = stops[:max_per_bucket], mults[:max_per_bucket], hits[:max_per_bucket]
+        merged[name] = (stops, mults, hits)
+    return merged
+
+
+def unique_rows(rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按行去重（比 np.unique(axis=0) 快一个数量级）：逐列把行编码为 int64 键，键空间将溢出时先压缩为秩。
+    返回 (每个唯一行首次出现的下标, 每行对应的唯一行序号)，唯一行按字典序排列。
+    """
+    n, cols = rows.shape
+    base = int(rows.max()) + 1 if rows.size else 1
+    key = np.zeros(n, dtype=np.int64)
+    span = 1
+    for j in range(cols):
+        if span * base > 1 << 62:
+            _, key = np.unique(key, return_inverse=True)
+            key = key.reshape(-1).astype(np.int64)
+            span = int(key.max()) + 1
+        key = key * base + rows[:, j]
+        span *= base
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    return first, inverse.reshape(-1)
+
+
+def intern_win_patterns(evaluator: ReelEvaluator, built: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]],
+                        symbols: Dict[str, Any]) -> Tuple[List[Tuple[Tuple[int, str, int, float], ...]], Dict[str, np.ndarray]]:
+    """
+    对所有桶的中奖线组合去重。
+    返回 (win_patterns, {bucket_name: win_ids})：win_patterns[0] 恒为空组合（未中奖），
+    win_ids[i] 为该桶第 i 个结果在 win_patterns 中的序号。
+    """
+    names = list(built.keys())
+    all_hits = np.concatenate([built[k][2] for k in names]) if names else np.zeros((0, 0), dtype=np.int32)
+    empty = np.zeros((1, all_hits.shape[1]), dtype=np.int32)
+    rows = np.concatenate([empty, all_hits])
+    first, inverse = unique_rows(rows)
+    # 全零行的键最小，必然在第 0 位
+    patterns = [evaluator.decode_hits(rows[i], symbols) for i in first]
+
+    win_ids = {}
+    offset = 1
+    for k in names:
+        n = len(built[k][2])
+        win_ids[k] = inverse[offset:offset + n].astype(np.int32)
+        offset += n
+    return patterns, win_ids
+
+
+def sort_by_multiplier(stops: np.ndarray, win_ids: np.ndarray,
+                       win_multipliers: Sequence[float]) -> Tuple[np.ndarray, np.ndarray, List[float], List[int]]:
+    """
+    把一个桶的结果按总倍数稳定排序（倍数相同的结果保持原顺序）。
+    返回 (stops, win_ids, levels, level_ends)：levels 为不同的倍数取值（升序），
+    level_ends[k] 为倍数 <= levels[k] 的结果数。排序后倍数不超过某个上限的结果总是一个前缀，
+    BucketStore.draw_within 直接在前缀上抽取，不需要额外的索引。
+    """
+    multipliers = np.asarray(win_multipliers, dtype=np.float64)[win_ids]
+    order = np.argsort(multipliers, kind="stable")
+    levels, counts = np.unique(multipliers[order], return_counts=True)
+    return stops[order], win_ids[order], levels.tolist(), np.cumsum(counts).tolist()
+
+
+def pattern_multiplier(pattern: Tuple[Tuple[int, str, int, float], ...]) -> float:
+    """中奖线组合的总倍数，按中奖线顺序累加（与 _calculate_win 的累加顺序一致）"""
+    total = 0.0
+    for _, _, _, multiplier in pattern:
+        total += multiplier
+    return total
+
+
+def sample_bucket_stats(multipliers: np.ndarray, sample_size: int = 1000) -> float:
+    """
+    随机采样估算桶的平均倍数。
+    与标量路径的 random.sample + 顺序累加完全一致（相同随机状态下结果相同）。
+    """
+    n = len(multipliers)
+    if n == 0:
+        return 0.0
+    k = min(n, sample_size)
+    total_mult = 0.0
+    for i in random.sample(range(n), k):
+        total_mult += float(multipliers[i])
+    return total_mult / k
@@ -0,0 +1,136 @@
+"""
+奖池缓存文件格式（小端）：
+
+    +--------------------------------------------------------------+
+    | 前导区 PRELUDE: magic(8s) version(I) header_len(I)            |
+    |                 data_len(Q) crc32(I)                         |
+    | 头部 HEADER: UTF-8 JSON，包含各数组的偏移/类型/长度、           |
+    |             各奖池的倍数分层 levels / level_ends、             |
+    |             win_patterns、bucket_stats 与 bucket_coverage     |
+    | 填充到 ALIGN 字节边界                                         |
+    | 数据区 DATA: 各奖池的 packed / win_ids 原始数组，逐个对齐       |
+    +--------------------------------------------------------------+
+
+crc32 覆盖头部与数据区。加载时整个文件以只读方式 mmap，数组直接指向映射内存，
+多个 worker 进程共享同一份物理页。
+奖池内的结果按倍数排序保存（版本 2 起），按余额余量抽取只需要头部中的 level_ends，
+不需要各进程另建索引。写入先写临时文件再 os.replace，读者永远看不到写了一半的文件。
+"""
+
+import json
+import mmap
+import os
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bucket_store import BucketStore
+
+MAGIC = b"SLOTBKT\0"
+FORMAT_VERSION = 2
+PRELUDE = struct.Struct("<8sIIQI")
+ALIGN = 64
+
+
+class CacheFormatError(ValueError):
+    """缓存文件损坏、版本不符或与当前配置不匹配"""
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def save_buckets(path: str, config_hash: str, reel_len: int, buckets: Dict[str, BucketStore],
+                 win_patterns: List[Tuple[Tuple[int, str, int, float], ...]],
+                 bucket_stats: Dict[str, float], bucket_coverage: Optional[Dict[str, Any]] = None):
+    """原子地写入缓存文件：写临时文件 → fsync → os.replace"""
+    arrays = []
+    entries = []
+    offset = 0
+    for name, store in buckets.items():
+        entry = {"name": name, "count": len(store), "levels": store.levels, "level_ends": store.level_ends}
+        for field in ("packed", "win_ids"):
+            arr = np.ascontiguousarray(getattr(store, field))
+            offset = _align(offset)
+            entry[field] = {"offset": offset, "dtype": arr.dtype.str}
+            arrays.append((offset, arr))
+            offset += arr.nbytes
+        entries.append(entry)
+    data_len = _align(offset)
+
+    header = json.dumps({
+        "config_hash": config_hash,
+        "reels_length": reel_len,
+        "buckets": entries,
+        "win_patterns": win_patterns,
+        "bucket_stats": bucket_stats,
+        "bucket_coverage": bucket_coverage or {},
+    }).encode("utf-8")
+    data_start = _align(PRELUDE.size + len(header))
+
+    data = bytearray(data_len)
+    for start, arr in arrays:
+        data[start:start + arr.nbytes] = arr.tobytes()
+    crc = zlib.crc32(data, zlib.crc32(header))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(PRELUDE.pack(MAGIC, FORMAT_VERSION, len(header), data_len, crc))
+            f.write(header)
+            f.write(b"\0" * (data_start - PRELUDE.size - len(header)))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_buckets(path: str, config_hash: Optional[str] = None) -> Tuple[Dict[str, BucketStore], List[Tuple[Tuple[int, str, int, float], ...]], Dict[str, float], Dict[str, Any]]:
+    """
+    只读 mmap 加载缓存文件，返回 (buckets, win_patterns, bucket_stats, bucket_coverage)。
+    文件不合法时抛出 CacheFormatError。
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mm) < PRELUDE.size:
+        raise CacheFormatError("file too short")
+    magic, version, header_len, data_len, crc = PRELUDE.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise CacheFormatError("bad magic")
+    if version != FORMAT_VERSION:
+        raise CacheFormatError(f"unsupported cache version {version} (expected {FORMAT_VERSION})")
+
+    header_bytes = mm[PRELUDE.size:PRELUDE.size + header_len]
+    data_start = _align(PRELUDE.size + header_len)
+    if len(mm) != data_start + data_len:
+        raise CacheFormatError("truncated file")
+    data = memoryview(mm)[data_start:]
+    try:
+        if zlib.crc32(data, zlib.crc32(header_bytes)) != crc:
+            raise CacheFormatError("checksum mismatch")
+    finally:
+        data.release()
+
+    header = json.loads(header_bytes.decode("utf-8"))
+    if config_hash is not None and header["config_hash"] != config_hash:
+        raise CacheFormatError("config hash mismatch")
+
+    reel_len = header["reels_length"]
+    buckets = {}
+    for entry in header["buckets"]:
+        fields = {}
+        for field in ("packed", "win_ids"):
+            spec = entry[field]
+            fields[field] = np.frombuffer(mm, dtype=np.dtype(spec["dtype"]), count=entry["count"],
+                                          offset=data_start + spec["offset"])
+        buckets[entry["name"]] = BucketStore(reel_len, fields["packed"], fields["win_ids"],
+                                             entry["levels"], entry["level_ends"])
+
+    win_patterns = [tuple(tuple(line) for line in pattern) for pattern in header["win_patterns"]]
+    return buckets, win_patterns, header["bucket_stats"], header.get("bucket_coverage", {})
@@ -0,0 +1,140 @@
+"""
+预编译的奖池选择器：配置变化时编译一次，之后每次旋转只做查表 + 二分。
+
+    进度分层   —— 按 min_spins 预排序，bisect 找到当前层
+    过滤组合   —— (PRD 结果, 进度层, 是否高额投注) 的每种组合预先算好可选奖池与累计权重表
+    安全上限   —— 奖池是否可选只取决于它的门槛倍数（奖池中最小的实际倍数，没有奖池数据时为配置的 max_win），
+                  按门槛升序时可选奖池总是一个前缀，因此每张表再按门槛的不同取值预先算好子表；
+                  抽取时由余额余量 bisect 出子表。奖池内只在不超过上限的结果中抽取（BucketStore.draw_within）
+    抽取       —— uniform(0, 总权重) 后在累计权重表上 bisect
+
+安全上限一次确定可选集合，不再逐个抽中、拒绝、重抽：结果分布等于在可选奖池上按权重归一化，
+不会因为重抽次数用完而落到 Loss_Random。
+奖池只有十个左右，表用 tuple / list 保存，比 numpy 数组在单次旋转上的调用开销更小。
+"""
+
+import random
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from bucket_store import count_within_cap
+
+# 投注额低于 high_roller_threshold 时禁用的奖池
+HIGH_ROLLER_BUCKETS = ("Win_Tier_4", "Win_Tier_5")
+
+
+def normalize_buckets(raw_buckets: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """规范化奖池配置（兼容 min/max 与 min_win/max_win），返回副本，不修改原配置"""
+    buckets_config = {}
+    for k, v in raw_buckets.items():
+        cfg = v.copy()
+        if "min" in cfg and "min_win" not in cfg: cfg["min_win"] = cfg["min"]
+        if "max" in cfg and "max_win" not in cfg: cfg["max_win"] = cfg["max"]
+        if "min_win" not in cfg: cfg["min_win"] = 0
+        if "max_win" not in cfg: cfg["max_win"] = 0
+        buckets_config[k] = cfg
+    return buckets_config
+
+
+class SelectionTable(NamedTuple):
+    """一种过滤组合下的可选奖池（权重 > 0，保持配置顺序）及其累计权重"""
+    names: Tuple[str, ...]
+    weights: Tuple[float, ...]
+    cumulative: List[float]
+    total: float
+    caps: Tuple[float, ...] = ()  # 可选奖池门槛倍数的不同取值（升序）
+    capped: Tuple["SelectionTable", ...] = ()  # capped[k]：只保留门槛 <= caps[k - 1] 的奖池；capped[0] 为空表
+
+    @classmethod
+    def build(cls, names: List[str], weights: List[float],
+              cap_multipliers: Optional[Dict[str, float]] = None) -> "SelectionTable":
+        """cap_multipliers（奖池 -> 门槛倍数）给出时同时构建按安全上限截断的子表"""
+        pairs = [(n, w) for n, w in zip(names, weights) if w > 0]
+        kept_names = [n for n, _ in pairs]
+        kept_weights = [w for _, w in pairs]
+        cumulative = list(accumulate(kept_weights))
+        table = cls(tuple(kept_names), tuple(kept_weights), cumulative, cumulative[-1] if cumulative else 0)
+        if cap_multipliers is None:
+            return table
+
+        caps = tuple(sorted({cap_multipliers[n] for n in kept_names}))
+        capped = [cls.build([], [])]
+        for cap in caps:
+            capped.append(cls.build(kept_names, [w if cap_multipliers[n] <= cap else 0 for n, w in pairs]))
+        return table._replace(caps=caps, capped=tuple(capped))
+
+
+class BucketSelector:
+    """
+    由 (settings, buckets) 编译出的奖池选择器，只读，可在多个线程间共享。
+    按会话配置版本缓存（见 OutcomeEngine._selector），配置不变时不会重新编译。
+    """
+
+    def __init__(self, settings: Dict[str, Any], raw_buckets: Dict[str, Dict[str, Any]],
+                 min_multipliers: Optional[Dict[str, float]] = None):
+        """min_multipliers：各奖池中最小的实际倍数（由引擎的奖池数据给出），缺少时用配置的 max_win"""
+        self.settings = settings
+        self.buckets_config = normalize_buckets(raw_buckets)
+        self.names = tuple(self.buckets_config)
+        min_multipliers = min_multipliers or {}
+        self.cap_multipliers = {k: min_multipliers.get(k, cfg["max_win"]) for k, cfg in self.buckets_config.items()}
+        weights = [cfg["weight"] for cfg in self.buckets_config.values()]
+
+        # PRD：未中奖只允许非 Win_Tier 奖池，中奖只允许非 Loss_ 奖池
+        prd_masks = {
+            True: [not k.startswith("Loss_") for k in self.names],
+            False: [not k.startswith("Win_Tier") for k in self.names],
+        }
+
+        # 进度分层：tier_starts[i] 为第 i 层的 min_spins；层下标 0 表示尚未进入任何一层
+        tiers = sorted(settings.get("progress_tiers", []), key=lambda x: x["min_spins"])
+        self.tier_starts = [tier["min_spins"] for tier in tiers]
+        tier_masks = [[True] * len(self.names)]
+        for tier in tiers:
+            allowed = tier.get("allowed_buckets", ["ALL"])
+            tier_masks.append([True] * len(self.names) if "ALL" in allowed else [k in allowed for k in self.names])
+
+        # 高额投注：低于阈值时移除高层奖池
+        self.high_roller_threshold = settings.get("high_roller_threshold", 50.0)
+        high_roller_masks = {
+            True: [True] * len(self.names),
+            False: [k not in HIGH_ROLLER_BUCKETS for k in self.names],
+        }
+
+        # 兜底：PRD 判定为中奖但所有 Win 奖池被过滤时，强制转 Loss（不再应用分层与高额投注过滤）
+        loss_names = [k for k in self.names if k.startswith("Loss_")]
+        fallback = SelectionTable.build(loss_names, [self.buckets_config[k]["weight"] for k in loss_names], self.cap_multipliers)
+
+        self._tables: Dict[Tuple[bool, int, bool], SelectionTable] = {}
+        for is_prd_win, prd_mask in prd_masks.items():
+            for tier_index, tier_mask in enumerate(tier_masks):
+                for high_roller, hr_mask in high_roller_masks.items():
+                    table = SelectionTable.build(
+                        list(self.names),
+                        [w if (p and t and h) else 0 for w, p, t, h in zip(weights, prd_mask, tier_mask, hr_mask)],
+                        self.cap_multipliers
+                    )
+                    if table.total == 0 and is_prd_win:
+                        table = fallback
+                    self._tables[(is_prd_win, tier_index, high_roller)] = table
+
+    def table(self, is_prd_win: bool, total_spins: int, bet: float) -> SelectionTable:
+        """按 PRD 结果、进度分层与高额投注过滤后的可选奖池；total 为 0 表示直接落到 Loss_Random"""
+        tier_index = bisect_right(self.tier_starts, total_spins)
+        return self._tables[(is_prd_win, tier_index, bet >= self.high_roller_threshold)]
+
+    def max_allowed_balance(self, initial_balance: float) -> float:
+        """RTP 安全上限（天花板）：严格按照初始余额限制最大余额"""
+        return initial_balance * self.settings.get("max_win_ratio", 1.2)
+
+    def draw(self, table: SelectionTable, bet: float, balance: float, max_allowed_balance: float, rng=None) -> str:
+        """
+        RTP 安全上限（无论模拟还是真实都强制执行）：按余额余量一次确定可选奖池，
+        即 balance + 门槛倍数 × bet 不超过 max_allowed_balance 的奖池，再按权重抽取；没有可选奖池时判输。
+        """
+        eligible = table.capped[count_within_cap(table.caps, bet, balance, max_allowed_balance)]
+        if eligible.total <= 0:
+            return "Loss_Random"
+        i = bisect_left(eligible.cumulative, (rng or random).uniform(0, eligible.total))
+        return eligible.names[i] if i < len(eligible.names) else "Loss_Random"
@@ -0,0 +1,107 @@
+import random
+from bisect import bisect_right
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+COLS = 5
+
+
+def count_within_cap(values: Sequence[float], bet: float, balance: float, max_allowed_balance: float) -> int:
+    """升序的倍数 values 中满足 balance + value × bet <= max_allowed_balance 的个数（即可用的前缀长度）"""
+    if bet <= 0:
+        return len(values) if balance <= max_allowed_balance else 0
+    k = bisect_right(values, (max_allowed_balance - balance) / bet)
+    # 除法有舍入误差，在边界上按原不等式校正
+    while k > 0 and balance + values[k - 1] * bet > max_allowed_balance:
+        k -= 1
+    while k < len(values) and balance + values[k] * bet <= max_allowed_balance:
+        k += 1
+    return k
+
+
+class BucketStore:
+    """
+    单个奖池的紧凑存储。
+    每个结果占用一个打包整数（5 个停止位置按 reel_len 进制编码，与 itertools.product 顺序一致）
+    加一个中奖线组合序号（指向 OutcomeEngine.win_patterns），代替 List[List[int]]。
+    对外表现为只读的停止位置序列：len()、bool()、[i] 以及 draw()/sample()。
+
+    构建时结果已按倍数排序（bucket_builder.sort_by_multiplier），levels / level_ends 随缓存文件保存，
+    draw_within() 在余额余量允许的前缀中均匀抽取，各进程不需要再建立私有的排序索引。
+    """
+
+    __slots__ = ("reel_len", "packed", "win_ids", "_weights", "levels", "level_ends")
+
+    def __init__(self, reel_len: int, packed: np.ndarray, win_ids: np.ndarray,
+                 levels: Optional[List[float]] = None, level_ends: Optional[List[int]] = None):
+        self.reel_len = reel_len
+        self.packed = packed
+        self.win_ids = win_ids
+        self._weights = [reel_len ** (COLS - 1 - c) for c in range(COLS)]
+        self.levels = levels  # 不同的倍数取值（升序）
+        self.level_ends = level_ends  # level_ends[k]：倍数 <= levels[k] 的结果数
+
+    @staticmethod
+    def pack_dtype(reel_len: int):
+        return np.uint32 if reel_len ** COLS <= np.iinfo(np.uint32).max + 1 else np.uint64
+
+    @classmethod
+    def from_stops(cls, reel_len: int, stops: np.ndarray, win_ids: np.ndarray,
+                   levels: Optional[List[float]] = None, level_ends: Optional[List[int]] = None) -> "BucketStore":
+        """stops (n,5) -> 打包存储；win_ids 按中奖线组合数选择最小的整数类型；levels / level_ends 要求 stops 已按倍数排序"""
+        weights = reel_len ** np.arange(COLS - 1, -1, -1, dtype=np.int64)
+        packed = (np.asarray(stops, dtype=np.int64) @ weights).astype(cls.pack_dtype(reel_len))
+        max_id = int(win_ids.max()) if len(win_ids) else 0
+        id_dtype = np.uint16 if max_id <= np.iinfo(np.uint16).max else np.uint32
+        return cls(reel_len, packed, np.asarray(win_ids).astype(id_dtype), levels, level_ends)
+
+    def __len__(self) -> int:
+        return len(self.packed)
+
+    def __getitem__(self, idx: int) -> List[int]:
+        return self.stops(idx)
+
+    def stops(self, idx: int) -> List[int]:
+        """解包第 idx 个结果的停止位置"""
+        code = int(self.packed[idx])
+        return [(code // w) % self.reel_len for w in self._weights]
+
+    def win_id(self, idx: int) -> int:
+        return int(self.win_ids[idx])
+
+    def draw(self, rng: Optional[random.Random] = None) -> int:
+        """均匀抽取一个结果下标（与 random.choice 的随机数消耗相同）"""
+        return (rng or random).randrange(len(self.packed))
+
+    @property
+    def min_multiplier(self) -> Optional[float]:
+        return self.levels[0] if self.levels else None
+
+    def draw_within(self, bet: float, balance: float, max_allowed_balance: float,
+                    rng: Optional[random.Random] = None) -> Optional[int]:
+        """
+        在 balance + 倍数 × bet 不超过 max_allowed_balance 的结果中均匀抽取一个下标（bisect 前缀，无拒绝重抽）。
+        没有结果满足时返回 None（由调用方兜底到 Loss_Random）；全部满足或没有倍数分层信息时与 draw() 相同。
+        """
+        if not self.levels:
+            return self.draw(rng)
+        k = count_within_cap(self.levels, bet, balance, max_allowed_balance)
+        if k == 0:
+            return None
+        if k == len(self.levels):
+            return self.draw(rng)
+        return (rng or random).randrange(self.level_ends[k - 1])
+
+    def sample(self, k: int, rng: Optional[random.Random] = None) -> List[int]:
+        """不放回抽取 k 个结果下标（与 random.sample 的随机数消耗相同）"""
+        return (rng or random).sample(range(len(self.packed)), k)
+
+    def unpack_all(self) -> np.ndarray:
+        """全部停止位置 (n,5)"""
+        weights = self.reel_len ** np.arange(COLS - 1, -1, -1, dtype=np.int64)
+        return (self.packed.astype(np.int64)[:, None] // weights) % self.reel_len
+
+    @property
+    def nbytes(self) -> int:
+        return self.packed.nbytes + self.win_ids.nbytes
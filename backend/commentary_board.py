@@ -0,0 +1,78 @@
+"""
+AI 评论票据：/spin 立即返回结果和票据，评论在后台生成后写入票据，客户端通过 GET /commentary/{ticket} 轮询或长轮询获取。
+评论可能更新多次（截止时间到达时先写入兜底文案，迟到的评论随后覆盖），每次更新 revision 加 1。
+所有方法都在事件循环线程中调用，不需要加锁。
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class CommentaryBoard:
+    def __init__(self, ttl: float = 120.0, max_tickets: int = 10000):
+        self.ttl = ttl
+        self.max_tickets = max_tickets
+        self._tickets: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._events: Dict[str, asyncio.Event] = {}
+
+    def _evict(self):
+        """按创建顺序淘汰过期票据，以及超出数量上限的最旧票据"""
+        now = time.time()
+        while self._tickets:
+            ticket, entry = next(iter(self._tickets.items()))
+            if now - entry["created"] < self.ttl and len(self._tickets) <= self.max_tickets:
+                break
+            self._tickets.popitem(last=False)
+            event = self._events.pop(ticket, None)
+            if event:
+                event.set()
+
+    def create(self, session_id: str) -> str:
+        ticket = str(uuid.uuid4())
+        self._tickets[ticket] = {
+            "ticket": ticket,
+            "session_id": session_id,
+            "status": "pending",
+            "reasoning": None,
+            "revision": 0,
+            "created": time.time(),
+        }
+        self._evict()
+        return ticket
+
+    def resolve(self, ticket: str, text: str):
+        """写入（或更新）评论，唤醒等待该票据的长轮询"""
+        entry = self._tickets.get(ticket)
+        if entry is None:
+            return
+        entry["status"] = "ready"
+        entry["reasoning"] = text
+        entry["revision"] += 1
+        event = self._events.pop(ticket, None)
+        if event:
+            event.set()
+
+    def get(self, ticket: str) -> Optional[Dict[str, Any]]:
+        entry = self._tickets.get(ticket)
+        if entry is not None and time.time() - entry["created"] >= self.ttl:
+            self._evict()
+            return None
+        return entry
+
+    async def wait(self, ticket: str, since: int = 0, timeout: float = 0.0) -> Optional[Dict[str, Any]]:
+        """等待票据的 revision 超过 since（最多 timeout 秒），返回票据当前状态；票据不存在时返回 None"""
+        entry = self.get(ticket)
+        if entry is None or entry["revision"] > since or timeout <= 0:
+            return entry
+        event = self._events.setdefault(ticket, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.get(ticket)
+
+    def __len__(self) -> int:
+        return len(self._tickets)
@@ -0,0 +1,196 @@
+"""
+AI 评论缓存：评论 prompt 只随下注、余额、赢额、奖池类型变化，大部分旋转（Loss_Random、小奖）的 prompt 几乎相同。
+按粗化后的签名 (LLM 配置, 奖池类型, 下注档, 余额档, 赢额档, API Key 哈希) 缓存每个签名 N 条不同的评论，命中时随机取一条，
+不足 N 条时在后台补充，从而把 LLM 调用量降低几个数量级，同时保持文案多样。
+不同 API Key 的评论互不共享；条目中不保存 LLMConfig（含 API Key），补充总是使用当前请求方的配置。
+补充按批进行：一次 JSON 模式请求生成一批评论（LLMClient.request_commentary_batch），批量请求失败时才退回单句请求；
+同一签名同时只有一个补充请求，未命中（包括第一次未命中）的请求都等待这一批结果，而不是各自访问 LLM。
+一次补充没有带来任何新评论（请求失败或全部重复）时，该签名退避一段时间（逐次加倍）再补充，避免反复计费。
+评论条目超过 TTL 失效；签名数超过上限时按 LRU 淘汰。所有方法都在事件循环线程中调用。
+"""
+
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from llm_client import FALLBACK_COMMENTARY, LATE_COMMENTARY_TIMEOUT, LLMClient
+from models import LLMConfig, SpinResponse, UserState
+
+logger = logging.getLogger("CommentaryCache")
+
+# 补充没有带来新评论后的退避时间（秒），连续无效时加倍，最长 MAX_REFILL_BACKOFF
+REFILL_BACKOFF = 30.0
+MAX_REFILL_BACKOFF = 600.0
+
+# 分档边界（bisect_left：落在边界上的值归入较低一档）
+BET_BANDS = (10.0, 50.0)                # 下注额；> 50 为高额投注（与 prompt 一致）
+BALANCE_BANDS = (5.0, 20.0, 100.0)      # 余额 / 下注（还能转几次）
+WIN_BANDS = (0.0, 1.0, 5.0, 20.0)       # 赢额 / 下注；0 为未中奖
+
+
+def _band(value: float, edges: Tuple[float, ...]) -> int:
+    return bisect_left(edges, value)
+
+
+class CommentaryCache:
+    def __init__(self, variants: int = 20, batch_size: int = 20, ttl: float = 600.0, max_keys: int = 512):
+        self.variants = variants
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.max_keys = max_keys
+        # 签名 -> {"lines": [(文案, 写入时间)], "prompt": str, "backoff": 秒, "retry_at": 时间}，按最近使用排序
+        self._pools: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._refills: Dict[Tuple, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.provider_calls = 0
+        self.backoffs = 0
+
+    @staticmethod
+    def signature(config: LLMConfig, spin_result: SpinResponse, user_state: UserState) -> Tuple:
+        bet = user_state.current_bet
+        return (
+            config.provider, config.model, config.base_url or "",
+            spin_result.bucket_type,
+            _band(bet, BET_BANDS),
+            _band(user_state.wallet_balance / bet if bet > 0 else 0.0, BALANCE_BANDS),
+            _band(spin_result.total_payout / bet if bet > 0 else 0.0, WIN_BANDS),
+            hashlib.sha256((config.api_key or "").encode()).hexdigest()[:16],
+        )
+
+    def _lookup(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """取出签名对应的条目（丢弃过期评论并标记为最近使用）"""
+        entry = self._pools.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        entry["lines"] = [(text, created) for text, created in entry["lines"] if now - created < self.ttl]
+        self._pools.move_to_end(key)
+        return entry
+
+    def _entry(self, key: Tuple, prompt: str) -> Dict[str, Any]:
+        entry = self._lookup(key)
+        if entry is None:
+            entry = {"lines": [], "prompt": prompt, "backoff": 0.0, "retry_at": 0.0}
+            self._pools[key] = entry
+            while len(self._pools) > self.max_keys:
+                old_key, _ = self._pools.popitem(last=False)
+                task = self._refills.pop(old_key, None)
+                if task:
+                    task.cancel()
+        return entry
+
+    def _add(self, key: Tuple, text: str) -> bool:
+        """加入一条新评论；重复或条目已被淘汰时返回 False"""
+        entry = self._pools.get(key)
+        if entry is None or not text or any(text == t for t, _ in entry["lines"]):
+            return False
+        entry["lines"].append((text, time.time()))
+        del entry["lines"][:-self.variants]
+        return True
+
+    def _schedule_refill(self, key: Tuple, config: LLMConfig) -> Optional[asyncio.Task]:
+        """
+        签名评论不足 N 条且不在退避期内时用 config（当前请求方的配置）启动一次批量补充；
+        已有补充在进行时返回该任务（合并并发请求）
+        """
+        task = self._refills.get(key)
+        if task is not None:
+            return task
+        entry = self._pools.get(key)
+        if entry is None or len(entry["lines"]) >= self.variants or time.time() < entry["retry_at"]:
+            return None
+        task = asyncio.ensure_future(self._refill(key, config))
+        self._refills[key] = task
+        task.add_done_callback(lambda _: self._refills.pop(key, None))
+        return task
+
+    async def _refill(self, key: Tuple, config: LLMConfig):
+        """
+        一次批量请求补充评论；批量请求失败（如模型不支持 JSON 输出）时退回单句请求。
+        没有加入任何新评论时该签名进入退避期。
+        """
+        entry = self._pools.get(key)
+        if entry is None:
+            return
+        prompt = entry["prompt"]
+        lines = []
+        self.provider_calls += 1
+        try:
+            lines = await asyncio.wait_for(
+                LLMClient.request_commentary_batch(config, prompt, self.batch_size), timeout=LATE_COMMENTARY_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Batch commentary refill failed for {key[3]}: {e}")
+            self.provider_calls += 1
+            try:
+                lines = [await asyncio.wait_for(LLMClient.request_commentary(config, prompt), timeout=LATE_COMMENTARY_TIMEOUT)]
+            except Exception as e:
+                logger.warning(f"Commentary refill failed for {key[3]}: {e}")
+        added = sum(self._add(key, text) for text in lines)
+        if added:
+            entry["backoff"] = 0.0
+        else:
+            entry["backoff"] = min(max(entry["backoff"] * 2, REFILL_BACKOFF), MAX_REFILL_BACKOFF)
+            entry["retry_at"] = time.time() + entry["backoff"]
+            self.backoffs += 1
+
+    def _pick(self, key: Tuple) -> Optional[str]:
+        entry = self._pools.get(key)
+        if entry is None or not entry["lines"]:
+            return None
+        return random.choice(entry["lines"])[0]
+
+    async def commentary(self, config: LLMConfig, spin_result: SpinResponse, user_state: UserState,
+                         on_late: Optional[Callable[[str], Any]] = None) -> str:
+        """
+        返回一句评论：
+        - 命中缓存时直接返回（不访问 LLM），不足 N 条时在后台批量补充；
+        - 未命中时启动（或加入正在进行的）批量补充，等待这一批结果最多 commentary_deadline 秒，
+          每次未命中最多一次批量请求（失败时再加一次单句请求）；
+        - 超过截止时间或该签名在退避期内时返回兜底文案；补充迟到完成时以其中一条回调 on_late。
+        """
+        if config.debug_mode:
+            return await LLMClient.generate_commentary_async(config, spin_result, user_state, on_late=on_late)
+
+        key = self.signature(config, spin_result, user_state)
+        entry = self._lookup(key)
+        if entry and entry["lines"]:
+            self.hits += 1
+            self._schedule_refill(key, config)
+            return self._pick(key)
+
+        self.misses += 1
+        self._entry(key, LLMClient.build_commentary_prompt(spin_result, user_state))
+        refill = self._schedule_refill(key, config)
+        if refill is None:
+            return FALLBACK_COMMENTARY
+
+        try:
+            # shield：超时只停止等待，补充继续进行，供之后的请求命中
+            await asyncio.wait_for(asyncio.shield(refill), timeout=config.commentary_deadline)
+        except asyncio.TimeoutError:
+            if on_late:
+                def deliver(_):
+                    text = self._pick(key)
+                    if text:
+                        on_late(text)
+                refill.add_done_callback(deliver)
+        except Exception:
+            pass
+        return self._pick(key) or FALLBACK_COMMENTARY
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._pools),
+            "lines": sum(len(entry["lines"]) for entry in self._pools.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "provider_calls": self.provider_calls,
+            "backoffs": self.backoffs,
+            "refilling": len(self._refills),
+        }
@@ -0,0 +1,102 @@
+"""
+模拟曲线降采样。输出点格式与 /simulate 的 history 一致：{"spin", "balance", "rtp"}（spin 从 1 开始）。
+
+    lttb     —— Largest-Triangle-Three-Buckets，按余额曲线选点，视觉上最接近原曲线；需要完整曲线
+    minmax   —— 每个区间保留余额的最小/最大点，可逐段喂入（MinMaxDownsampler），内存与总旋转数无关
+"""
+
+import math
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+def _points(indices: np.ndarray, balances: np.ndarray, rtps: np.ndarray, offset: int = 0) -> List[Dict[str, Any]]:
+    return [
+        {"spin": offset + i + 1, "balance": b, "rtp": r}
+        for i, b, r in zip(indices.tolist(), balances[indices].tolist(), rtps[indices].tolist())
+    ]
+
+
+def lttb_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """LTTB 选点（x 为等间距下标），返回按顺序排列的下标；始终包含首尾两点"""
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    n_out = max(n_out, 3)
+
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        # 下一个区间的平均点
+        next_start = int(math.floor((i + 1) * every)) + 1
+        next_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        avg_x = (next_start + next_end - 1) / 2.0
+        avg_y = y[next_start:next_end].mean()
+
+        # 当前区间内与 (上一选中点, 下一区间平均点) 构成三角形面积最大的点
+        start = int(math.floor(i * every)) + 1
+        end = int(math.floor((i + 1) * every)) + 1
+        xs = np.arange(start, end)
+        areas = np.abs((a - avg_x) * (y[start:end] - y[a]) - (a - xs) * (avg_y - y[a]))
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def lttb(balances: np.ndarray, rtps: np.ndarray, points: int) -> List[Dict[str, Any]]:
+    """按余额曲线做 LTTB 降采样到 points 个点"""
+    return _points(lttb_indices(balances, points), balances, rtps)
+
+
+class MinMaxDownsampler:
+    """
+    在线 min/max 降采样：把 spins 次旋转等分为 points // 2 个区间，每个区间保留余额最低点与最高点，
+    另外总是保留首尾两点。按顺序 feed 各段曲线，feed / finish 返回新确定的点，可直接流式输出。
+    """
+
+    def __init__(self, spins: int, points: int):
+        self.width = max(1, math.ceil(spins / max(1, points // 2)))
+        self._start = 0  # 待处理数据（_pending）第一个元素的全局下标
+        self._pending_balances = np.empty(0)
+        self._pending_rtps = np.empty(0)
+        self._last_emitted = -1
+        self._last_point: Optional[Dict[str, Any]] = None
+
+    def _emit(self, balances: np.ndarray, rtps: np.ndarray, width: int) -> List[Dict[str, Any]]:
+        if len(balances) == 0:
+            return []
+        rows = balances.reshape(-1, width)
+        base = np.arange(len(rows)) * width
+        indices = np.concatenate([base + rows.argmin(axis=1), base + rows.argmax(axis=1)])
+        if self._start == 0:
+            indices = np.append(indices, 0)
+        indices = np.unique(indices)
+        points = _points(indices, balances, rtps, self._start)
+        self._last_emitted = self._start + int(indices[-1])
+        return points
+
+    def feed(self, balances: np.ndarray, rtps: np.ndarray) -> List[Dict[str, Any]]:
+        if len(balances):
+            self._last_point = {"spin": self._start + len(self._pending_balances) + len(balances),
+                                "balance": float(balances[-1]), "rtp": float(rtps[-1])}
+        balances = np.concatenate([self._pending_balances, balances])
+        rtps = np.concatenate([self._pending_rtps, rtps])
+        full = len(balances) // self.width * self.width
+        points = self._emit(balances[:full], rtps[:full], self.width)
+        self._pending_balances, self._pending_rtps = balances[full:], rtps[full:]
+        self._start += full
+        return points
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """处理最后一个不满的区间，并补上最后一个点"""
+        points = self._emit(self._pending_balances, self._pending_rtps, max(len(self._pending_balances), 1))
+        self._start += len(self._pending_balances)
+        self._pending_balances, self._pending_rtps = np.empty(0), np.empty(0)
+        if self._last_point and self._last_point["spin"] - 1 > self._last_emitted:
+            points.append(self._last_point)
+            self._last_emitted = self._last_point["spin"] - 1
+        return points
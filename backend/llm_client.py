@@ -1,9 +1,13 @@
+import asyncio
 import json
+import re
 import httpx
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from models import LLMConfig, SpinResponse, UserState
 import logging
 import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,13 +35,122 @@ Your goal is to keep the player engaged and entertained, regardless of the outco
 Just a short, punchy sentence (max 15 words). No JSON. Just the text.
 """
 
-class LLMClient:
+# 超过截止时间或请求失败时返回的兜底文案
+FALLBACK_COMMENTARY = "Spin the reels and test your luck!"
+
+# 一次评论请求（含超过截止时间后在后台继续等待的部分）的总时限；到时取消请求，连接池客户端不会被停滞的请求一直占用
+LATE_COMMENTARY_TIMEOUT = 15.0
+
+
+class LLMClientPool:
+    """
+    按 (provider, base_url, api_key) 复用的长连接异步客户端，避免每次旋转都重新建立 TCP/TLS 连接。
+    api_key 由请求方提供，因此按最近使用顺序最多保留 max_clients 个客户端：淘汰的客户端在 read_timeout 后关闭
+    （让仍在使用它的请求先完成）。
+    客户端绑定创建时的事件循环；事件循环变化（如测试中多次启动应用）时关闭旧客户端重新创建。
+    transport 用于替换底层 HTTP 传输（测试中使用 httpx.MockTransport）。
+    """
+
+    def __init__(self, max_connections: int = 32, max_keepalive: int = 16,
+                 connect_timeout: float = 2.0, read_timeout: float = LATE_COMMENTARY_TIMEOUT,
+                 max_clients: int = 64, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=60.0)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.transport = transport
+        # 所有请求都在 LATE_COMMENTARY_TIMEOUT 内结束或被取消，淘汰的客户端等这么久后即可安全关闭
+        self.close_delay = read_timeout
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[Tuple[str, str, str], Any]" = OrderedDict()
+        self._retiring: Set[Any] = set()  # 已淘汰、等待关闭的客户端
+        self._closers: Set[asyncio.Task] = set()  # 延迟关闭任务的引用，避免被回收
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.evicted = 0
+
+    def _check_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            clients, self._clients = self._clients, OrderedDict()
+            retiring, self._retiring = self._retiring, set()
+            self._closers = set()
+            self._loop = loop
+            # 旧事件循环上的请求已不可能继续，立即关闭
+            for client in list(clients.values()) + list(retiring):
+                self._retire(client, delay=0.0)
+
+    def _get(self, key: Tuple[str, str, str], factory: Callable[[], Any]) -> Any:
+        self._check_loop()
+        client = self._clients.get(key)
+        if client is not None:
+            self._clients.move_to_end(key)
+            return client
+        client = self._clients[key] = factory()
+        while len(self._clients) > self.max_clients:
+            _, old = self._clients.popitem(last=False)
+            self.evicted += 1
+            self._retire(old, delay=self.close_delay)
+        return client
+
+    def _retire(self, client: Any, delay: float):
+        self._retiring.add(client)
+        task = asyncio.get_running_loop().create_task(self._close_later(client, delay))
+        self._closers.add(task)
+        task.add_done_callback(self._closers.discard)
+
+    async def _close_later(self, client: Any, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if client in self._retiring:
+            self._retiring.discard(client)
+            await self._close(client)
+
     @staticmethod
-    def generate_commentary(config: LLMConfig, spin_result: SpinResponse, user_state: UserState) -> str:
-        if config.debug_mode:
-            return "Debug Mode: Nice spin!"
+    async def _close(client: Any):
+        try:
+            if isinstance(client, AsyncOpenAI):
+                await client.close()
+            else:
+                await client.aclose()
+        except Exception as e:
+            logger.warning(f"Failed to close LLM client: {e}")
+
+    def http_client(self, provider: str, base_url: str) -> httpx.AsyncClient:
+        return self._get(
+            (provider, base_url, ""),
+            lambda: httpx.AsyncClient(base_url=base_url, limits=self.limits, timeout=self.timeout,
+                                      transport=self.transport)
+        )
+
+    def openai_client(self, config: LLMConfig) -> AsyncOpenAI:
+        base_url = config.base_url
+        if config.provider == "deepseek":
+            # DeepSeek usually compatible with OpenAI client
+            base_url = base_url or "https://api.deepseek.com/v1"
+        # 重试交给截止时间控制，不在客户端内部重试
+        return self._get(
+            (config.provider, base_url or "", config.api_key or ""),
+            lambda: AsyncOpenAI(
+                api_key=config.api_key, base_url=base_url, max_retries=0, timeout=self.timeout,
+                http_client=httpx.AsyncClient(limits=self.limits, timeout=self.timeout, transport=self.transport)
+            )
+        )
+
+    async def aclose(self):
+        clients, self._clients = self._clients, OrderedDict()
+        retiring, self._retiring = self._retiring, set()
+        for client in list(clients.values()) + list(retiring):
+            await self._close(client)
 
-        prompt = DEFAULT_SYSTEM_PROMPT.format(
+    def stats(self) -> Dict[str, int]:
+        return {"clients": len(self._clients), "retiring": len(self._retiring), "evicted": self.evicted}
+
+
+client_pool = LLMClientPool()
+
+class LLMClient:
+    @staticmethod
+    def build_commentary_prompt(spin_result: SpinResponse, user_state: UserState) -> str:
+        return DEFAULT_SYSTEM_PROMPT.format(
             BET=user_state.current_bet,
             BALANCE=user_state.wallet_balance,
             WIN_AMOUNT=spin_result.total_payout,
@@ -45,6 +158,131 @@ class LLMClient:
             IS_WIN=spin_result.is_win
         )
 
+    @staticmethod
+    async def request_commentary(config: LLMConfig, prompt: str) -> str:
+        """通过连接池中的长连接客户端请求一句评论；不做截止时间控制，异常向上抛出"""
+        if config.provider in ("openai", "deepseek"):
+            client = client_pool.openai_client(config)
+            response = await client.chat.completions.create(
+                model=config.model,
+                messages=[{"role": "system", "content": prompt}],
+                max_tokens=50
+            )
+            return response.choices[0].message.content.strip()
+
+        elif config.provider == "ollama":
+            client = client_pool.http_client(config.provider, config.base_url or "http://localhost:11434")
+            payload = {
+                "model": config.model,
+                "prompt": prompt,
+                "stream": False
+            }
+            response = await client.post("/api/generate", json=payload)
+            response.raise_for_status()
+            return response.json().get("response", "").strip()
+
+        else:
+            return "Good luck! (Provider not supported)"
+
+    @staticmethod
+    async def request_commentary_batch(config: LLMConfig, prompt: str, count: int) -> List[str]:
+        """
+        一次 JSON 模式请求生成 count 句不同的评论，返回去重后的列表（可能少于 count 句）。
+        不做截止时间控制，请求或解析失败时抛出异常。
+        """
+        instruction = (
+            f"Write {count} different lines for this exact situation, each following the tone rules above "
+            f"(max 15 words each). Ignore the plain-text output rule: respond with JSON only, "
+            f'in the form {{"lines": ["...", "..."]}}.'
+        )
+        messages = [{"role": "system", "content": prompt}, {"role": "user", "content": instruction}]
+
+        if config.provider in ("openai", "deepseek"):
+            extra_params = {}
+            if "deepseek" in config.model.lower() or "gpt" in config.model.lower():
+                extra_params["response_format"] = {"type": "json_object"}
+            client = client_pool.openai_client(config)
+            response = await client.chat.completions.create(
+                model=config.model,
+                messages=messages,
+                max_tokens=40 * count,
+                temperature=1.0,
+                **extra_params
+            )
+            raw_text = response.choices[0].message.content
+
+        elif config.provider == "ollama":
+            client = client_pool.http_client(config.provider, config.base_url or "http://localhost:11434")
+            response = await client.post("/api/chat", json={
+                "model": config.model, "messages": messages, "stream": False, "format": "json"
+            })
+            response.raise_for_status()
+            raw_text = response.json().get("message", {}).get("content", "")
+
+        else:
+            raise ValueError(f"Unknown provider: {config.provider}")
+
+        data = json.loads(LLMClient._clean_json_content(raw_text))
+        items = data.get("lines") if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            # 模型换了键名时，取第一个列表字段
+            items = next((v for v in data.values() if isinstance(v, list)), []) if isinstance(data, dict) else []
+        lines = []
+        for item in items:
+            if isinstance(item, str) and item.strip() and item.strip() not in lines:
+                lines.append(item.strip())
+        if not lines:
+            raise ValueError(f"No commentary lines in batch response: {repr(raw_text[:200])}")
+        return lines[:count]
+
+    @staticmethod
+    async def generate_commentary_async(config: LLMConfig, spin_result: SpinResponse, user_state: UserState,
+                                        on_late: Optional[Callable[[str], Any]] = None) -> str:
+        """
+        generate_commentary 的异步版本，复用连接池中的客户端。
+        超过 config.commentary_deadline 秒未返回时立即返回兜底文案；
+        若提供 on_late，请求继续在后台进行，成功后以评论文本回调 on_late。
+        请求从发出起最长 LATE_COMMENTARY_TIMEOUT 秒，到时无论是否仍在后台都会被取消。
+        """
+        if config.debug_mode:
+            return "Debug Mode: Nice spin!"
+
+        prompt = LLMClient.build_commentary_prompt(spin_result, user_state)
+        task = asyncio.ensure_future(
+            asyncio.wait_for(LLMClient.request_commentary(config, prompt), timeout=LATE_COMMENTARY_TIMEOUT))
+        try:
+            # shield：超时只停止等待，是否取消请求由下面决定
+            return await asyncio.wait_for(asyncio.shield(task), timeout=config.commentary_deadline)
+        except asyncio.TimeoutError:
+            logger.warning(f"LLM commentary exceeded {config.commentary_deadline}s deadline ({config.provider})")
+            if on_late is None:
+                task.cancel()
+            else:
+                task.add_done_callback(lambda t: LLMClient._deliver_late(t, on_late))
+            return FALLBACK_COMMENTARY
+        except Exception as e:
+            logger.error(f"LLM Error: {e}")
+            return FALLBACK_COMMENTARY
+
+    @staticmethod
+    def _deliver_late(task: "asyncio.Task", on_late: Callable[[str], Any]):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"Late LLM commentary failed: {task.exception()}")
+            return
+        try:
+            on_late(task.result())
+        except Exception as e:
+            logger.error(f"Late commentary callback failed: {e}")
+
+    @staticmethod
+    def generate_commentary(config: LLMConfig, spin_result: SpinResponse, user_state: UserState) -> str:
+        if config.debug_mode:
+            return "Debug Mode: Nice spin!"
+
+        prompt = LLMClient.build_commentary_prompt(spin_result, user_state)
+
         try:
             if config.provider == "openai":
                 client = OpenAI(api_key=config.api_key, base_url=config.base_url)
@@ -81,7 +319,7 @@ class LLMClient:
 
         except Exception as e:
             logger.error(f"LLM Error: {e}")
-            return "Spin the reels and test your luck!"
+            return FALLBACK_COMMENTARY
 
         system_prompt = system_prompt.replace("{TARGET_RTP}", str(config.target_rtp))
         system_prompt = system_prompt.replace("{BET}", str(bet))
@@ -1,59 +1,243 @@
 import csv
-import time
+import glob
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+HEADER = ["Timestamp", "Spin_ID", "Bet", "Payout", "Is_Win", "Current_RTP", "AI_Provider", "Latency_ms"]
+
+# fsync 策略：
+#   none     —— 只 flush 到操作系统，由操作系统决定落盘时间（进程崩溃不丢数据，断电可能丢最近几秒）
+#   batch    —— 每写完一批 fsync 一次
+#   interval —— 距上次 fsync 超过 fsync_interval 秒时 fsync
+FSYNC_POLICIES = ("none", "batch", "interval")
+
+_STOP = object()
+
 
 class GameLogger:
-    def __init__(self, filename="game_data.csv"):
+    """
+    旋转审计日志（CSV）。
+    log_spin 不做文件 IO：行数据放入队列，由后台线程按批写入（攒够 batch_size 行或距上次写入超过 flush_interval 秒），
+    每批打开、追加、关闭一次文件，不再每行打开/关闭。文件超过 max_bytes 时轮转为 game_data.csv.1 ... .N。
+    多个 worker 进程共用同一个日志：每批的打开、写入和轮转都在跨进程文件锁（game_data.csv.lock）内完成，
+    因此不会有进程写进已被轮转改名的文件。
+    总投注/总派彩在 log_spin 时累加；get_history_stats 第一次调用时才扫描已有日志（含轮转出的旧文件），
+    创建实例（导入 app）时不读日志。
+    """
+
+    def __init__(self, filename="game_data.csv", batch_size: int = 256, flush_interval: float = 1.0,
+                 fsync: str = "interval", fsync_interval: float = 5.0,
+                 max_bytes: int = 50 * 1024 * 1024, backup_count: int = 5, max_queue: int = 100000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
         # Use an absolute path anchored to the backend directory to avoid CWD issues
         base_dir = os.path.dirname(__file__)
         self.filepath = os.path.join(base_dir, filename)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._file_mutex = threading.Lock()  # 文件锁按打开的文件生效，同一进程内的线程另用互斥锁
+        self._last_fsync = time.time()
+
+        # 本进程记录的旋转（log_spin 时累加）
+        self.spins = 0
+        self.total_bet = 0.0
+        self.total_payout = 0.0
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        # 本进程启动前已写入日志的累计值 (spins, total_bet, total_payout)，首次需要时扫描
+        self._history: Optional[Tuple[int, float, float]] = None
+        self._history_lock = threading.Lock()
+        # 扫描只统计本进程写入之前的行
+        self._history_files = self._count_existing_files()
+
         self._ensure_file_exists()
 
+    @contextmanager
+    def _file_lock(self):
+        """跨进程互斥：写入、轮转和扫描日志时持有"""
+        with self._file_mutex, open(self.filepath + ".lock", mode='a+b') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock.seek(0)
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
     def _ensure_file_exists(self):
         if not os.path.exists(self.filepath):
-            with open(self.filepath, mode='w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    "Timestamp", "Spin_ID", "Bet", "Payout", "Is_Win", 
-                    "Current_RTP", "AI_Provider", "Latency_ms"
-                ])
+            with self._file_lock(), open(self.filepath, mode='a', newline='', encoding='utf-8') as f:
+                # 另一个进程可能已抢先创建
+                if f.tell() == 0:
+                    csv.writer(f).writerow(HEADER)
+
+    def _count_existing_files(self) -> List[Tuple[str, int]]:
+        """启动时已有的日志文件及其大小（只 stat，不读内容）；扫描时只读到这个位置"""
+        backups = [p for p in glob.glob(self.filepath + ".*") if p.rsplit(".", 1)[1].isdigit()]
+        files = []
+        for path in [self.filepath] + backups:
+            try:
+                files.append((path, os.path.getsize(path)))
+            except OSError:
+                continue
+        return files
+
+    def _load_totals(self) -> Tuple[int, float, float]:
+        """
+        扫描一次本进程启动前已有的日志（含轮转出的旧文件），之后只做增量累加。
+        启动后其他 worker 进程写入的行不计入（各进程只累加自己记录的旋转）。
+        """
+        with self._history_lock:
+            if self._history is not None:
+                return self._history
+            spins, total_bet, total_payout = 0, 0.0, 0.0
+            for path, size in self._history_files:
+                try:
+                    with self._file_lock(), open(path, mode='rb') as f:
+                        text = f.read(size).decode('utf-8', errors='replace')
+                    for row in csv.DictReader(text.splitlines()):
+                        try:
+                            bet, payout = float(row.get("Bet", 0)), float(row.get("Payout", 0))
+                        except (TypeError, ValueError):
+                            continue
+                        spins += 1
+                        total_bet += bet
+                        total_payout += payout
+                except Exception as e:
+                    print(f"Error reading history {path}: {e}")
+            self._history = (spins, total_bet, total_payout)
+            return self._history
 
-    def log_spin(self, spin_id: str, bet: float, payout: float, 
+    def log_spin(self, spin_id: str, bet: float, payout: float,
                  current_rtp: float, provider: str, latency_ms: float):
-        is_win = payout > 0
-        with open(self.filepath, mode='a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                datetime.now().isoformat(),
-                spin_id,
-                bet,
-                payout,
-                is_win,
-                current_rtp,
-                provider,
-                round(latency_ms, 2)
-            ])
+        """记录一次旋转（不阻塞）；队列已满时丢弃该行并计数，累计值仍然更新"""
+        with self._lock:
+            self.spins += 1
+            self.total_bet += bet
+            self.total_payout += payout
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name="game-logger", daemon=True)
+                self._writer.start()
+        row = [datetime.now().isoformat(), spin_id, bet, payout, payout > 0,
+               current_rtp, provider, round(latency_ms, 2)]
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
     def get_history_stats(self):
-        """从 CSV 中计算历史总投注、总派彩和 RTP"""
-        # 初始虚拟样本，防止前几局 RTP 波动过大导致走极端
-        total_bet = 100.0 
-        total_payout = 95.0
+        """
+        历史总投注、总派彩和 RTP（含初始虚拟样本，防止前几局 RTP 波动过大导致走极端）。
+        第一次调用时扫描已有日志（耗时与日志大小成正比），之后为 O(1)。
+        """
+        _, history_bet, history_payout = self._load_totals()
+        with self._lock:
+            total_bet = history_bet + self.total_bet + 100.0
+            total_payout = history_payout + self.total_payout + 95.0
+        rtp = total_payout / total_bet if total_bet > 0 else 0.95
+        return total_bet, total_payout, round(rtp, 4)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch: List[List[Any]] = []
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write(batch, final=stop)
+                except Exception as e:
+                    print(f"Error writing game log: {e}")
+
+    def _write(self, batch: List[List[Any]], final: bool = False):
+        """在文件锁内追加一批行；文件（含其他进程写入的部分）超过 max_bytes 时随即轮转"""
+        with self._file_lock():
+            with open(self.filepath, mode='a', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                if f.tell() == 0:
+                    writer.writerow(HEADER)
+                writer.writerows(batch)
+                f.flush()
+                now = time.time()
+                if self.fsync == "batch" or (self.fsync != "none" and final) or \
+                        (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+                    os.fsync(f.fileno())
+                    self._last_fsync = now
+                size = f.tell()
+            self.written += len(batch)
+            if self.max_bytes and size >= self.max_bytes:
+                self._rotate()
+
+    def _rotate(self):
+        """game_data.csv -> .1 -> .2 ...，超过 backup_count 的最旧文件删除（调用方持有文件锁）"""
+        if self.backup_count > 0:
+            oldest = f"{self.filepath}.{self.backup_count}"
+            if os.path.exists(oldest):
+                os.remove(oldest)
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.filepath}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.filepath}.{i + 1}")
+            os.replace(self.filepath, f"{self.filepath}.1")
+        else:
+            os.remove(self.filepath)
+        with open(self.filepath, mode='w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow(HEADER)
+        self.rotations += 1
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中剩余的行并关闭文件（服务关闭时调用）"""
+        writer = self._writer
+        if writer is None or not writer.is_alive():
+            return
         try:
-            if not os.path.exists(self.filepath):
-                return total_bet, total_payout, 0.95
-            
-            with open(self.filepath, mode='r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    try:
-                        total_bet += float(row.get("Bet", 0))
-                        total_payout += float(row.get("Payout", 0))
-                    except ValueError:
-                        continue
-            
-            rtp = total_payout / total_bet if total_bet > 0 else 0.95
-            return total_bet, total_payout, round(rtp, 4)
-        except Exception as e:
-            print(f"Error reading history: {e}")
-            return 100.0, 95.0, 0.95
\ No newline at end of file
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        writer.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "spins": self.spins,
+            "written": self.written,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+            "fsync": self.fsync,
+            "history_loaded": self._history is not None,
+        }
@@ -9,6 +9,7 @@ class LLMConfig(BaseModel):
     target_rtp: float = Field(0.97, description="Target RTP for the session")
     system_prompt_template: Optional[str] = Field(None, description="Custom system prompt template")
     debug_mode: bool = Field(False, description="Skip logic and return raw LLM response")
+    commentary_deadline: float = Field(2.0, description="Seconds to wait for AI commentary before falling back")
 
 class UserState(BaseModel):
     user_level: int = 1
@@ -26,6 +27,7 @@ class SpinRequest(BaseModel):
     history_rtp: float
     config: LLMConfig
     user_state: Optional[UserState] = None # Added for new logic
+    wait_commentary: bool = False # True: 在响应中同步返回 AI 评论（受 commentary_deadline 限制）
 
 class WinningLine(BaseModel):
     line_id: int
@@ -44,4 +46,5 @@ class SpinResponse(BaseModel):
     bucket_type: str = "Unknown"
     fail_streak: int = 0 # Added for PRD logic
     raw_debug_info: Optional[Dict[str, Any]] = None
+    commentary_ticket: Optional[str] = None # 后台生成评论的票据，见 GET /commentary/{ticket}
 
@@ -0,0 +1,146 @@
+"""
+多进程蒙特卡洛模拟：把总旋转数分给 N 个独立玩家，各玩家在进程池中用 OutcomeEngine.simulate_batch 运行。
+
+每个玩家的随机数流由主种子经 numpy SeedSequence 派生（spawn_key = 玩家序号），互不重叠，
+且只取决于 (seed, 玩家序号)，与进程数无关，因此同一 seed 与玩家数下结果完全可复现。
+合并时对各玩家的旋转数、倍数和、倍数平方和与奖池直方图逐项求和，与单次遍历全部旋转得到的统计量一致。
+
+RTP 置信区间给出两种：
+    iid      —— 把每次旋转视为独立样本（PRD 连败机制使相邻旋转相关，区间偏窄，仅供参考）
+    players  —— 以各玩家的 RTP 为独立样本（批均值法），对旋转间的相关性稳健，玩家数 ≥ 2 时可用
+"""
+
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from outcome_engine import OutcomeEngine
+
+# 进程池 worker 中的引擎（每个进程从缓存文件 mmap 加载一次）
+_worker_engine: Optional[OutcomeEngine] = None
+
+
+def _init_worker(config: Dict[str, Any]):
+    """只 mmap 主进程准备好的缓存文件；不自行构建（各 worker 独立采样会得到不同的奖池）"""
+    global _worker_engine
+    _worker_engine = OutcomeEngine(config_override=config, lazy=True).ensure_ready(build=False)
+
+
+def player_rng(seed: int, player: int) -> random.Random:
+    """第 player 个玩家的随机数流，等价于 SeedSequence(seed).spawn(n)[player]"""
+    state = np.random.SeedSequence(seed, spawn_key=(player,)).generate_state(4, dtype=np.uint64)
+    return random.Random(int.from_bytes(state.tobytes(), "little"))
+
+
+def split_spins(spins: int, players: int) -> List[int]:
+    """把总旋转数尽量均匀地分给各玩家（前 spins % players 个玩家多 1 次）"""
+    base, extra = divmod(spins, players)
+    return [base + (1 if i < extra else 0) for i in range(players)]
+
+
+def _run_player(bet: float, spins: int, seed: int, player: int, config: Dict[str, Any],
+                engine: Optional[OutcomeEngine] = None) -> Dict[str, Any]:
+    """模拟单个玩家（本金 = 旋转数 × 下注，与 /simulate 一致），只返回可合并的统计量"""
+    engine = engine or _worker_engine
+    result = engine.simulate_batch(bet, spins, runtime_config=config, record_history=False,
+                                   rng=player_rng(seed, player))
+    result.pop("balance_curve")
+    result.pop("rtp_curve")
+    return result
+
+
+def merge_results(results: List[Dict[str, Any]], confidence: float = 0.95) -> Dict[str, Any]:
+    """合并各玩家的统计量，并计算 RTP 置信区间"""
+    spins = sum(r["spins"] for r in results)
+    if spins == 0:
+        raise ValueError("no spins simulated")
+    mean = math.fsum(r["multiplier_sum"] for r in results) / spins
+    variance = max(math.fsum(r["multiplier_sq_sum"] for r in results) / spins - mean * mean, 0.0)
+
+    bucket_counts: Dict[str, int] = {}
+    for r in results:
+        for name, count in r["bucket_counts"].items():
+            bucket_counts[name] = bucket_counts.get(name, 0) + count
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    iid_se = math.sqrt(variance / spins)
+    ci = {"iid": [mean - z * iid_se, mean + z * iid_se]}
+    standard_error = {"iid": iid_se}
+
+    player_rtps = [r["multiplier_sum"] / r["spins"] for r in results if r["spins"] > 0]
+    if len(player_rtps) >= 2:
+        # 以玩家 RTP 的样本标准差估计均值的标准误
+        avg = math.fsum(player_rtps) / len(player_rtps)
+        sample_var = math.fsum((x - avg) ** 2 for x in player_rtps) / (len(player_rtps) - 1)
+        players_se = math.sqrt(sample_var / len(player_rtps))
+        ci["players"] = [mean - z * players_se, mean + z * players_se]
+        standard_error["players"] = players_se
+
+    return {
+        "spins": spins,
+        "rtp": mean,
+        "variance": variance,
+        "std_dev": math.sqrt(variance),
+        "hit_rate": sum(r["hits"] for r in results) / spins,
+        "max_fail_streak": max(r["max_fail_streak"] for r in results),
+        "bucket_counts": bucket_counts,
+        "confidence": confidence,
+        "standard_error": standard_error,
+        "rtp_ci": ci,
+    }
+
+
+def run_monte_carlo(config: Dict[str, Any], bet: float, spins: int, players: int = 16,
+                    seed: Optional[int] = None, workers: Optional[int] = None,
+                    confidence: float = 0.95, engine: Optional[OutcomeEngine] = None) -> Dict[str, Any]:
+    """
+    把 spins 次旋转分给 players 个独立玩家，在 workers 个进程中并行模拟并合并结果。
+    seed 为空时随机生成并在结果中返回，用于复现。
+    奖池只在当前进程中加载或构建一次（engine 未提供时按 config 构建，并写入缓存文件），
+    worker 进程只 mmap 该缓存文件，因此所有玩家使用同一份奖池，结果与 workers == 1 时相同。
+    workers == 1 或缓存文件无法写入时在当前进程中串行运行。
+    """
+    if seed is None:
+        # 保持在 JS 安全整数范围内，前端回传时不丢精度
+        seed = random.SystemRandom().getrandbits(53)
+    players = max(1, min(players, spins))
+    workers = max(1, min(workers or os.cpu_count() or 1, players))
+    player_spins = split_spins(spins, players)
+
+    start_time = time.time()
+    engine = (engine or OutcomeEngine(config_override=config, lazy=True)).ensure_ready()
+    if workers > 1 and not os.path.exists(engine._get_cache_path()):
+        print(f"Bucket cache {engine._get_cache_path()} unavailable, running Monte Carlo in-process.")
+        workers = 1
+
+    if workers == 1:
+        results = [_run_player(bet, n, seed, i, config, engine) for i, n in enumerate(player_spins)]
+    else:
+        # spawn：避免在多线程的服务进程中 fork；worker 启动时从缓存文件加载奖池
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(config,)) as pool:
+            results = list(pool.map(_run_player, repeat(bet), player_spins, repeat(seed),
+                                    range(players), repeat(config)))
+
+    summary = merge_results(results, confidence)
+    summary.update({
+        "seed": seed,
+        "bet": bet,
+        "players": players,
+        "workers": workers,
+        "elapsed_seconds": time.time() - start_time,
+        "per_player": [
+            {"spins": r["spins"], "rtp": r["rtp"], "final_balance": r["final_balance"],
+             "max_fail_streak": r["max_fail_streak"]}
+            for r in results
+        ],
+    })
+    return summary
@@ -1,21 +1,82 @@
 import json
+import logging
 import os
 import random
 import time
 import hashlib
-import pickle
+import threading
+from collections import OrderedDict
+import numpy as np
 from typing import List, Dict, Tuple, Any, Optional
 from models import WinningLine
+from bucket_builder import (
+    ReelEvaluator, build_buckets, build_buckets_parallel, build_buckets_stratified, intern_win_patterns,
+    pattern_multiplier, sample_bucket_stats, sort_by_multiplier
+)
+from bucket_store import BucketStore
+from bucket_cache import load_buckets, save_buckets
+from bucket_selector import BucketSelector
+
+logger = logging.getLogger("OutcomeEngine")
+
+# 待评估的行数（遍历的组合数或抽样次数）达到此值时才启用进程池（进程启动开销约数百毫秒）
+PARALLEL_MIN_ROWS = 100000
+
+# 均匀采样模式的抽样次数
+UNIFORM_SAMPLES = 100000
+
+# 按会话配置版本缓存的已编译选择器数量上限
+SELECTOR_CACHE_SIZE = 256
+
+# 影响采样结果、因而计入结构化哈希的 settings 项
+SAMPLING_SETTINGS = ("sampling_mode", "sampling_target_per_bucket", "sampling_max_draws")
+
+def compute_config_hash(config: Dict[str, Any]) -> str:
+    """
+    生成配置的结构化哈希。只有影响桶内容的参数改变时，哈希才会变。
+    权重、C值、RTP等不影响桶内容的参数不计入哈希。
+    直接作用于原始配置（兼容 min/max 写法），无需构造引擎。
+    """
+    buckets = config.get("buckets", {})
+    settings = config.get("settings") or {}
+    structural_parts = {
+        "reel_sets": config.get("reel_sets"),
+        "symbols": config.get("symbols"),
+        "pay_table": config.get("pay_table"),
+        "lines": config.get("lines"),
+        "reels_length": config.get("reels_length"),
+        "buckets_ranges": {k: {"min": v.get("min_win", v.get("min", 0)), "max": v.get("max_win", v.get("max", 0))}
+                          for k, v in buckets.items()}
+    }
+    # 采样参数会改变大状态空间下的桶内容；未设置时不计入，保持旧哈希不变
+    sampling = {k: settings[k] for k in SAMPLING_SETTINGS if k in settings}
+    if sampling:
+        structural_parts["sampling"] = sampling
+    config_str = json.dumps(structural_parts, sort_keys=True)
+    return hashlib.md5(config_str.encode()).hexdigest()
 
 class OutcomeEngine:
-    def __init__(self, config_override=None):
+    def __init__(self, config_override=None, lazy: bool = False):
+        """
+        lazy=True 时只解析配置，不加载/构建奖池；由调用方在合适的时机（如后台线程）调用 ensure_ready()。
+        """
         self.config = {}
-        self.buckets = {}
+        self.buckets: Dict[str, BucketStore] = {}
+        self.win_patterns = []  # 去重后的中奖线组合 ((line_id, symbol_name, count, multiplier), ...)
+        self.win_multipliers = []  # 每个中奖线组合的总倍数，与 win_patterns 下标一致
+        self.reel_windows = []
         self.reels = []
         self.symbols = {}
         self.pay_table = {}
         self.lines = {}
+        self.bucket_stats = {}
+        self.min_multipliers: Dict[str, float] = {}  # 每个奖池中最小的实际倍数，用于安全上限筛选奖池
+        self.bucket_coverage = {}  # 每个奖池的样本数 / 目标 / 概率估计，见 initialize_buckets
         self.is_ready = False
+        self.build_error: Optional[str] = None  # 最近一次加载/构建奖池失败的原因，成功前保留
+        self._build_lock = threading.Lock()
+        self._selectors: "OrderedDict[Any, BucketSelector]" = OrderedDict()  # 配置版本 -> 已编译选择器
+        self._selectors_lock = threading.Lock()
         
         if config_override:
             self.config = config_override
@@ -23,6 +84,40 @@ class OutcomeEngine:
         else:
             self.load_config()
 
+        if self.config:
+            self.validate()
+
+        if not lazy:
+            self.ensure_ready()
+
+    def ensure_ready(self, build: bool = True) -> "OutcomeEngine":
+        """
+        加载或构建奖池。线程安全：并发调用时只构建一次，其余调用等待构建完成。
+        build=False 时只从缓存文件加载，缓存不存在时抛出 RuntimeError（不重新采样）。
+        """
+        if self.is_ready or not self.config:
+            return self
+        with self._build_lock:
+            if not self.is_ready:
+                try:
+                    self._load_buckets(build)
+                except Exception as e:
+                    self.build_error = f"{type(e).__name__}: {e}"
+                    raise
+                self.build_error = None
+        return self
+
+    def validate(self):
+        """
+        同步校验卷轴与中奖线：用构建奖池时的向量化评估器评估一个组合，
+        中奖线坐标越界、符号缺失等错误在这里以 ValueError 抛出，而不是等到后台构建时才失败。
+        """
+        try:
+            evaluator = ReelEvaluator(self.config)
+            evaluator.evaluate(np.zeros((1, 5), dtype=np.int64))
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid reels/lines: {type(e).__name__}: {e}") from e
+
     def load_config(self):
         config_path = os.path.join(os.path.dirname(__file__), "game_config_v2.json")
         if not os.path.exists(config_path):
@@ -39,46 +134,30 @@ class OutcomeEngine:
         self._parse_config()
 
     def _get_config_hash(self):
-        """
-        生成配置的结构化哈希。只有影响桶内容的参数改变时，哈希才会变。
-        权重、C值、RTP等不影响桶内容的参数不计入哈希。
-        """
-        structural_parts = {
-            "reel_sets": self.config.get("reel_sets"),
-            "symbols": self.config.get("symbols"),
-            "pay_table": self.config.get("pay_table"),
-            "lines": self.config.get("lines"),
-            "reels_length": self.config.get("reels_length"),
-            "buckets_ranges": {k: {"min": v.get("min_win"), "max": v.get("max_win")} 
-                              for k, v in self.config.get("buckets", {}).items()}
-        }
-        config_str = json.dumps(structural_parts, sort_keys=True)
-        return hashlib.md5(config_str.encode()).hexdigest()
+        return compute_config_hash(self.config)
+
+    def _get_cache_path(self) -> str:
+        return os.path.join(os.path.dirname(__file__), f"cache_{self._get_config_hash()}.bin")
 
     def _load_from_cache(self) -> bool:
-        cache_hash = self._get_config_hash()
-        cache_path = os.path.join(os.path.dirname(__file__), f"cache_{cache_hash}.pkl")
+        cache_path = self._get_cache_path()
         
         if os.path.exists(cache_path):
             try:
-                with open(cache_path, "rb") as f:
-                    data = pickle.load(f)
-                    self.buckets = data["buckets"]
-                    self.bucket_stats = data["bucket_stats"]
+                # 只读 mmap：多个 worker 共享同一份物理内存
+                self.buckets, self.win_patterns, self.bucket_stats, self.bucket_coverage = load_buckets(
+                    cache_path, config_hash=self._get_config_hash())
+                self.win_multipliers = [pattern_multiplier(p) for p in self.win_patterns]
                 return True
             except Exception as e:
                 print(f"Failed to load cache: {e}")
         return False
 
     def _save_to_cache(self):
-        cache_hash = self._get_config_hash()
-        cache_path = os.path.join(os.path.dirname(__file__), f"cache_{cache_hash}.pkl")
+        cache_path = self._get_cache_path()
         try:
-            with open(cache_path, "wb") as f:
-                pickle.dump({
-                    "buckets": self.buckets,
-                    "bucket_stats": self.bucket_stats
-                }, f)
+            save_buckets(cache_path, self._get_config_hash(), self.config["reels_length"],
+                         self.buckets, self.win_patterns, self.bucket_stats, self.bucket_coverage)
             print(f"Buckets cached to {cache_path}")
         except Exception as e:
             print(f"Failed to save cache: {e}")
@@ -101,22 +180,23 @@ class OutcomeEngine:
             if "max_win" not in cfg: cfg["max_win"] = 0
 
         self.settings = self.config["settings"]
+        self.reel_windows = self._build_reel_windows()
         
+        # 自动校准 RTP (已禁用：由前端手动计算)
+        # self._auto_calibrate_rtp()
+
+    def _load_buckets(self, build: bool = True):
         # 尝试从缓存加载
         if self._load_from_cache():
             print("Buckets loaded from cache.")
+            self._index_buckets()
             self.is_ready = True
+        elif not build:
+            raise RuntimeError(f"Bucket cache {self._get_cache_path()} not found")
         else:
-            # 初始化奖池
-            for key in self.buckets_config:
-                self.buckets[key] = []
-
             print("No valid cache found. Initializing buckets (this may take a few seconds)...")
             self.initialize_buckets()
             self._save_to_cache()
-        
-        # 自动校准 RTP (已禁用：由前端手动计算)
-        # self._auto_calibrate_rtp()
 
     def _auto_calibrate_rtp(self):
         """
@@ -188,83 +268,104 @@ class OutcomeEngine:
         use_sampling = total_combinations > 2000000 # 限制在约200万
         
         start_time = time.time()
-        
-        if use_sampling:
-            print(f"State space {total_combinations} too large, using sampling (100k samples).")
-            for _ in range(100000):
-                stops = [random.randint(0, reel_len - 1) for _ in range(5)]
-                self._process_stop(stops)
+        evaluator = ReelEvaluator(self.config)
+        sampling_mode = self.settings.get("sampling_mode", "uniform")
+        workers = self._get_build_workers()
+        # 抽样流由全局 random 派生，random.seed 相同则抽样结果相同
+        rng = np.random.default_rng(random.getrandbits(64)) if use_sampling else None
+        
+        if use_sampling and sampling_mode == "stratified":
+            # 分层 + 重要性采样：持续抽样直到每个奖池达到目标数量或用完抽样预算
+            target = int(self.settings.get("sampling_target_per_bucket", 2000))
+            max_draws = int(self.settings.get("sampling_max_draws", 4000000))
+            print(f"State space {total_combinations} too large, using stratified sampling "
+                  f"(target {target} per bucket, at most {max_draws} draws).")
+            # 按最多需要评估的行数（抽样预算）决定是否启用进程池
+            build_workers = workers if max_draws >= PARALLEL_MIN_ROWS else 1
+            built, self.bucket_coverage = build_buckets_stratified(
+                evaluator, self.buckets_config, rng, target, max_draws, workers=build_workers)
         else:
-            print(f"Traversing all {total_combinations} combinations...")
-            # 递归或迭代遍历，5卷轴用迭代
-            import itertools
-            ranges = [range(reel_len) for _ in range(5)]
-            for stops in itertools.product(*ranges):
-                self._process_stop(list(stops))
+            if use_sampling:
+                print(f"State space {total_combinations} too large, using sampling ({UNIFORM_SAMPLES} samples).")
+                samples = rng.integers(0, reel_len, size=(UNIFORM_SAMPLES, 5))
+                num_outcomes = len(samples)
+            else:
+                print(f"Traversing all {total_combinations} combinations...")
+                num_outcomes = total_combinations
+
+            # 不再限制单个奖池大小：打包存储后每个结果只占几个字节
+            if workers > 1 and num_outcomes >= PARALLEL_MIN_ROWS:
+                # 分片并行：遍历模式按第一列停止位置分片，采样模式按采样顺序切段；按分片顺序合并，结果与串行一致
+                shards = np.array_split(samples, workers * 4) if use_sampling else list(range(reel_len))
+                print(f"Building buckets with {workers} worker processes ({len(shards)} shards)...")
+                built = build_buckets_parallel(self.config, self.buckets_config, shards, workers)
+            else:
+                # 按 itertools.product 的顺序分批向量化遍历
+                stop_batches = iter([samples]) if use_sampling else evaluator.all_stops()
+                built = build_buckets(evaluator, self.buckets_config, stop_batches, max_per_bucket=None)
+
+            self.bucket_coverage = {
+                "mode": "uniform" if use_sampling else "exhaustive",
+                "draws": {"uniform": num_outcomes, "importance": 0},
+                "buckets": {k: {"count": len(stops), "estimated_probability": len(stops) / num_outcomes}
+                            for k, (stops, _, _) in built.items()}
+            }
+
+        # 预计算每个结果的中奖线组合，旋转时直接查表
+        self.win_patterns, win_ids = intern_win_patterns(evaluator, built, self.symbols)
+        self.win_multipliers = [pattern_multiplier(p) for p in self.win_patterns]
+        # 奖池内按倍数排序，按余额余量抽取时可选结果总是一个前缀
+        self.buckets = {k: BucketStore.from_stops(reel_len, *sort_by_multiplier(stops, win_ids[k], self.win_multipliers))
+                        for k, (stops, _, _) in built.items()}
                 
         print(f"Buckets initialized in {time.time() - start_time:.2f}s")
         for k, v in self.buckets.items():
-            print(f"Bucket {k}: {len(v)} outcomes")
+            share = self.bucket_coverage["buckets"][k]["estimated_probability"]
+            print(f"Bucket {k}: {len(v)} outcomes ({v.nbytes / 1024:.0f} KB, ~{share:.4%} of combinations)")
             
         # 计算并存储每个 Bucket 的真实平均倍数
-        self.bucket_stats = {}
-        for k, stops_list in self.buckets.items():
-            if not stops_list:
-                self.bucket_stats[k] = 0.0
-                continue
-                
-            # 为了性能，如果数据量太大，只采样前 1000 个计算平均值
-            sample_size = min(len(stops_list), 1000)
-            total_mult = 0.0
-            
-            # 随机采样以获得更准确的估算
-            samples = random.sample(stops_list, sample_size)
-            
-            for stops in samples:
-                matrix = self._get_matrix_from_stops(stops)
-                mult, _, _ = self._calculate_win(matrix)
-                total_mult += mult
-                
-            self.bucket_stats[k] = total_mult / sample_size
-            # print(f"Bucket {k} Real Avg Multiplier: {self.bucket_stats[k]:.2f}x")
+        # 为了性能，如果数据量太大，只随机采样 1000 个计算平均值
+        self.bucket_stats = {k: sample_bucket_stats(mults) for k, (_, mults, _) in built.items()}
 
+        self._index_buckets()
         self.is_ready = True
 
-    def _process_stop(self, stops: List[int]):
-        # 1. 构建矩阵
-        matrix = self._get_matrix_from_stops(stops)
-        
-        # 2. 计算中奖
-        total_win_multiplier, _, is_near_miss = self._calculate_win(matrix)
-        
-        # 3. 分类
-        bucket_name = self._classify_win(total_win_multiplier, is_near_miss)
-        
-        if bucket_name:
-            # 只存 stops 节省内存
-            # 如果奖池过大（如 Loss_Random），可限制其大小
-            if len(self.buckets[bucket_name]) < 50000: # 每个奖池最多5万条，节省内存
-                self.buckets[bucket_name].append(stops)
+    def _index_buckets(self):
+        """记录各奖池的最小倍数（奖池已按倍数排序），并清空已编译的选择器"""
+        self.min_multipliers = {k: b.min_multiplier for k, b in self.buckets.items() if len(b)}
+        self._selectors.clear()
 
-    def _get_matrix_from_stops(self, stops: List[int]) -> List[List[str]]:
-        matrix = []
+    def _build_reel_windows(self) -> List[List[Tuple[str, str, str]]]:
+        """预计算每列每个停止位置露出的 3 个符号，reel_windows[c][stop] = (第0行, 第1行, 第2行)"""
         reel_len = self.config["reels_length"]
-        for r in range(3): # 3行
-            row = []
-            for c in range(5): # 5列
-                # 卷轴带为环形
-                idx = (stops[c] + r) % reel_len
-                
-                # 卷轴索引安全检查
-                if c < len(self.reels) and idx < len(self.reels[c]):
-                    symbol_id = self.reels[c][idx]
-                else:
-                    # 配置不一致时兜底
-                    symbol_id = "L1" 
+        windows = []
+        for c in range(5): # 5列
+            column = []
+            for stop in range(reel_len):
+                cells = []
+                for r in range(3): # 3行
+                    # 卷轴带为环形
+                    idx = (stop + r) % reel_len
                     
-                row.append(symbol_id)
-            matrix.append(row)
-        return matrix
+                    # 卷轴索引安全检查
+                    if c < len(self.reels) and idx < len(self.reels[c]):
+                        cells.append(self.reels[c][idx])
+                    else:
+                        # 配置不一致时兜底
+                        cells.append("L1")
+                column.append(tuple(cells))
+            windows.append(column)
+        return windows
+
+    def _get_build_workers(self) -> int:
+        """构建奖池的进程数：settings.build_workers，未设置时使用 CPU 核数"""
+        workers = self.settings.get("build_workers") or os.cpu_count() or 1
+        return max(1, int(workers))
+
+    def _get_matrix_from_stops(self, stops: List[int]) -> List[List[str]]:
+        reel_len = self.config["reels_length"]
+        columns = [self.reel_windows[c][stops[c] % reel_len] for c in range(5)]
+        return [[col[r] for col in columns] for r in range(3)]
 
     def _calculate_win(self, matrix: List[List[str]]) -> Tuple[float, List[WinningLine], bool]:
         total_payout = 0.0
@@ -345,48 +446,69 @@ class OutcomeEngine:
         return "Win_Tier_1" # 兜底
 
     def spin(self, user_state: Dict[str, Any], runtime_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        balance = user_state.get("wallet_balance", 1000.0)
+        return self.spin_for(
+            bet=user_state.get("current_bet", 10.0),
+            balance=balance,
+            initial_balance=user_state.get("initial_balance", 1000.0),
+            total_spins=user_state.get("total_spins", 0),
+            fail_streak=user_state.get("fail_streak", 0),
+            max_historical_balance=user_state.get("max_historical_balance", balance),
+            historical_rtp=user_state.get("historical_rtp", 0.0), # 获取用户历史 RTP
+            ignore_safety=user_state.get("simulation_mode", False),
+            runtime_config=runtime_config
+        )
+
+    def spin_for(self, bet: float, balance: float, initial_balance: float = 1000.0, total_spins: int = 0,
+                 fail_streak: int = 0, max_historical_balance: Optional[float] = None, historical_rtp: float = 0.0,
+                 ignore_safety: bool = False, runtime_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """按玩家状态的各项数值直接旋转（服务端玩家状态使用，不经过 user_state 字典）"""
         if not self.is_ready:
             return {"error": "Engine not ready"}
+        if max_historical_balance is None:
+            max_historical_balance = balance
 
-        bet = user_state.get("current_bet", 10.0)
-        balance = user_state.get("wallet_balance", 1000.0)
-        initial_balance = user_state.get("initial_balance", 1000.0)
-        total_spins = user_state.get("total_spins", 0)
-        fail_streak = user_state.get("fail_streak", 0)
-        max_historical_balance = user_state.get("max_historical_balance", balance)
-        historical_rtp = user_state.get("historical_rtp", 0.0) # 获取用户历史 RTP
-        ignore_safety = user_state.get("simulation_mode", False)
-        
         # 1. 选择奖池
+        selector = self._selector(runtime_config)
         bucket_name = self._select_bucket(
             bet, balance, initial_balance, 
             total_spins, fail_streak, 
             ignore_safety=ignore_safety,
             max_historical_balance=max_historical_balance,
             historical_rtp=historical_rtp, # 传入 RTP
-            runtime_config=runtime_config
+            selector=selector
         )
-        if not ignore_safety:
-            print(f"[OutcomeEngine] Bet: {bet}, Balance: {balance}, Spins: {total_spins}, FailStreak: {fail_streak}. Selected Bucket: {bucket_name}")
-        
+        # 每次旋转都会经过这里，用惰性格式化，未开启 DEBUG 时不拼接字符串
+        logger.debug("Bet: %s, Balance: %s, Spins: %s, FailStreak: %s. Selected Bucket: %s",
+                     bet, balance, total_spins, fail_streak, bucket_name)
+
         # 2. 从奖池中抽取结果
         if not self.buckets[bucket_name]:
             # 如果奖池为空，兜底到 Loss_Random
-            print(f"[OutcomeEngine] Bucket {bucket_name} empty! Fallback to Loss_Random")
+            logger.debug("Bucket %s empty, falling back to Loss_Random", bucket_name)
             bucket_name = "Loss_Random"
             
-        stops = random.choice(self.buckets[bucket_name])
+        bucket = self.buckets[bucket_name]
+        # 只在不会使余额超过安全上限的结果中抽取
+        idx = bucket.draw_within(bet, balance, selector.max_allowed_balance(initial_balance))
+        if idx is None:
+            # 奖池中没有不超过上限的结果，兜底到 Loss_Random
+            bucket_name = "Loss_Random"
+            bucket = self.buckets[bucket_name]
+            idx = bucket.draw()
+        win_id = bucket.win_id(idx)
 
-        
-        # 3. 生成详细结果
-        matrix = self._get_matrix_from_stops(stops)
-        multiplier, winning_lines, _ = self._calculate_win(matrix)
+        # 3. 查表生成详细结果（倍数与中奖线在初始化时已预计算）
+        matrix = self._get_matrix_from_stops(bucket.stops(idx))
+        multiplier = self.win_multipliers[win_id]
         
         total_payout = multiplier * bet
         
-        # 更新中奖线实际金额
-        for wl in winning_lines:
-            wl.amount = wl.amount * bet
+        # 中奖线实际金额 = 线倍数 × 下注
+        winning_lines = [
+            WinningLine(line_id=line_id, amount=line_mult * bet, symbol=symbol, count=count)
+            for line_id, symbol, count, line_mult in self.win_patterns[win_id]
+        ]
             
         # 更新连败计数
         new_fail_streak = 0 if total_payout > 0 else fail_streak + 1
@@ -401,26 +523,168 @@ class OutcomeEngine:
             "fail_streak": new_fail_streak
         }
 
-    def _select_bucket(self, bet: float, balance: float, initial_balance: float, total_spins: int = 0, fail_streak: int = 0, ignore_safety: bool = False, max_historical_balance: float = 0, historical_rtp: float = 0.0, runtime_config: Optional[Dict[str, Any]] = None) -> str:
-        
-        # Determine settings and buckets_config to use
-        settings = self.settings
-        buckets_config = self.buckets_config
-        
+    def simulate_batch(self, bet: float, spins: int, initial_balance: Optional[float] = None, runtime_config: Optional[Dict[str, Any]] = None, record_history: bool = True, rng=None) -> Dict[str, Any]:
+        """
+        批量模拟 spins 次旋转，结果与逐次调用 spin(simulation_mode=True) 完全一致（相同随机数序列下逐位相同），
+        但不生成矩阵与中奖线，只累计统计量。
+        record_history 为 True 时返回每次旋转后的余额与 RTP 曲线（numpy 数组）。
+        multiplier_sum / multiplier_sq_sum 为单次倍数的和与平方和，多批结果可据此精确合并均值与方差。
+        """
+        run = self.iter_simulation(bet, spins, initial_balance, runtime_config, record_history=record_history, rng=rng)
+        balance_chunks, rtp_chunks = [], []
+        while True:
+            try:
+                balances, rtps = next(run)
+            except StopIteration as done:
+                result = done.value
+                break
+            balance_chunks.append(balances)
+            rtp_chunks.append(rtps)
+
+        if record_history:
+            result["balance_curve"] = np.concatenate(balance_chunks) if balance_chunks else np.empty(0)
+            result["rtp_curve"] = np.concatenate(rtp_chunks) if rtp_chunks else np.empty(0)
+        else:
+            result["balance_curve"] = result["rtp_curve"] = None
+        return result
+
+    def iter_simulation(self, bet: float, spins: int, initial_balance: Optional[float] = None, runtime_config: Optional[Dict[str, Any]] = None, chunk_size: int = 65536, record_history: bool = True, rng=None):
+        """
+        simulate_batch 的分段版本（生成器）：每 chunk_size 次旋转产出一段 (balance_curve, rtp_curve)，
+        生成器结束时返回汇总统计（StopIteration.value）。内存只与 chunk_size 有关，与总旋转数无关。
+        record_history 为 False 时不产出曲线，只返回汇总。
+
+        与逐次调用 spin 相同，模拟不累计 total_spins，
+        因此整批内只有 PRD 结果会改变可选奖池，两种情况的选择表在循环前各取一次。
+        连败数、余额等状态保存在局部变量中，跨段延续。
+        """
+        if not self.is_ready:
+            raise RuntimeError("Engine not ready")
+        rng = rng or random
+        if initial_balance is None:
+            initial_balance = spins * bet
+
+        selector = self._selector(runtime_config)
+        settings = selector.settings
+        base_c = self._prd_base_c(settings, 0, 0.0)
+        candidates = {is_prd_win: selector.table(is_prd_win, 0, bet) for is_prd_win in (True, False)}
+        max_allowed_balance = selector.max_allowed_balance(initial_balance)
+
+        buckets = self.buckets
+        win_multipliers = self.win_multipliers
+        draw_bucket = selector.draw
+        random_value = rng.random
+        bucket_counts = {name: 0 for name in buckets}
+
+        balance = initial_balance
+        max_balance = min_balance = balance
+        total_wagered = 0
+        total_won = 0
+        fail_streak = max_fail_streak = 0
+        hits = 0
+        multiplier_sum = 0.0
+        multiplier_sq_sum = 0.0
+
+        if not record_history:
+            chunk_size = max(spins, 1)
+        for chunk_start in range(0, spins, chunk_size):
+            n = min(chunk_size, spins - chunk_start)
+            if record_history:
+                balance_curve = np.empty(n)
+                rtp_curve = np.empty(n)
+
+            for i in range(n):
+                win_prob = base_c * (fail_streak + 1)
+                if win_prob > 1.0: win_prob = 1.0
+                table = candidates[random_value() < win_prob]
+                if table.total == 0:
+                    bucket_name = "Loss_Random"
+                else:
+                    bucket_name = draw_bucket(table, bet, balance, max_allowed_balance, rng)
+                bucket = buckets[bucket_name]
+                if not bucket:
+                    bucket_name = "Loss_Random"
+                    bucket = buckets[bucket_name]
+                idx = bucket.draw_within(bet, balance, max_allowed_balance, rng)
+                if idx is None:
+                    bucket_name = "Loss_Random"
+                    bucket = buckets[bucket_name]
+                    idx = bucket.draw(rng)
+                bucket_counts[bucket_name] += 1
+
+                multiplier = win_multipliers[bucket.win_ids[idx]]
+                multiplier_sum += multiplier
+                multiplier_sq_sum += multiplier * multiplier
+                total_payout = multiplier * bet
+                balance += float(total_payout - bet)
+                total_wagered += bet
+                total_won += total_payout
+                if total_payout > 0:
+                    hits += 1
+                    fail_streak = 0
+                else:
+                    fail_streak += 1
+                    if fail_streak > max_fail_streak: max_fail_streak = fail_streak
+                if balance > max_balance: max_balance = balance
+                if balance < min_balance: min_balance = balance
+
+                if record_history:
+                    balance_curve[i] = balance
+                    rtp_curve[i] = total_won / total_wagered
+
+            if record_history:
+                yield balance_curve, rtp_curve
+
+        return {
+            "spins": spins,
+            "initial_balance": initial_balance,
+            "final_balance": balance,
+            "max_balance": max_balance,
+            "min_balance": min_balance,
+            "total_wagered": total_wagered,
+            "total_won": total_won,
+            "rtp": (total_won / total_wagered) if total_wagered > 0 else 0,
+            "hits": hits,
+            "hit_rate": hits / spins if spins > 0 else 0,
+            "max_fail_streak": max_fail_streak,
+            "multiplier_sum": multiplier_sum,
+            "multiplier_sq_sum": multiplier_sq_sum,
+            "bucket_counts": bucket_counts,
+        }
+
+    def _selector(self, runtime_config: Optional[Dict[str, Any]] = None) -> BucketSelector:
+        """
+        返回本次使用的已编译选择器；会话配置覆盖引擎配置。
+        带 version 的会话配置（SessionConfig）按版本缓存，配置不变时不重新编译；普通 dict 每次编译。
+        """
+        if not runtime_config:
+            key = None
+        else:
+            key = getattr(runtime_config, "version", None)
+            if key is None:
+                return BucketSelector(runtime_config.get("settings", self.settings),
+                                      runtime_config.get("buckets", self.buckets_config), self.min_multipliers)
+
+        with self._selectors_lock:
+            selector = self._selectors.get(key)
+            if selector is not None:
+                self._selectors.move_to_end(key)
+                return selector
+
         if runtime_config:
-            settings = runtime_config.get("settings", self.settings)
-            raw_buckets = runtime_config.get("buckets", self.buckets_config)
-            # 简单的运行时规范化 (确保有 min_win/max_win)
-            buckets_config = {}
-            for k, v in raw_buckets.items():
-                cfg = v.copy()
-                if "min" in cfg and "min_win" not in cfg: cfg["min_win"] = cfg["min"]
-                if "max" in cfg and "max_win" not in cfg: cfg["max_win"] = cfg["max"]
-                if "min_win" not in cfg: cfg["min_win"] = 0
-                if "max_win" not in cfg: cfg["max_win"] = 0
-                buckets_config[k] = cfg
+            selector = BucketSelector(runtime_config.get("settings", self.settings),
+                                      runtime_config.get("buckets", self.buckets_config), self.min_multipliers)
+        else:
+            selector = BucketSelector(self.settings, self.buckets_config, self.min_multipliers)
+        with self._selectors_lock:
+            self._selectors[key] = selector
+            while len(self._selectors) > SELECTOR_CACHE_SIZE:
+                self._selectors.popitem(last=False)
+        return selector
 
-        # 1. PRD逻辑：决定本次是否中奖
+    @staticmethod
+    def _prd_base_c(settings: Dict[str, Any], total_spins: int, historical_rtp: float) -> float:
+        """PRD 基础 C 值，已按动态 RTP 调控修正；中奖概率 = C × (连败数 + 1)，封顶 1.0"""
         base_c = settings.get("base_c_value", 0.05)
         
         # 动态 RTP 调控 (RTP Control)
@@ -444,96 +708,30 @@ class OutcomeEngine:
                 base_c *= 0.5     # 降低中奖率
             elif rtp_ratio > 1.05: # 轻微盈利
                 base_c *= 0.6     # 微调
+        return base_c
 
-        win_prob = base_c * (fail_streak + 1)
+    def _select_bucket(self, bet: float, balance: float, initial_balance: float, total_spins: int = 0, fail_streak: int = 0, ignore_safety: bool = False, max_historical_balance: float = 0, historical_rtp: float = 0.0, runtime_config: Optional[Dict[str, Any]] = None, selector: Optional[BucketSelector] = None) -> str:
+        """selector 为调用方已取得的编译选择器（避免重复编译），未提供时按 runtime_config 获取"""
+        selector = selector or self._selector(runtime_config)
+        settings = selector.settings
+
+        # 1. PRD逻辑：决定本次是否中奖
+        win_prob = self._prd_base_c(settings, total_spins, historical_rtp) * (fail_streak + 1)
         
         # 安全：中奖概率最大为1.0
         if win_prob > 1.0: win_prob = 1.0
         
         is_prd_win = random.random() < win_prob
         
-        # 2. 过滤可用奖池
-        weights = {k: v["weight"] for k, v in buckets_config.items()}
-        
-        # PRD判定为未中奖，只允许Loss奖池
-        if not is_prd_win:
-            for k in list(weights.keys()):
-                if k.startswith("Win_Tier"):
-                    weights[k] = 0
-        else:
-            # PRD判定为中奖，只允许Win奖池
-            for k in list(weights.keys()):
-                if k.startswith("Loss_"):
-                    weights[k] = 0
-        
-        # 3. 进度分层检查
-        progress_tiers = settings.get("progress_tiers", [])
-        if progress_tiers:
-            current_tier = None
-            # 找到满足当前旋转数的最高层
-            for tier in sorted(progress_tiers, key=lambda x: x["min_spins"]):
-                if total_spins >= tier["min_spins"]:
-                    current_tier = tier
-                else:
-                    break
-            
-            if current_tier:
-                allowed = current_tier.get("allowed_buckets", ["ALL"])
-                if "ALL" not in allowed:
-                    for k in list(weights.keys()):
-                        if k not in allowed:
-                            weights[k] = 0
-
-        # 4. 高额投注检查
-        high_roller_threshold = settings.get("high_roller_threshold", 50.0)
-        if bet < high_roller_threshold:
-            # 移除高层奖池
-            if "Win_Tier_4" in weights: weights["Win_Tier_4"] = 0
-            if "Win_Tier_5" in weights: weights["Win_Tier_5"] = 0
+        # 2. 过滤可用奖池（PRD / 进度分层 / 高额投注）
+        table = selector.table(is_prd_win, total_spins, bet)
+        if table.total == 0:
+            return "Loss_Random"
             
-        # 5. RTP安全上限（天花板）
+        # 3. RTP安全上限（天花板）
         # 逻辑：严格按照初始余额限制最大余额。
         # 模拟和真实旋转完全共用此逻辑。
+        max_allowed_balance = selector.max_allowed_balance(initial_balance)
         
-        max_win_ratio = settings.get("max_win_ratio", 1.2)
-        max_allowed_balance = initial_balance * max_win_ratio
-        
-        # 归一化权重
-        total_weight = sum(weights.values())
-        
-        # 兜底：PRD判定为中奖但所有Win奖池被过滤，强制转Loss
-        if total_weight == 0:
-            if is_prd_win:
-                weights = {k: v["weight"] for k, v in buckets_config.items() if k.startswith("Loss_")}
-                total_weight = sum(weights.values())
-                if total_weight == 0: return "Loss_Random"
-            else:
-                return "Loss_Random"
-        
-        # 6. 选择循环（最多尝试3次）
-        for _ in range(3):
-            r = random.uniform(0, total_weight)
-            current = 0
-            selected = "Loss_Random"
-            for k, w in weights.items():
-                current += w
-                if r <= current:
-                    selected = k
-                    break
-            
-            # 校验安全上限——现在无论模拟还是真实都强制执行
-            max_potential_win = buckets_config[selected]["max_win"] * bet
-            if balance + max_potential_win > max_allowed_balance:
-                # 超出风险，尝试更低层
-                total_weight -= weights[selected]
-                weights[selected] = 0
-                if total_weight <= 0: 
-                    return "Loss_Random"
-                continue
-            
-            return selected
-                
-        return "Loss_Random"
-
-# 单例实例
-engine = OutcomeEngine()
+        # 4. 按权重抽取（至少有一个结果不超过上限的奖池才可选）
+        return selector.draw(table, bet, balance, max_allowed_balance)
@@ -0,0 +1,71 @@
+"""
+服务端玩家状态：每个会话一份，每次旋转 O(1) 更新，直接作为 _select_bucket 的输入，
+不再信任客户端传入的 fail_streak / total_spins，也不再每次由总投注/总派彩重新计算 RTP。
+
+    rtp          —— 会话累计 RTP（含初始虚拟样本 100 投注 / 95 派彩，防止前几局波动过大），用于展示
+    window_rtp   —— 衰减窗口 RTP：投注与派彩各自按 (1 - 1/window) 衰减累加，约等于最近 window 次旋转的 RTP，
+                    初始虚拟样本同样随窗口衰减；用于 RTP 调控（_prd_base_c）
+"""
+
+from typing import Any, Dict, Optional
+
+PRIOR_BET = 100.0
+PRIOR_PAYOUT = 95.0
+
+
+class PlayerState:
+    __slots__ = ("spins", "fail_streak", "max_fail_streak", "total_bet", "total_payout",
+                 "window", "_decay", "window_bet", "window_payout", "max_balance")
+
+    def __init__(self, window: int = 200):
+        self.spins = 0
+        self.fail_streak = 0
+        self.max_fail_streak = 0
+        self.total_bet = 0.0
+        self.total_payout = 0.0
+        self.window = window
+        self._decay = 1.0 - 1.0 / window
+        self.window_bet = PRIOR_BET
+        self.window_payout = PRIOR_PAYOUT
+        self.max_balance: Optional[float] = None
+
+    @property
+    def rtp(self) -> float:
+        return (self.total_payout + PRIOR_PAYOUT) / (self.total_bet + PRIOR_BET)
+
+    @property
+    def window_rtp(self) -> float:
+        return self.window_payout / self.window_bet if self.window_bet > 0 else PRIOR_PAYOUT / PRIOR_BET
+
+    def observe_balance(self, balance: float):
+        """记录旋转前的余额（客户端钱包），维护历史最高余额"""
+        if self.max_balance is None or balance > self.max_balance:
+            self.max_balance = balance
+
+    def record(self, bet: float, payout: float, balance: float):
+        """一次旋转结束后更新状态；balance 为旋转后的余额"""
+        self.spins += 1
+        self.total_bet += bet
+        self.total_payout += payout
+        self.window_bet = self.window_bet * self._decay + bet
+        self.window_payout = self.window_payout * self._decay + payout
+        if payout > 0:
+            self.fail_streak = 0
+        else:
+            self.fail_streak += 1
+            if self.fail_streak > self.max_fail_streak:
+                self.max_fail_streak = self.fail_streak
+        self.observe_balance(balance)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "spins": self.spins,
+            "fail_streak": self.fail_streak,
+            "max_fail_streak": self.max_fail_streak,
+            "total_bet": self.total_bet,
+            "total_payout": self.total_payout,
+            "rtp": self.rtp,
+            "window_rtp": self.window_rtp,
+            "window": self.window,
+            "max_balance": self.max_balance,
+        }
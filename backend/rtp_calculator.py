@@ -0,0 +1,199 @@
+"""
+基础游戏 RTP 的精确计算（停止位置均匀分布，即不考虑奖池权重与 PRD 调控时的“卷轴数学”）。
+
+5 列卷轴相互独立，且每列只通过其 3 格窗口影响结果，因此按列做动态规划：
+状态 = (每条中奖线的进度, 已露出的 Scatter 数)，每列按该列各窗口的出现频率批量（NumPy）转移，等价状态合并。
+每条线的进度为：仍全是 WILD / 正在匹配某符号 / 已断开（记录符号与连线数）。
+最终按中奖线顺序累加每条线的倍数，保证与引擎的浮点结果逐位一致（奖池分类边界不会因舍入而偏移）。
+"""
+
+from collections import Counter, defaultdict
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from bucket_builder import COLS, ROWS, ReelEvaluator, unique_rows
+
+
+def _normalized_buckets(config: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """规范化奖池配置（兼容 min/max 与 min_win/max_win），不修改原配置"""
+    buckets = {}
+    for k, v in config.get("buckets", {}).items():
+        cfg = dict(v)
+        cfg["min_win"] = v.get("min_win", v.get("min", 0))
+        cfg["max_win"] = v.get("max_win", v.get("max", 0))
+        buckets[k] = cfg
+    return buckets
+
+
+def _column_windows(evaluator: ReelEvaluator, c: int) -> Counter:
+    """第 c 列每种窗口（3 个符号编码）出现的次数"""
+    reel_len = evaluator.reel_len
+    return Counter(
+        tuple(int(evaluator.reel_table[c, (stop + r) % reel_len]) for r in range(ROWS))
+        for stop in range(reel_len)
+    )
+
+
+def line_hit_probabilities(evaluator: ReelEvaluator) -> Dict[Tuple[int, int], float]:
+    """
+    每条线上 (匹配符号, 连线数) 的概率之和，即每次旋转中该组合的期望中奖线数。
+    单条线在每列只读一格，而停止位置均匀，所以该格的分布就是该列卷轴的符号频率，各列独立。
+    """
+    n_symbols = len(evaluator.symbol_names)
+    freq = np.zeros((COLS, n_symbols))
+    for c in range(COLS):
+        freq[c] = np.bincount(evaluator.reel_table[c], minlength=n_symbols) / evaluator.reel_len
+    wild = evaluator.wild_code
+
+    hits: Dict[Tuple[int, int], float] = defaultdict(float)
+    for coords in evaluator.line_coords:
+        length = len(coords)
+        if length == 0:
+            continue
+        # 线的列顺序可能不是 0..4，按线上的位置取对应列的频率
+        cols = [freq[c] for _, c in coords]
+        for symbol in range(n_symbols):
+            if symbol == wild:
+                continue
+            for count in range(1, length + 1):
+                # 前 a 格为 WILD，第 a+1 格为 symbol，其后到第 count 格为 symbol 或 WILD，第 count+1 格断开
+                prob = 0.0
+                for a in range(count):
+                    p = 1.0
+                    for j in range(a):
+                        p *= cols[j][wild]
+                    p *= cols[a][symbol]
+                    for j in range(a + 1, count):
+                        p *= cols[j][symbol] + cols[j][wild]
+                    prob += p
+                if count < length:
+                    prob *= 1.0 - cols[count][symbol] - cols[count][wild]
+                hits[(symbol, count)] += prob
+        all_wild = 1.0
+        for col in cols:
+            all_wild *= col[wild]
+        hits[(wild, length)] += all_wild
+    return dict(hits)
+
+
+def outcome_distribution(evaluator: ReelEvaluator) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    总倍数与 Near Miss 标记的精确联合分布。
+    返回 (multipliers, is_near_miss, probabilities)，每个 (倍数, Near Miss) 组合一项。
+    """
+    # 每条线在每一列读取的行（线不经过的列为 -1）
+    line_rows = np.full((len(evaluator.line_coords), COLS), -1, dtype=np.intp)
+    for j, (line_id, coords) in enumerate(zip(evaluator.line_ids, evaluator.line_coords)):
+        if [int(c) for c in coords[:, 1]] != list(range(len(coords))):
+            raise ValueError(f"Line {line_id}: only left-to-right lines with one cell per reel are supported")
+        line_rows[j, :len(coords)] = coords[:, 0]
+    line_lengths = np.array([len(coords) for coords in evaluator.line_coords], dtype=np.intp)
+    n_lines = len(line_lengths)
+    wild, scatter = evaluator.wild_code, evaluator.scatter_code
+    pay = evaluator.pay
+    n_symbols, max_count = pay.shape
+
+    # 线进度编码：0 = PENDING；1 + 符号 = 正在匹配该符号；
+    # RESOLVED + 符号 * max_count + 连线数 = 已断开（倍数为 pay[符号, 连线数]）
+    resolved = 1 + n_symbols
+    # 状态矩阵：每行一个状态，前 n_lines 列为线进度，最后一列为 Scatter 数（封顶 3）
+    states = np.zeros((1, n_lines + 1), dtype=np.int32)
+    probs = np.ones(1)
+
+    def column(c: int) -> Tuple[np.ndarray, np.ndarray]:
+        windows = _column_windows(evaluator, c)
+        cells = np.array(list(windows.keys()), dtype=np.int32)  # (m, 3)
+        return cells, np.array(list(windows.values()), dtype=np.float64) / evaluator.reel_len
+
+    def step(code: np.ndarray, cell: np.ndarray, c: int) -> np.ndarray:
+        """线进度 code 在第 c 列遇到符号 cell 后的新进度"""
+        symbol = code - 1
+        matching = (code >= 1) & (code < resolved)
+        keeps = (cell == symbol) | (cell == wild)
+        return np.where(code == 0, np.where(cell == wild, 0, cell + 1),
+                        np.where(matching & ~keeps, resolved + symbol * max_count + c, code))
+
+    def final_pay(code: np.ndarray, length: int) -> np.ndarray:
+        """旋转结束后线进度对应的倍数"""
+        alive_symbol = np.where(code == 0, wild, code - 1)
+        dead_symbol, dead_count = np.divmod(code - resolved, max_count)
+        return np.where(code >= resolved,
+                        pay[np.clip(dead_symbol, 0, n_symbols - 1), np.clip(dead_count, 0, max_count - 1)],
+                        pay[np.clip(alive_symbol, 0, n_symbols - 1), length])
+
+    # 前 4 列：对所有 (状态, 窗口) 组合批量转移，再合并等价状态
+    for c in range(COLS - 1):
+        window_cells, window_probs = column(c)
+        n, m = len(states), len(window_cells)
+        cur = np.repeat(states, m, axis=0)
+        cells = np.tile(window_cells, (n, 1))
+        new = cur.copy()
+        for j in range(n_lines):
+            if line_rows[j, c] >= 0:
+                new[:, j] = step(cur[:, j], cells[:, line_rows[j, c]], c)
+        new[:, n_lines] = np.minimum(cur[:, n_lines] + (cells == scatter).sum(axis=1), 3)
+
+        first, inverse = unique_rows(new)
+        probs = np.bincount(inverse, weights=np.repeat(probs, m) * np.tile(window_probs, n))
+        states = new[first]
+
+    # 最后一列：每条线的最终倍数只取决于 (该线进度, 窗口)，先按唯一进度建表再查表，
+    # 按中奖线顺序累加，与引擎的浮点累加顺序一致
+    c = COLS - 1
+    window_cells, window_probs = column(c)
+    multipliers = np.zeros((len(states), len(window_cells)))
+    for j in range(n_lines):
+        codes, idx = np.unique(states[:, j], return_inverse=True)
+        if line_rows[j, c] >= 0:
+            after = step(codes[:, None], window_cells[None, :, line_rows[j, c]], c)
+        else:
+            after = np.repeat(codes[:, None], len(window_cells), axis=1)
+        multipliers += final_pay(after, line_lengths[j])[idx.reshape(-1)]
+    scatters = states[:, n_lines, None] + (window_cells == scatter).sum(axis=1)[None, :]
+    probs = probs[:, None] * window_probs[None, :]
+
+    # 按 (倍数, Near Miss) 聚合
+    values, value_idx = np.unique(multipliers.reshape(-1), return_inverse=True)
+    keys, inverse = np.unique(value_idx.reshape(-1) * 2 + (scatters.reshape(-1) == 2), return_inverse=True)
+    return values[keys // 2], (keys % 2).astype(bool), np.bincount(inverse.reshape(-1), weights=probs.reshape(-1))
+
+
+def calculate_rtp(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    精确计算基础游戏的 RTP、命中率、方差以及每个奖池的概率质量和平均倍数。
+    结果与穷举所有停止位置一致，但不需要枚举窗口组合。
+    """
+    evaluator = ReelEvaluator(config)
+    buckets_config = _normalized_buckets(config)
+    multipliers, near_miss, probs = outcome_distribution(evaluator)
+
+    rtp = float((multipliers * probs).sum())
+    variance = float((multipliers ** 2 * probs).sum()) - rtp ** 2
+    hit_frequency = float(probs[multipliers > 0].sum())
+
+    labels = ReelEvaluator.classify(multipliers, near_miss, buckets_config)
+    buckets = {}
+    for i, name in enumerate(buckets_config):
+        mass = float(probs[labels == i].sum())
+        weighted = float((multipliers[labels == i] * probs[labels == i]).sum())
+        buckets[name] = {
+            "probability": mass,
+            "avg_multiplier": weighted / mass if mass > 0 else 0.0,
+        }
+
+    symbol_hits = defaultdict(dict)
+    for (symbol, count), prob in sorted(line_hit_probabilities(evaluator).items()):
+        if count >= 3 and prob > 0:
+            symbol_hits[evaluator.symbol_names[symbol]][str(count)] = prob
+
+    return {
+        "rtp": rtp,
+        "hit_frequency": hit_frequency,
+        "variance": variance,
+        "std_dev": max(variance, 0.0) ** 0.5,
+        "max_multiplier": float(multipliers[probs > 0].max()) if len(probs) else 0.0,
+        "buckets": buckets,
+        "line_hits": dict(symbol_hits),
+        "distinct_outcomes": len(probs),
+    }
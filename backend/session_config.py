@@ -0,0 +1,93 @@
+"""
+会话配置（写时复制）：卷轴、符号、赔付表、赔付线等结构化配置在所有会话间共享，
+会话只单独保存可调的部分（settings 与奖池配置）。
+SessionConfig 是只读映射，创建后不再修改：新会话直接引用默认配置对象，
+POST /config 时生成新的 SessionConfig（结构未变则继续共享原来的结构化部分）。
+"""
+
+import itertools
+from collections.abc import Mapping
+from functools import cached_property
+from typing import Any, Dict, Iterator, Optional
+
+from outcome_engine import compute_config_hash
+
+# 会话可调、放在覆盖层中的配置项
+OVERLAY_KEYS = ("settings", "buckets")
+# 只用于展示、不保存到会话配置中的奖池字段
+DERIVED_BUCKET_FIELDS = ("real_avg_mult",)
+
+_versions = itertools.count(1)
+
+
+class SessionConfig(Mapping):
+    """
+    base（共享，只读）+ overlay（settings / buckets）组成的配置视图。
+    version 在进程内唯一，配置内容变化时总是得到新的 version，可作为派生数据的缓存键。
+    """
+
+    def __init__(self, base: Dict[str, Any], overlay: Optional[Dict[str, Any]] = None):
+        self._base = base
+        self._overlay = overlay or {}
+        self.version = next(_versions)
+
+    @classmethod
+    def from_dict(cls, config: Dict[str, Any], current: Optional["SessionConfig"] = None) -> "SessionConfig":
+        """
+        由完整配置（如 POST /config 的请求体）生成会话配置。
+        结构化部分与 current 相同时沿用 current 的共享部分，只保存 settings / buckets。
+        """
+        structure = {k: v for k, v in config.items() if k not in OVERLAY_KEYS}
+        if current is not None and structure == current.structure():
+            base = current._base
+        else:
+            base = structure
+        overlay = {}
+        if "settings" in config:
+            overlay["settings"] = dict(config["settings"] or {})
+        if "buckets" in config:
+            overlay["buckets"] = {
+                k: {f: val for f, val in v.items() if f not in DERIVED_BUCKET_FIELDS}
+                for k, v in config["buckets"].items()
+            }
+        return cls(base, overlay)
+
+    def structure(self) -> Dict[str, Any]:
+        """结构化部分（不含 settings / buckets）"""
+        return {k: v for k, v in self._base.items() if k not in OVERLAY_KEYS}
+
+    @cached_property
+    def config_hash(self) -> str:
+        return compute_config_hash(self)
+
+    def to_dict(self, bucket_stats: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """
+        展开为普通 dict：结构化部分仍为共享引用，settings 与每个奖池配置为副本，调用方可以修改。
+        bucket_stats 给出时把各奖池的实际平均倍数写入 real_avg_mult（用于 GET /config）。
+        """
+        result = dict(self)
+        if "settings" in result:
+            result["settings"] = dict(result["settings"])
+        if "buckets" in result:
+            result["buckets"] = {k: dict(v) for k, v in result["buckets"].items()}
+            for k, avg_mult in (bucket_stats or {}).items():
+                if k in result["buckets"]:
+                    result["buckets"][k]["real_avg_mult"] = avg_mult
+        return result
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._overlay:
+            return self._overlay[key]
+        return self._base[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._base
+        for key in self._overlay:
+            if key not in self._base:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self._base) + sum(1 for key in self._overlay if key not in self._base)
+
+    def __repr__(self) -> str:
+        return f"SessionConfig(version={self.version}, overlay={sorted(self._overlay)})"
@@ -0,0 +1,149 @@
+"""
+会话存储：按最近访问排序（LRU），空闲超过 idle_ttl 的会话由后台清扫线程移除，
+会话数超过 max_sessions 时立即淘汰最久未访问的会话，内存不会随无头请求无限增长。
+清扫时抽样估算每个会话的内存占用（不含共享的引擎），供 /health 展示。
+"""
+
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+# 估算占用时跳过的会话属性（多个会话共享的对象；会话配置为写时复制，默认与其他会话共享）
+SHARED_ATTRS = ("engine", "config")
+
+
+def estimate_size(obj: Any, seen: Optional[set] = None) -> int:
+    """递归估算对象占用的字节数（dict / list / tuple / set 及普通对象的 __dict__），同一对象只计一次"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(obj.__dict__, seen)
+    return size
+
+
+def session_size(session: Any) -> int:
+    """单个会话的占用（不含 SHARED_ATTRS 中的共享对象）"""
+    seen = set()
+    return sys.getsizeof(session) + sum(
+        estimate_size(v, seen) for k, v in vars(session).items() if k not in SHARED_ATTRS
+    )
+
+
+class SessionStore:
+    def __init__(self, factory: Callable[[str], Any], idle_ttl: float = 1800.0, max_sessions: int = 10000,
+                 sweep_interval: float = 60.0, size_sample: int = 100):
+        self.factory = factory
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self.size_sample = size_sample
+        self._sessions: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self._footprint: Dict[str, Any] = {}
+
+    def get_or_create(self, session_id: str) -> Any:
+        """取出会话并刷新访问时间；不存在时创建（超出上限时淘汰最久未访问的会话）"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = now
+                self._sessions.move_to_end(session_id)
+                return session
+
+        # 在锁外创建（可能需要复制配置、计算哈希），插入时再检查一次
+        new_session = self.factory(session_id)
+        with self._lock:
+            session = self._sessions.setdefault(session_id, new_session)
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+            if session is new_session:
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted_lru += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[Any]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def sweep(self) -> int:
+        """移除空闲超过 idle_ttl 的会话，并更新内存占用统计；返回移除数"""
+        cutoff = time.time() - self.idle_ttl
+        removed = 0
+        with self._lock:
+            # 按访问顺序排列，遇到第一个未过期的会话即可停止
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if session.last_access >= cutoff:
+                    break
+                self._sessions.popitem(last=False)
+                removed += 1
+            self.evicted_idle += removed
+            snapshot = list(self._sessions.values())
+
+        sample = random.sample(snapshot, min(self.size_sample, len(snapshot)))
+        sizes = [session_size(s) for s in sample]
+        avg = sum(sizes) / len(sizes) if sizes else 0
+        self._footprint = {
+            "bytes_per_session_avg": round(avg),
+            "bytes_per_session_max": max(sizes) if sizes else 0,
+            "bytes_total_estimate": round(avg * len(snapshot)),
+            "sampled": len(sizes),
+            "measured_at": time.time(),
+        }
+        return removed
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[SessionStore] sweep failed: {e}")
+
+    def start_sweeper(self):
+        if self._sweeper is None or not self._sweeper.is_alive():
+            self._stop.clear()
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "live": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.idle_ttl,
+            "created": self.created,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru,
+            **self._footprint,
+        }
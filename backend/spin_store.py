@@ -0,0 +1,438 @@
+"""
+旋转历史存储（SQLite，WAL 模式），供 /history 与 /history/stats 查询。
+
+    spins          —— 每次旋转一行：(session, seq) 为主键的聚簇表（WITHOUT ROWID），
+                      同一会话的记录在磁盘上连续，按会话分页与按序号取点都是主键查找
+    rollup         —— 按 (session, bucket) 增量维护的次数 / 命中 / 投注 / 派彩 / 最大延迟；session = 0 为全局
+    latency_hist   —— 按 (session, bin) 增量维护的延迟对数直方图（每个 bin 约 5%），用于估计分位数
+
+统计查询只读汇总表，与总行数无关；RTP 曲线按等间隔序号做主键查找，不扫描会话的全部记录。
+写入与 GameLogger 相同：record 只放入队列，后台线程有数据即按批（一个事务）写入。
+多个进程（如多 worker 的 uvicorn）可以共享同一个数据库：每批以 BEGIN IMMEDIATE 取得写锁后，
+再从数据库读出各会话当前的序号分配 seq，进程之间不会冲突；个别行写入失败时只跳过该行，不丢弃整批。
+数据库文件在第一次写入或查询时才创建/打开，创建实例（导入 app）时不访问磁盘。
+"""
+
+import logging
+import math
+import os
+import queue
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("SpinStore")
+
+GLOBAL_SESSION = 0
+LATENCY_BINS_PER_E = 20  # 延迟直方图分辨率：bin = floor(ln(1 + ms) × 20)
+MAX_CURVE_POINTS = 1000
+
+_STOP = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    spins INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS spins (
+    session INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    bet REAL NOT NULL,
+    payout REAL NOT NULL,
+    bucket INTEGER NOT NULL,
+    fail_streak INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    rtp REAL NOT NULL,
+    PRIMARY KEY (session, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup (
+    session INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    spins INTEGER NOT NULL,
+    hits INTEGER NOT NULL,
+    bet REAL NOT NULL,
+    payout REAL NOT NULL,
+    latency_max REAL NOT NULL,
+    PRIMARY KEY (session, bucket)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latency_hist (
+    session INTEGER NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (session, bin)
+) WITHOUT ROWID;
+"""
+
+
+def latency_bin(latency_ms: float) -> int:
+    return int(math.log1p(max(latency_ms, 0.0)) * LATENCY_BINS_PER_E)
+
+
+def bin_value(b: int) -> float:
+    """bin 的代表值（对数中点）"""
+    return math.expm1((b + 0.5) / LATENCY_BINS_PER_E)
+
+
+class SpinStore:
+    def __init__(self, filename: str = "spin_history.db", batch_size: int = 1000, max_queue: int = 100000):
+        base_dir = os.path.dirname(__file__)
+        self.path = os.path.join(base_dir, filename)
+        self.batch_size = batch_size
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._committed = threading.Condition(self._lock)
+        self._enqueued = 0
+        self._done = 0
+        self.dropped = 0  # 队列已满丢弃的记录
+        self.failed = 0  # 写入数据库失败的记录
+        self._local = threading.local()
+        self._writer: Optional[threading.Thread] = None
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开连接；第一次打开时建表（CREATE TABLE IF NOT EXISTS，多进程并发执行也安全）"""
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    conn.commit()
+                    self._schema_ready = True
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """每个线程一个只读用途的连接（WAL 下读写互不阻塞）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # --- 写入 ---
+
+    def record(self, session_key: str, ts: float, bet: float, payout: float, bucket: str,
+               fail_streak: int, latency_ms: float, rtp: float):
+        """记录一次旋转（不阻塞）；队列已满时丢弃并计数"""
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name="spin-store", daemon=True)
+                self._writer.start()
+            try:
+                self._queue.put_nowait((session_key, ts, bet, payout, bucket, fail_streak, latency_ms, rtp))
+                self._enqueued += 1
+            except queue.Full:
+                self.dropped += 1
+
+    def flush(self, timeout: float = 1.0) -> bool:
+        """等待此前 record 的所有记录提交（读己之写），返回是否在 timeout 内完成"""
+        with self._committed:
+            target = self._enqueued
+            return self._committed.wait_for(lambda: self._done >= target, timeout=timeout)
+
+    def _run(self):
+        conn: Optional[sqlite3.Connection] = None
+        session_ids: Dict[str, int] = {}
+        bucket_ids: Dict[str, int] = {}
+        stop = False
+        while not stop:
+            # 阻塞等待第一条，然后取走已排队的（最多 batch_size 条）：负载低时延迟低，负载高时自然成批
+            item = self._queue.get()
+            batch = []
+            while item is not _STOP:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            stop = item is _STOP
+            # 任何异常都只影响这一批：计入 failed，_done 照常前进，flush 不会一直等待
+            try:
+                if batch:
+                    if conn is None:
+                        conn = self._connect()
+                        conn.isolation_level = None  # 自行管理事务（BEGIN IMMEDIATE / COMMIT）
+                    self._write_batch(conn, batch, session_ids, bucket_ids)
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(batch)
+                logger.exception(f"Dropped spin history batch of {len(batch)}: {e}")
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                session_ids.clear()
+                bucket_ids.clear()
+            finally:
+                with self._committed:
+                    self._done += len(batch)
+                    self._committed.notify_all()
+        if conn is not None:
+            conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[tuple],
+                     session_ids: Dict[str, int], bucket_ids: Dict[str, int]):
+        """
+        写入一批。数据库错误（如等待写锁超时）时整批重试一次；
+        其他错误（如某一行的字段类型不对）时逐行重写，只跳过出错的行。仍失败的行计入 failed。
+        """
+        for attempt in range(2):
+            try:
+                self._write(conn, batch, session_ids, bucket_ids)
+                return
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                # 回滚的事务中新建的会话 / 奖池 id 已失效
+                session_ids.clear()
+                bucket_ids.clear()
+                if attempt == 0 and isinstance(e, sqlite3.Error):
+                    logger.warning(f"Spin history batch of {len(batch)} failed, retrying: {e}")
+                    continue
+                if len(batch) > 1 and not isinstance(e, sqlite3.Error):
+                    logger.warning(f"Spin history batch of {len(batch)} failed, writing row by row: {e}")
+                    for item in batch:
+                        self._write_batch(conn, [item], session_ids, bucket_ids)
+                    return
+                with self._lock:
+                    self.failed += len(batch)
+                logger.error(f"Dropped spin history batch of {len(batch)}: {e}")
+                return
+
+    @staticmethod
+    def _id_for(conn: sqlite3.Connection, table: str, key_column: str, key: str) -> int:
+        conn.execute(f"INSERT OR IGNORE INTO {table} ({key_column}) VALUES (?)", (key,))
+        return conn.execute(f"SELECT id FROM {table} WHERE {key_column} = ?", (key,)).fetchone()[0]
+
+    @staticmethod
+    def _next_seq(conn: sqlite3.Connection, session: int) -> int:
+        """会话的下一个序号（在写事务中读取，取 sessions.spins 与已有最大 seq 的较大者）"""
+        spins, max_seq = conn.execute(
+            "SELECT spins, (SELECT MAX(seq) FROM spins WHERE session = ?) FROM sessions WHERE id = ?",
+            (session, session)).fetchone()
+        return max(spins, max_seq or 0) + 1
+
+    def _write(self, conn: sqlite3.Connection, batch: List[tuple],
+               session_ids: Dict[str, int], bucket_ids: Dict[str, int]):
+        conn.execute("BEGIN IMMEDIATE")
+        next_seq: Dict[int, int] = {}
+        rows = []
+        for key, ts, bet, payout, bucket, fail_streak, latency_ms, rtp in batch:
+            session = session_ids.get(key)
+            if session is None:
+                session = session_ids[key] = self._id_for(conn, "sessions", "key", key)
+            bucket_id = bucket_ids.get(bucket)
+            if bucket_id is None:
+                bucket_id = bucket_ids[bucket] = self._id_for(conn, "buckets", "name", bucket)
+            seq = next_seq.get(session)
+            if seq is None:
+                seq = self._next_seq(conn, session)
+            next_seq[session] = seq + 1
+            rows.append((session, seq, ts, bet, payout, bucket_id, fail_streak, latency_ms, rtp))
+
+        try:
+            conn.execute("SAVEPOINT spins_batch")
+            conn.executemany("INSERT INTO spins VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("RELEASE spins_batch")
+        except sqlite3.IntegrityError as e:
+            # 逐行写入：冲突的行换成最新的序号重试一次，仍失败则跳过该行
+            conn.execute("ROLLBACK TO spins_batch")
+            conn.execute("RELEASE spins_batch")
+            logger.warning(f"Spin history batch conflict, writing row by row: {e}")
+            rows = self._insert_rows(conn, rows, next_seq)
+
+        # (session, bucket) -> [spins, hits, bet, payout, latency_max]；(session, bin) -> count
+        rollup: Dict[Tuple[int, int], List[float]] = defaultdict(lambda: [0, 0, 0.0, 0.0, 0.0])
+        hist: Dict[Tuple[int, int], int] = defaultdict(int)
+        for session, _, _, bet, payout, bucket_id, _, latency_ms, _ in rows:
+            b = latency_bin(latency_ms)
+            for sid in (session, GLOBAL_SESSION):
+                agg = rollup[(sid, bucket_id)]
+                agg[0] += 1
+                agg[1] += payout > 0
+                agg[2] += bet
+                agg[3] += payout
+                agg[4] = max(agg[4], latency_ms)
+                hist[(sid, b)] += 1
+
+        conn.executemany(
+            "INSERT INTO rollup VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (session, bucket) DO UPDATE SET spins = spins + excluded.spins, hits = hits + excluded.hits, "
+            "bet = bet + excluded.bet, payout = payout + excluded.payout, "
+            "latency_max = MAX(latency_max, excluded.latency_max)",
+            [(s, b, *agg) for (s, b), agg in rollup.items()])
+        conn.executemany(
+            "INSERT INTO latency_hist VALUES (?, ?, ?) "
+            "ON CONFLICT (session, bin) DO UPDATE SET count = count + excluded.count",
+            [(s, b, n) for (s, b), n in hist.items()])
+        conn.executemany("UPDATE sessions SET spins = MAX(spins, ?) WHERE id = ?",
+                         [(seq - 1, sid) for sid, seq in next_seq.items()])
+        conn.commit()
+        if len(rows) < len(batch):
+            # 提交后才计入：整批回滚重写时不重复计数
+            with self._lock:
+                self.failed += len(batch) - len(rows)
+
+    def _insert_rows(self, conn: sqlite3.Connection, rows: List[tuple], next_seq: Dict[int, int]) -> List[tuple]:
+        """
+        逐行插入，返回成功写入的行（序号可能已改变）；失败的行由 _write 在提交后计入 failed。
+        序号只在写入成功时前进，跳过的行不会在会话的序号中留下空洞。
+        """
+        inserted = []
+        first: Dict[int, int] = {}
+        cursor: Dict[int, int] = {}
+        for row in rows:
+            session = row[0]
+            first.setdefault(session, row[1])
+            seq = cursor.get(session, first[session])
+            for attempt in range(2):
+                try:
+                    conn.execute("INSERT INTO spins VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (session, seq, *row[2:]))
+                    inserted.append((session, seq, *row[2:]))
+                    cursor[session] = seq + 1
+                    break
+                except sqlite3.IntegrityError as e:
+                    if attempt == 0:
+                        # 序号被其他进程占用时换成最新的序号重试
+                        seq = max(seq, self._next_seq(conn, session))
+                    else:
+                        logger.error(f"Dropped spin history row for session {session}: {e}")
+        for session, seq in first.items():
+            next_seq[session] = cursor.get(session, seq)
+        return inserted
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中剩余的记录（服务关闭时调用）"""
+        writer = self._writer
+        if writer is None or not writer.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        writer.join(timeout)
+
+    # --- 查询 ---
+
+    def _session(self, session_key: str) -> Optional[Tuple[int, int]]:
+        return self._reader().execute("SELECT id, spins FROM sessions WHERE key = ?", (session_key,)).fetchone()
+
+    def history(self, session_key: str, limit: int = 100, before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """会话最近的旋转记录（新的在前）；before 为上一页最后一条的 Seq，用于向前翻页"""
+        session = self._session(session_key)
+        if session is None:
+            return []
+        rows = self._reader().execute(
+            "SELECT s.seq, s.ts, s.bet, s.payout, b.name, s.fail_streak, s.latency_ms, s.rtp "
+            "FROM spins s JOIN buckets b ON b.id = s.bucket "
+            "WHERE s.session = ? AND s.seq < ? ORDER BY s.seq DESC LIMIT ?",
+            (session[0], before if before is not None else session[1] + 1, limit)).fetchall()
+        return [{
+            "Seq": seq,
+            "Timestamp": datetime.fromtimestamp(ts).isoformat(),
+            "Bet": bet,
+            "Payout": payout,
+            "Is_Win": payout > 0,
+            "Bucket": bucket,
+            "Fail_Streak": fail_streak,
+            "Current_RTP": rtp,
+            "Latency_ms": round(latency_ms, 2),
+        } for seq, ts, bet, payout, bucket, fail_streak, latency_ms, rtp in rows]
+
+    def stats(self, session_key: Optional[str] = None, points: int = 200,
+              percentiles: Tuple[float, ...] = (50, 90, 99)) -> Dict[str, Any]:
+        """
+        汇总统计：旋转数、总投注/派彩、RTP、命中率、各奖池分布、延迟分位数；
+        指定会话时另外给出按等间隔序号取点的 RTP 曲线（最多 points 个点）。
+        """
+        conn = self._reader()
+        if session_key is None:
+            sid, spins = GLOBAL_SESSION, None
+        else:
+            session = self._session(session_key)
+            if session is None:
+                return {"scope": "session", "spins": 0, "total_bet": 0.0, "total_payout": 0.0, "rtp": 0.0,
+                        "hit_rate": 0.0, "buckets": {}, "latency_ms": {}, "rtp_curve": []}
+            sid, spins = session
+
+        rows = conn.execute(
+            "SELECT b.name, r.spins, r.hits, r.bet, r.payout, r.latency_max "
+            "FROM rollup r JOIN buckets b ON b.id = r.bucket WHERE r.session = ?", (sid,)).fetchall()
+        total_spins = sum(r[1] for r in rows)
+        total_bet = math.fsum(r[3] for r in rows)
+        total_payout = math.fsum(r[4] for r in rows)
+        result = {
+            "scope": "global" if session_key is None else "session",
+            "spins": total_spins,
+            "total_bet": total_bet,
+            "total_payout": total_payout,
+            "rtp": total_payout / total_bet if total_bet > 0 else 0.0,
+            "hit_rate": sum(r[2] for r in rows) / total_spins if total_spins else 0.0,
+            "buckets": {
+                name: {
+                    "spins": n,
+                    "share": n / total_spins,
+                    "hit_rate": hits / n if n else 0.0,
+                    "rtp_contribution": payout / total_bet if total_bet > 0 else 0.0,
+                }
+                for name, n, hits, bet, payout, _ in sorted(rows)
+            },
+            "latency_ms": self._latency_percentiles(conn, sid, percentiles, max((r[5] for r in rows), default=0.0)),
+        }
+        if session_key is not None:
+            result["rtp_curve"] = self._rtp_curve(conn, sid, spins, points)
+        return result
+
+    @staticmethod
+    def _latency_percentiles(conn: sqlite3.Connection, sid: int, percentiles: Tuple[float, ...],
+                             latency_max: float) -> Dict[str, float]:
+        hist = conn.execute("SELECT bin, count FROM latency_hist WHERE session = ? ORDER BY bin", (sid,)).fetchall()
+        total = sum(n for _, n in hist)
+        if total == 0:
+            return {}
+        result = {}
+        for p in percentiles:
+            rank = p / 100.0 * total
+            seen = 0
+            for b, n in hist:
+                seen += n
+                if seen >= rank:
+                    result[f"p{p:g}"] = round(min(bin_value(b), latency_max), 2)
+                    break
+        result["max"] = round(latency_max, 2)
+        return result
+
+    @staticmethod
+    def _rtp_curve(conn: sqlite3.Connection, sid: int, spins: int, points: int) -> List[Dict[str, float]]:
+        points = max(2, min(points, MAX_CURVE_POINTS))
+        if spins == 0:
+            return []
+        step = max(1, math.ceil((spins - 1) / (points - 1)))
+        seqs = list(range(1, spins + 1, step))
+        if seqs[-1] != spins:
+            seqs.append(spins)
+        placeholders = ",".join("?" * len(seqs))
+        rows = conn.execute(
+            f"SELECT seq, rtp FROM spins WHERE session = ? AND seq IN ({placeholders}) ORDER BY seq",
+            (sid, *seqs)).fetchall()
+        return [{"spin": seq, "rtp": rtp} for seq, rtp in rows]
+
+    def writer_stats(self) -> Dict[str, Any]:
+        """写入状态（用于 /health）"""
+        return {
+            "enqueued": self._enqueued,
+            "committed": self._done,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
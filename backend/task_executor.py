@@ -0,0 +1,116 @@
+"""
+有界执行器：把同步的 CPU 密集任务（旋转、模拟、RTP 计算）移出 FastAPI 事件循环。
+运行中 + 排队中的任务数达到上限时立即拒绝（ExecutorSaturated，接口返回 429），
+而不是无限排队、拖慢同一 worker 上的所有玩家。
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable
+
+
+class ExecutorSaturated(RuntimeError):
+    """执行器已满（运行中 + 排队中的任务数达到上限）"""
+
+
+class BoundedExecutor:
+    """
+    线程池 + 非阻塞的容量信号量。
+    max_workers 个任务同时运行，最多再排队 max_queue 个；超出时 submit 抛出 ExecutorSaturated。
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorSaturated(f"{self.name} executor saturated ({self.max_pending} tasks pending)")
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """在池中执行 fn 并等待结果（不阻塞事件循环）"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def iterate(self, factory: Callable[..., Iterable], *args, buffer: int = 8, idle_timeout: float = 30.0) -> AsyncIterator:
+        """
+        在池中运行同步生成器 factory(*args)，返回逐项消费的异步迭代器（用于流式响应）。
+        任务在调用时立即提交，因此执行器已满时在返回响应前就会抛出 ExecutorSaturated。
+        生产者最多领先消费者 buffer 项；消费者提前结束（如客户端断开）或 idle_timeout 秒未取数据时生产者停止。
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            waited = 0.0
+            while True:
+                try:
+                    future.result(timeout=0.5)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    waited += 0.5
+                    if stop.is_set() or waited >= idle_timeout:
+                        future.cancel()
+                        return False
+
+        def produce():
+            try:
+                for item in factory(*args):
+                    if not put((True, item)):
+                        return
+            except Exception as e:
+                put((False, e))
+                return
+            put((False, None))
+
+        self.submit(produce)
+
+        async def consume():
+            try:
+                while True:
+                    ok, item = await queue.get()
+                    if not ok:
+                        if item is not None:
+                            raise item
+                        return
+                    yield item
+            finally:
+                stop.set()
+
+        return consume()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
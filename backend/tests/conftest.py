@@ -0,0 +1,37 @@
+import copy
+import json
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from outcome_engine import OutcomeEngine  # noqa: E402
+
+# 测试用的小卷轴：默认配置的每列只取前 REEL_LEN 个符号，8^5 = 32768 个组合，标量路径也能在几秒内穷举
+REEL_LEN = 8
+
+
+@pytest.fixture(scope="session")
+def default_config():
+    with open(os.path.join(BACKEND_DIR, "game_config_v2.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="session")
+def small_config(default_config):
+    config = copy.deepcopy(default_config)
+    config["reel_sets"] = [reel[:REEL_LEN] for reel in config["reel_sets"]]
+    config["reels_length"] = REEL_LEN
+    config["settings"]["build_workers"] = 1
+    return config
+
+
+@pytest.fixture(scope="session")
+def engine(small_config):
+    """直接穷举构建奖池（不读写 backend/cache_*.bin）"""
+    engine = OutcomeEngine(config_override=copy.deepcopy(small_config), lazy=True)
+    engine.initialize_buckets()
+    return engine
@@ -0,0 +1,342 @@
+import asyncio
+import copy
+import json
+import random
+import threading
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import app as app_module
+from commentary_board import CommentaryBoard
+from logger import GameLogger
+from outcome_engine import OutcomeEngine
+from player_state import PlayerState
+from session_config import SessionConfig
+from session_store import SessionStore
+from spin_store import SpinStore
+from task_executor import BoundedExecutor
+
+LLM = {"provider": "openai", "api_key": "k", "model": "gpt-4o-mini"}
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path, engine, small_config):
+    """
+    用测试的小卷轴引擎作为默认配置的缓存引擎；会话、票据、审计日志与旋转历史都换成测试专用的实例，
+    评论不请求 LLM，新配置的奖池缓存写到临时目录。返回 app 模块（不运行 startup 事件）。
+    """
+    monkeypatch.setattr(OutcomeEngine, "_get_cache_path",
+                        lambda self: str(tmp_path / f"cache_{self._get_config_hash()}.bin"))
+    default = SessionConfig(copy.deepcopy(small_config))
+    monkeypatch.setattr(app_module, "DEFAULT_SESSION_CONFIG", default)
+    monkeypatch.setattr(app_module, "engine_cache", {default.config_hash: engine})
+    monkeypatch.setattr(app_module, "sessions", SessionStore(app_module.create_session))
+    monkeypatch.setattr(app_module, "commentary_board", CommentaryBoard())
+    game_logger = GameLogger(str(tmp_path / "game.csv"))
+    spin_store = SpinStore(str(tmp_path / "spins.db"))
+    monkeypatch.setattr(app_module, "game_logger", game_logger)
+    monkeypatch.setattr(app_module, "spin_store", spin_store)
+
+    async def commentary(config, spin_response, user_state, on_late=None):
+        return f"commentary for {spin_response.bucket_type}"
+
+    monkeypatch.setattr(app_module.commentary_cache, "commentary", commentary)
+    yield app_module
+    game_logger.close()
+    spin_store.close()
+
+
+@pytest.fixture
+def client(api):
+    return TestClient(api.app)
+
+
+def run_async(api, scenario):
+    """在同一个事件循环中调用 API（后台评论任务在请求之间继续运行）"""
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await scenario(http)
+    return asyncio.run(run())
+
+
+def spin_body(bet=10.0, balance=1000.0, **kwargs):
+    return {"bet": bet, "current_balance": balance, "history_rtp": 0.0, "config": LLM, **kwargs}
+
+
+def other_reels(small_config):
+    """结构不同（卷轴少一个位置）的配置，哈希与默认配置不同"""
+    config = copy.deepcopy(small_config)
+    config["reel_sets"] = [reel[:7] for reel in config["reel_sets"]]
+    config["reels_length"] = 7
+    return config
+
+
+def test_invalid_config_is_rejected_with_400(client, small_config):
+    config = copy.deepcopy(small_config)
+    config["lines"]["0"][0] = [7, 0]  # 中奖线坐标越界
+    response = client.post("/config", json=config, headers={"X-Session-ID": "s"})
+    assert response.status_code == 400
+    assert "Invalid Configuration" in response.json()["detail"]
+    # 会话仍使用原来的配置
+    assert client.post("/spin", json=spin_body(), headers={"X-Session-ID": "s"}).status_code == 200
+
+
+def test_spin_waits_for_the_background_build(client, api, small_config, monkeypatch):
+    release = threading.Event()
+    original = OutcomeEngine._load_buckets
+
+    def slow_load(self, build=True):
+        release.wait(10)
+        return original(self, build)
+
+    monkeypatch.setattr(OutcomeEngine, "_load_buckets", slow_load)
+    headers = {"X-Session-ID": "s"}
+    assert client.post("/config", json=other_reels(small_config), headers=headers).status_code == 200
+    engine = api.sessions.get("s").engine
+    try:
+        response = client.post("/spin", json=spin_body(), headers=headers)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        release.set()
+    engine.ensure_ready()
+    assert client.post("/spin", json=spin_body(), headers=headers).status_code == 200
+
+
+def test_failed_build_returns_500_then_retries(client, api, small_config, monkeypatch):
+    def failing_load(self, build=True):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(OutcomeEngine, "_load_buckets", failing_load)
+    headers = {"X-Session-ID": "s"}
+    assert client.post("/config", json=other_reels(small_config), headers=headers).status_code == 200
+    failed = api.sessions.get("s").engine
+    with pytest.raises(RuntimeError):
+        failed.ensure_ready()
+
+    response = client.post("/spin", json=spin_body(), headers=headers)
+    assert response.status_code == 500
+    assert "disk full" in response.json()["detail"]
+    # 失败的引擎已移出缓存，会话换成新引擎（重新触发构建）
+    assert api.sessions.get("s").engine is not failed
+
+
+def test_sessions_share_the_default_config_until_they_change_it(client, api, small_config):
+    a = api.sessions.get_or_create("a")
+    b = api.sessions.get_or_create("b")
+    assert a.config is b.config is api.DEFAULT_SESSION_CONFIG
+
+    config = client.get("/config", headers={"X-Session-ID": "a"}).json()
+    original_rate = small_config["settings"]["target_rtp"]
+    config["settings"]["target_rtp"] = original_rate - 0.05
+    assert client.post("/config", json=config, headers={"X-Session-ID": "a"}).status_code == 200
+
+    # 结构未变：a 的新配置继续共享默认配置的结构化部分，引擎也不变
+    assert a.config is not api.DEFAULT_SESSION_CONFIG
+    assert a.config._base is api.DEFAULT_SESSION_CONFIG._base
+    assert a.engine is b.engine
+    assert a.config["settings"]["target_rtp"] == original_rate - 0.05
+    # 默认配置与其他会话不受影响
+    assert api.DEFAULT_SESSION_CONFIG["settings"]["target_rtp"] == original_rate
+    assert client.get("/config", headers={"X-Session-ID": "b"}).json()["settings"]["target_rtp"] == original_rate
+
+
+def test_returned_config_is_a_copy(client, api):
+    config = client.get("/config", headers={"X-Session-ID": "a"}).json()
+    config["settings"]["max_win_ratio"] = 99
+    config["buckets"]["Loss_Random"]["weight"] = -1
+    default = api.DEFAULT_SESSION_CONFIG
+    assert default["settings"]["max_win_ratio"] != 99
+    assert default["buckets"]["Loss_Random"].get("weight") != -1
+    # to_dict 返回的设置与奖池配置也是副本
+    exported = default.to_dict({"Loss_Random": 0.0})
+    exported["settings"]["max_win_ratio"] = 99
+    assert "real_avg_mult" not in default["buckets"]["Loss_Random"]
+    assert default["settings"]["max_win_ratio"] != 99
+
+
+def test_board_revision_bumps_and_wakes_long_polls():
+    async def run():
+        board = CommentaryBoard()
+        ticket = board.create("s")
+        assert board.get(ticket)["status"] == "pending"
+        waiter = asyncio.ensure_future(board.wait(ticket, since=0, timeout=2.0))
+        await asyncio.sleep(0.01)
+        board.resolve(ticket, "fallback")
+        first = dict(await waiter)
+        # 已有 revision 1 时 since=1 的长轮询等到迟到的评论
+        late = asyncio.ensure_future(board.wait(ticket, since=1, timeout=2.0))
+        await asyncio.sleep(0.01)
+        assert not late.done()
+        board.resolve(ticket, "late line")
+        return first, await late
+
+    first, late = asyncio.run(run())
+    assert (first["status"], first["reasoning"], first["revision"]) == ("ready", "fallback", 1)
+    assert (late["reasoning"], late["revision"]) == ("late line", 2)
+
+
+def test_board_expires_and_bounds_tickets(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("commentary_board.time.time", lambda: now[0])
+    board = CommentaryBoard(ttl=10.0, max_tickets=3)
+    tickets = [board.create("s") for _ in range(5)]
+    assert len(board) == 3 and board.get(tickets[0]) is None
+    now[0] += 11
+    assert board.get(tickets[-1]) is None and len(board) == 0
+
+
+def test_ticket_is_scoped_to_its_session(api, monkeypatch):
+    async def commentary(config, spin_response, user_state, on_late=None):
+        # 截止时间到达时先返回兜底文案，迟到的评论随后通过 on_late 覆盖
+        asyncio.get_running_loop().call_later(0.05, on_late, "late line")
+        return "fallback"
+
+    monkeypatch.setattr(api.commentary_cache, "commentary", commentary)
+
+    async def scenario(http):
+        a, b = {"X-Session-ID": "a"}, {"X-Session-ID": "b"}
+        spin = (await http.post("/spin", json=spin_body(), headers=a)).json()
+        assert spin["reasoning"] == "Generating commentary..."
+        ticket = spin["commentary_ticket"]
+        first = (await http.get(f"/commentary/{ticket}", params={"wait": 2}, headers=a)).json()
+        late = (await http.get(f"/commentary/{ticket}", params={"wait": 2, "since": 1}, headers=a)).json()
+        other = await http.get(f"/commentary/{ticket}", headers=b)
+        unknown = await http.get("/commentary/unknown", headers=a)
+        return first, late, other.status_code, unknown.status_code
+
+    first, late, other, unknown = run_async(api, scenario)
+    assert (first["status"], first["reasoning"], first["revision"]) == ("ready", "fallback", 1)
+    assert (late["reasoning"], late["revision"]) == ("late line", 2)
+    assert other == unknown == 404
+
+
+def test_wait_commentary_returns_it_inline(client):
+    body = client.post("/spin", json=spin_body(wait_commentary=True), headers={"X-Session-ID": "a"}).json()
+    assert body["reasoning"] == f"commentary for {body['bucket_type']}"
+    assert body.get("commentary_ticket") is None
+
+
+def test_concurrent_spins_see_each_others_state(api, engine, monkeypatch):
+    n = 40
+    calls = []
+    spin_for = engine.spin_for
+
+    def recording_spin_for(**kwargs):
+        result = spin_for(**kwargs)
+        calls.append((kwargs, result["total_payout"]))
+        return result
+
+    monkeypatch.setattr(engine, "spin_for", recording_spin_for)
+
+    async def scenario(http):
+        headers = {"X-Session-ID": "a"}
+        return await asyncio.gather(*(http.post("/spin", json=spin_body(), headers=headers) for _ in range(n)))
+
+    assert all(r.status_code == 200 for r in run_async(api, scenario))
+    # 同一会话的旋转串行执行：每次旋转看到的都是上一次旋转更新后的状态，与逐次重放的 PlayerState 一致
+    calls.sort(key=lambda call: call[0]["total_spins"])
+    assert [kwargs["total_spins"] for kwargs, _ in calls] == list(range(n))
+    replay = PlayerState()
+    for kwargs, payout in calls:
+        replay.observe_balance(1000.0)
+        assert kwargs["fail_streak"] == replay.fail_streak
+        assert kwargs["historical_rtp"] == pytest.approx(replay.window_rtp)
+        assert kwargs["max_historical_balance"] == replay.max_balance
+        replay.record(10.0, payout, 1000.0 - 10.0 + payout)
+
+    player = api.sessions.get("a").player
+    assert player.snapshot() == pytest.approx(replay.snapshot())
+
+
+def test_player_state_matches_recomputing_from_history():
+    rng = random.Random(5)
+    state = PlayerState(window=50)
+    bets, payouts = [], []
+    for _ in range(500):
+        bet = rng.choice([1.0, 10.0])
+        payout = bet * rng.choice([0, 0, 0, 2, 10])
+        state.record(bet, payout, 1000.0)
+        bets.append(bet)
+        payouts.append(payout)
+
+    decay = 1 - 1 / 50
+    weights = [decay ** (len(bets) - 1 - i) for i in range(len(bets))]
+    prior = decay ** len(bets)
+    window_bet = 100.0 * prior + sum(w * b for w, b in zip(weights, bets))
+    window_payout = 95.0 * prior + sum(w * p for w, p in zip(weights, payouts))
+    assert state.window_rtp == pytest.approx(window_payout / window_bet)
+    assert state.rtp == pytest.approx((sum(payouts) + 95.0) / (sum(bets) + 100.0))
+
+    streak = max_streak = 0
+    for p in payouts:
+        streak = 0 if p > 0 else streak + 1
+        max_streak = max(max_streak, streak)
+    assert (state.fail_streak, state.max_fail_streak) == (streak, max_streak)
+
+
+def test_simulate_modes(client):
+    headers = {"X-Session-ID": "sim"}
+    full = client.post("/simulate", json={"spins": 3000, "bet": 10}, headers=headers).json()
+    assert [p["spin"] for p in full["history"]] == list(range(1, 3001))
+    assert full["history"][-1]["balance"] == full["final_balance"]
+
+    summary = client.post("/simulate", json={"spins": 3000, "mode": "summary"}, headers=headers).json()
+    assert "history" not in summary and summary["stats"]["bucket_counts"]
+
+    for method in ("lttb", "minmax"):
+        body = client.post("/simulate", json={"spins": 3000, "mode": "downsample", "method": method, "points": 100},
+                           headers=headers).json()
+        spins = [p["spin"] for p in body["history"]]
+        assert spins[0] == 1 and spins[-1] == 3000 and len(spins) <= 102
+        assert body["history"][-1]["balance"] == body["final_balance"]
+
+    assert client.post("/simulate", json={"mode": "nope"}, headers=headers).status_code == 400
+    assert client.post("/simulate", json={"mode": "downsample", "points": 2}, headers=headers).status_code == 400
+
+
+@pytest.mark.parametrize("params", [{}, {"points": 50}])
+def test_simulate_stream_is_ndjson(client, params):
+    response = client.post("/simulate", json={"spins": 20000, "mode": "stream", **params}, headers={"X-Session-ID": "sim"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [e["type"] for e in events[:-1]] == ["points"] * (len(events) - 1)
+    assert events[-1]["type"] == "summary"
+    points = [p for e in events[:-1] for p in e["points"]]
+    spins = [p["spin"] for p in points]
+    assert all(a < b for a, b in zip(spins, spins[1:])) and spins[-1] == 20000
+    assert points[-1]["balance"] == events[-1]["final_balance"]
+    if params:
+        assert len(points) <= 52
+    else:
+        assert spins == list(range(1, 20001))
+
+
+def test_saturated_executor_is_reported_as_429(client, api, monkeypatch):
+    executor = BoundedExecutor("simulate", max_workers=1, max_queue=0)
+    monkeypatch.setattr(api, "simulation_executor", executor)
+    release = threading.Event()
+    executor.submit(release.wait, 5)
+    try:
+        response = client.post("/simulate", json={"spins": 100, "mode": "summary"}, headers={"X-Session-ID": "s"})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+        stream = client.post("/simulate", json={"spins": 100, "mode": "stream"}, headers={"X-Session-ID": "s"})
+        assert stream.status_code == 429
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_cache_hit_does_not_construct_an_engine(api, engine, small_config, monkeypatch):
+    def no_engine(*args, **kwargs):
+        raise AssertionError("engine constructed on a cache hit")
+
+    monkeypatch.setattr(api, "OutcomeEngine", no_engine)
+    tuned = copy.deepcopy(small_config)
+    tuned["settings"]["target_rtp"] = 0.9
+    tuned["buckets"]["Loss_Random"]["weight"] = 1
+    assert api.get_cached_engine(SessionConfig.from_dict(tuned)) is engine
@@ -0,0 +1,71 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from bucket_builder import ReelEvaluator, build_buckets, pattern_multiplier
+
+
+@pytest.fixture(scope="module")
+def scalar_outcomes(engine):
+    """标量路径（_get_matrix_from_stops → _calculate_win → _classify_win）按 itertools.product 顺序穷举"""
+    reel_len = engine.config["reels_length"]
+    outcomes = []
+    for stops in itertools.product(range(reel_len), repeat=5):
+        multiplier, winning_lines, is_near_miss = engine._calculate_win(engine._get_matrix_from_stops(list(stops)))
+        lines = tuple((line.line_id, line.symbol, line.count, line.amount) for line in winning_lines)
+        outcomes.append((stops, multiplier, engine._classify_win(multiplier, is_near_miss), lines))
+    return outcomes
+
+
+def test_vectorized_build_matches_scalar_path(engine, scalar_outcomes):
+    evaluator = ReelEvaluator(engine.config)
+    built = build_buckets(evaluator, engine.buckets_config, evaluator.all_stops(), max_per_bucket=None)
+
+    for name, (stops, multipliers, _) in built.items():
+        expected = [(s, m) for s, m, bucket, _ in scalar_outcomes if bucket == name]
+        assert [tuple(row) for row in stops.tolist()] == [s for s, _ in expected]
+        # 逐位一致（不是近似相等）：奖池分类边界依赖精确的浮点结果
+        assert multipliers.tolist() == [m for _, m in expected]
+
+
+def test_win_patterns_match_scalar_lines(engine, scalar_outcomes):
+    by_stops = {stops: (multiplier, lines) for stops, multiplier, _, lines in scalar_outcomes}
+    for name, bucket in engine.buckets.items():
+        for idx in range(len(bucket)):
+            multiplier, lines = by_stops[tuple(bucket.stops(idx))]
+            pattern = engine.win_patterns[bucket.win_id(idx)]
+            assert pattern == lines
+            assert engine.win_multipliers[bucket.win_id(idx)] == multiplier == pattern_multiplier(pattern)
+
+
+def test_every_outcome_lands_in_exactly_one_bucket(engine, scalar_outcomes):
+    counts = {name: 0 for name in engine.buckets}
+    for _, _, bucket, _ in scalar_outcomes:
+        counts[bucket] += 1
+    assert {name: len(bucket) for name, bucket in engine.buckets.items()} == counts
+    assert sum(counts.values()) == engine.config["reels_length"] ** 5
+
+
+def test_packed_stops_round_trip(engine):
+    for bucket in engine.buckets.values():
+        unpacked = bucket.unpack_all()
+        assert unpacked.shape == (len(bucket), 5)
+        for idx in range(0, len(bucket), 97):
+            assert unpacked[idx].tolist() == bucket.stops(idx)
+        assert np.all((unpacked >= 0) & (unpacked < bucket.reel_len))
+
+
+def test_spin_results_match_re_evaluating_the_matrix(engine):
+    # spin_for 只查预计算的倍数与中奖线表；对返回的矩阵重新走标量评估应得到同样的结果
+    rng = random.Random(21)
+    for i in range(1500):
+        bet = rng.choice([1.0, 10.0, 60.0])
+        result = engine.spin_for(bet, 1000.0, 1000.0, total_spins=i, fail_streak=i % 7, ignore_safety=True)
+        multiplier, winning_lines, is_near_miss = engine._calculate_win(result["matrix"])
+        assert result["total_payout"] == multiplier * bet
+        assert result["is_win"] == (multiplier > 0)
+        assert [(l.line_id, l.symbol, l.count, l.amount) for l in result["winning_lines"]] == \
+            [(l.line_id, l.symbol, l.count, l.amount * bet) for l in winning_lines]
+        assert result["bucket_type"] == engine._classify_win(multiplier, is_near_miss)
@@ -0,0 +1,62 @@
+import copy
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from bucket_cache import FORMAT_VERSION, PRELUDE, CacheFormatError, load_buckets, save_buckets
+from outcome_engine import OutcomeEngine
+
+
+@pytest.fixture
+def cache_file(engine, tmp_path):
+    path = str(tmp_path / "cache.bin")
+    save_buckets(path, "hash", engine.config["reels_length"], engine.buckets, engine.win_patterns,
+                 engine.bucket_stats, engine.bucket_coverage)
+    return path
+
+
+def rewrite(path, offset, data):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def test_write_is_atomic(cache_file, tmp_path):
+    assert os.listdir(tmp_path) == ["cache.bin"]
+    assert load_buckets(cache_file, config_hash="hash")[0]
+
+
+@pytest.mark.parametrize("corrupt, message", [
+    (lambda path: rewrite(path, 0, b"NOTSLOT\0"), "bad magic"),
+    (lambda path: rewrite(path, 8, struct.pack("<I", FORMAT_VERSION + 1)), "unsupported cache version"),
+    (lambda path: rewrite(path, os.path.getsize(path) - 100, b"\xff"), "checksum"),
+    (lambda path: rewrite(path, PRELUDE.size + 2, b"X"), "checksum"),
+    (lambda path: os.truncate(path, os.path.getsize(path) - 64), "truncated"),
+    (lambda path: os.truncate(path, 10), "too short"),
+])
+def test_damaged_files_are_rejected(cache_file, corrupt, message):
+    corrupt(cache_file)
+    with pytest.raises(CacheFormatError, match=message):
+        load_buckets(cache_file)
+
+
+def test_config_hash_mismatch_is_rejected(cache_file):
+    with pytest.raises(CacheFormatError, match="config hash"):
+        load_buckets(cache_file, config_hash="other")
+
+
+def test_engine_rebuilds_over_a_damaged_cache(small_config, engine, tmp_path, monkeypatch):
+    path = str(tmp_path / "cache_engine.bin")
+    monkeypatch.setattr(OutcomeEngine, "_get_cache_path", lambda self: path)
+    with open(path, "wb") as f:
+        f.write(b"garbage" * 100)
+
+    rebuilt = OutcomeEngine(config_override=copy.deepcopy(small_config), lazy=True).ensure_ready()
+    for name, bucket in engine.buckets.items():
+        assert np.array_equal(rebuilt.buckets[name].packed, bucket.packed)
+    # 损坏的文件已被新缓存替换，下一个进程直接加载
+    loaded = OutcomeEngine(config_override=copy.deepcopy(small_config), lazy=True).ensure_ready(build=False)
+    assert not loaded.buckets["Loss_Random"].packed.flags.writeable
+    assert loaded.bucket_stats == rebuilt.bucket_stats
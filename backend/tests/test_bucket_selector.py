@@ -0,0 +1,139 @@
+import copy
+import itertools
+import random
+
+import pytest
+
+from bucket_selector import BucketSelector, normalize_buckets
+from bucket_store import count_within_cap
+
+
+def reference_weights(settings, raw_buckets, is_prd_win, total_spins, bet):
+    """旧版 _select_bucket 的过滤步骤（PRD / 进度分层 / 高额投注 / 兜底），返回权重 > 0 的奖池"""
+    buckets_config = normalize_buckets(raw_buckets)
+    weights = {k: v["weight"] for k, v in buckets_config.items()}
+    for k in weights:
+        if (not is_prd_win and k.startswith("Win_Tier")) or (is_prd_win and k.startswith("Loss_")):
+            weights[k] = 0
+
+    current_tier = None
+    for tier in sorted(settings.get("progress_tiers", []), key=lambda x: x["min_spins"]):
+        if total_spins >= tier["min_spins"]:
+            current_tier = tier
+        else:
+            break
+    if current_tier:
+        allowed = current_tier.get("allowed_buckets", ["ALL"])
+        if "ALL" not in allowed:
+            for k in weights:
+                if k not in allowed:
+                    weights[k] = 0
+
+    if bet < settings.get("high_roller_threshold", 50.0):
+        for k in ("Win_Tier_4", "Win_Tier_5"):
+            if k in weights:
+                weights[k] = 0
+
+    if sum(weights.values()) == 0 and is_prd_win:
+        weights = {k: v["weight"] for k, v in buckets_config.items() if k.startswith("Loss_")}
+    return [(k, w) for k, w in weights.items() if w > 0]
+
+
+def configs(default_config):
+    yield default_config["settings"], default_config["buckets"]
+
+    # 分层乱序、缺少 allowed_buckets、min/max 写法，以及中奖时全部 Win 奖池被过滤（兜底到 Loss）
+    settings = copy.deepcopy(default_config["settings"])
+    settings["progress_tiers"] = [
+        {"min_spins": 200},
+        {"min_spins": 10, "allowed_buckets": ["Loss_Random", "Loss_NearMiss"]},
+        {"min_spins": 50, "allowed_buckets": ["Loss_Random", "Win_Tier_1", "Win_Tier_5"]},
+    ]
+    settings["high_roller_threshold"] = 25
+    buckets = {k: ({"weight": v["weight"], "min": v["min_win"], "max": v["max_win"]} if i % 2 else dict(v))
+               for i, (k, v) in enumerate(default_config["buckets"].items())}
+    buckets["Win_Tier_2"]["weight"] = 0
+    yield settings, buckets
+
+
+@pytest.mark.parametrize("config_index", [0, 1])
+def test_tables_match_reference_filtering(default_config, config_index):
+    settings, raw_buckets = list(configs(default_config))[config_index]
+    selector = BucketSelector(settings, raw_buckets)
+    for is_prd_win in (True, False):
+        for total_spins in (0, 9, 10, 49, 50, 99, 100, 199, 200, 499, 500, 10 ** 6):
+            for bet in (1, 24.9, 25, 49.9, 50, 500):
+                table = selector.table(is_prd_win, total_spins, bet)
+                expected = reference_weights(settings, raw_buckets, is_prd_win, total_spins, bet)
+                assert list(zip(table.names, table.weights)) == expected
+
+
+def test_draw_follows_table_weights(default_config):
+    selector = BucketSelector(default_config["settings"], default_config["buckets"])
+    table = selector.table(True, 1000, 100)
+    rng = random.Random(3)
+    n = 60000
+    counts = {name: 0 for name in table.names}
+    for _ in range(n):
+        counts[selector.draw(table, 100, 0.0, float("inf"), rng)] += 1
+    for name, weight in zip(table.names, table.weights):
+        p = weight / table.total
+        assert abs(counts[name] / n - p) < 5 * (p * (1 - p) / n) ** 0.5 + 1e-3
+
+
+def test_count_within_cap_matches_brute_force():
+    rng = random.Random(11)
+    for _ in range(3000):
+        values = sorted(rng.choice([0, 0.1, 0.3, 0.5, 1, 2.5, 3, 10, 50, 500]) for _ in range(rng.randint(0, 12)))
+        bet = rng.choice([0, 0.1, 1, 3, 10, 60])
+        cap = 1200.0
+        # 余额取在各个门槛的边界上（除法舍入误差最容易出错的位置）及附近
+        balance = cap - rng.choice(values or [0]) * bet + rng.choice([0, 0, -1e-9, 1e-9, -0.05, 0.05])
+        expected = sum(1 for v in values if balance + v * bet <= cap)
+        assert count_within_cap(values, bet, balance, cap) == expected
+
+
+@pytest.mark.parametrize("config_index", [0, 1])
+def test_capped_tables_match_brute_force_filtering(engine, default_config, config_index):
+    settings, raw_buckets = list(configs(default_config))[config_index]
+    min_multipliers = {k: b.min_multiplier for k, b in engine.buckets.items() if b}
+    selector = BucketSelector(settings, raw_buckets, min_multipliers)
+    rng = random.Random(config_index)
+    for is_prd_win, total_spins, bet in itertools.product((True, False), (0, 10, 50, 200, 10 ** 6), (1, 25, 60)):
+        table = selector.table(is_prd_win, total_spins, bet)
+        cap = 1200.0
+        for headroom in sorted({selector.cap_multipliers[k] for k in table.names}) + [rng.uniform(0, 100)]:
+            for nudge in (-1e-9, 0.0, 1e-9):
+                balance = cap - headroom * bet + nudge
+                eligible = table.capped[count_within_cap(table.caps, bet, balance, cap)]
+                expected = [(k, w) for k, w in zip(table.names, table.weights)
+                            if balance + selector.cap_multipliers[k] * bet <= cap]
+                assert list(zip(eligible.names, eligible.weights)) == expected
+                assert eligible.total == sum(w for _, w in expected)
+
+
+def test_draw_respects_safety_cap(engine):
+    selector = engine._selector()
+    rng = random.Random(11)
+    for _ in range(20000):
+        bet = rng.choice([1, 10, 60])
+        initial_balance = 1000.0
+        cap = selector.max_allowed_balance(initial_balance)
+        balance = rng.uniform(cap - 40 * bet, cap + bet)
+        table = selector.table(rng.random() < 0.5, rng.choice([0, 100, 500]), bet)
+        name = selector.draw(table, bet, balance, cap, rng)
+
+        eligible = [k for k in table.names if balance + selector.cap_multipliers[k] * bet <= cap]
+        if eligible:
+            assert name in eligible
+        else:
+            assert name == "Loss_Random"
+
+        # 奖池内同样只抽取不超过上限的结果；没有满足的结果时返回 None
+        bucket = engine.buckets[name]
+        if bucket:
+            idx = bucket.draw_within(bet, balance, cap, rng)
+            if balance + bucket.min_multiplier * bet <= cap:
+                assert balance + engine.win_multipliers[bucket.win_id(idx)] * bet <= cap
+            else:
+                assert idx is None
@@ -0,0 +1,98 @@
+import random
+
+import numpy as np
+import pytest
+
+from bucket_cache import load_buckets, save_buckets
+from bucket_store import BucketStore
+
+
+def test_buckets_are_sorted_by_multiplier(engine):
+    for bucket in engine.buckets.values():
+        if not len(bucket):
+            continue
+        multipliers = np.asarray(engine.win_multipliers)[bucket.win_ids]
+        assert np.all(np.diff(multipliers) >= 0)
+        levels, counts = np.unique(multipliers, return_counts=True)
+        assert bucket.levels == levels.tolist()
+        assert bucket.level_ends == np.cumsum(counts).tolist()
+
+
+@pytest.mark.parametrize("reel_len, dtype", [(8, np.uint32), (84, np.uint32), (85, np.uint64), (300, np.uint64)])
+def test_packing_uses_the_smallest_dtype_and_round_trips(reel_len, dtype):
+    rng = np.random.default_rng(reel_len)
+    stops = rng.integers(0, reel_len, size=(2000, 5))
+    stops[0] = reel_len - 1  # 最大编码
+    stops[1] = 0
+    win_ids = rng.integers(0, 70000, size=2000)
+    store = BucketStore.from_stops(reel_len, stops, win_ids)
+
+    assert store.packed.dtype == dtype
+    assert store.win_ids.dtype == np.uint32
+    assert np.array_equal(store.unpack_all(), stops)
+    assert [store[i] for i in range(0, 2000, 111)] == [stops[i].tolist() for i in range(0, 2000, 111)]
+    assert [store.win_id(i) for i in range(5)] == win_ids[:5].tolist()
+    assert BucketStore.from_stops(reel_len, stops, win_ids % 100).win_ids.dtype == np.uint16
+    # 每个结果只占一个打包整数加一个序号
+    assert store.nbytes == 2000 * (np.dtype(dtype).itemsize + 4)
+
+
+def test_empty_bucket_is_falsy():
+    store = BucketStore.from_stops(8, np.empty((0, 5), dtype=np.int64), np.empty(0, dtype=np.int64))
+    assert not store and len(store) == 0 and store.unpack_all().shape == (0, 5)
+
+
+def test_draw_within_is_uniform_over_the_allowed_prefix(engine):
+    bucket = max(engine.buckets.values(), key=lambda b: len(b.levels or []))
+    assert len(bucket.levels) > 2
+    bet, cap = 10.0, 1000.0
+    k = len(bucket.levels) // 2
+    balance = cap - bucket.levels[k - 1] * bet  # 恰好允许前 k 个倍数取值
+    allowed = bucket.level_ends[k - 1]
+
+    rng = random.Random(17)
+    n = 40000
+    draws = [bucket.draw_within(bet, balance, cap, rng) for _ in range(n)]
+    assert max(draws) < allowed
+    # 每个倍数取值被抽中的频率与其结果数成正比（卡方检验，自由度 k - 1）
+    observed = np.bincount(np.searchsorted(bucket.level_ends[:k], draws, side="right"), minlength=k)
+    expected = n * np.diff([0] + bucket.level_ends[:k]) / allowed
+    chi2 = float(((observed - expected) ** 2 / expected).sum())
+    assert chi2 < (k - 1) + 6 * (2 * (k - 1)) ** 0.5
+
+
+def test_draw_within_returns_none_when_nothing_fits(engine):
+    bucket = next(b for b in engine.buckets.values() if b and b.min_multiplier > 0)
+    bet, cap = 10.0, 1000.0
+    balance = cap - bucket.min_multiplier * bet
+    assert bucket.draw_within(bet, balance, cap, random.Random(1)) is not None
+    assert bucket.draw_within(bet, balance + 0.01, cap, random.Random(1)) is None
+
+
+def test_spin_falls_back_to_loss_when_the_bucket_has_no_result_under_the_cap(engine, monkeypatch):
+    bucket_name, bucket = next((n, b) for n, b in engine.buckets.items() if b and b.min_multiplier > 0)
+    monkeypatch.setattr(engine, "_select_bucket", lambda *args, **kwargs: bucket_name)
+    cap = engine._selector(None).max_allowed_balance(1000.0)
+    balance = cap - bucket.min_multiplier * 10.0 + 0.01
+
+    result = engine.spin_for(10.0, balance, 1000.0, 0, 0, ignore_safety=True)
+    assert result["bucket_type"] == "Loss_Random"
+    assert result["total_payout"] == 0
+
+
+def test_cache_round_trip_keeps_levels(engine, tmp_path):
+    path = str(tmp_path / "cache_test.bin")
+    save_buckets(path, "hash", engine.config["reels_length"], engine.buckets, engine.win_patterns,
+                 engine.bucket_stats, engine.bucket_coverage)
+    buckets, win_patterns, bucket_stats, coverage = load_buckets(path, config_hash="hash")
+
+    assert win_patterns == engine.win_patterns
+    assert bucket_stats == engine.bucket_stats
+    for name, bucket in engine.buckets.items():
+        loaded = buckets[name]
+        assert np.array_equal(loaded.packed, bucket.packed)
+        assert np.array_equal(loaded.win_ids, bucket.win_ids)
+        assert loaded.levels == bucket.levels
+        assert loaded.level_ends == bucket.level_ends
+        # mmap 只读，各进程共享
+        assert not loaded.packed.flags.writeable
@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import llm_client
+from commentary_cache import CommentaryCache
+from llm_client import LLMClient, LLMClientPool
+from models import LLMConfig, SpinResponse, UserState
+
+SPIN = SpinResponse(matrix=[["L1"] * 5] * 3, winning_lines=[], total_payout=0.0, is_win=False,
+                    reasoning="", balance_update=-10.0, history_rtp=0.0, bucket_type="Loss_Random")
+STATE = UserState()
+
+
+def mock_pool(monkeypatch, handler):
+    requests = []
+
+    def record(request):
+        requests.append((request.url.path, json.loads(request.content)))
+        return handler(request)
+
+    pool = LLMClientPool(transport=httpx.MockTransport(record))
+    monkeypatch.setattr(llm_client, "client_pool", pool)
+    return pool, requests
+
+
+def chat_completion(content):
+    return httpx.Response(200, json={
+        "id": "x", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    })
+
+
+def test_openai_batch_uses_json_mode_and_parses_fenced_reply(monkeypatch):
+    reply = 'Sure!\n```json\n{"lines": ["Go big!", "  Go big!  ", "", 3, "Fortune awaits.", "One more?"]}\n```'
+    pool, requests = mock_pool(monkeypatch, lambda request: chat_completion(reply))
+    config = LLMConfig(provider="openai", api_key="k", base_url="http://llm.test/v1", model="gpt-4o-mini")
+
+    async def run():
+        lines = await LLMClient.request_commentary_batch(config, "prompt", 2)
+        await pool.aclose()
+        return lines
+
+    # 去掉空行、非字符串和重复行，最多返回 count 句
+    assert asyncio.run(run()) == ["Go big!", "Fortune awaits."]
+    path, body = requests[0]
+    assert path == "/v1/chat/completions"
+    assert body["response_format"] == {"type": "json_object"}
+    assert [m["role"] for m in body["messages"]] == ["system", "user"]
+
+
+def test_ollama_batch_accepts_a_renamed_list_key(monkeypatch):
+    content = json.dumps({"commentary": ["Nice!", "Again!"]})
+    pool, requests = mock_pool(monkeypatch, lambda request: httpx.Response(200, json={"message": {"content": content}}))
+    config = LLMConfig(provider="ollama", base_url="http://ollama.test", model="llama3")
+
+    async def run():
+        lines = await LLMClient.request_commentary_batch(config, "prompt", 20)
+        await pool.aclose()
+        return lines
+
+    assert asyncio.run(run()) == ["Nice!", "Again!"]
+    path, body = requests[0]
+    assert path == "/api/chat" and body["format"] == "json"
+
+
+def test_batch_without_lines_raises(monkeypatch):
+    pool, _ = mock_pool(monkeypatch, lambda request: chat_completion('{"lines": []}'))
+    config = LLMConfig(provider="openai", api_key="k", base_url="http://llm.test/v1", model="gpt-4o-mini")
+
+    async def run():
+        try:
+            await LLMClient.request_commentary_batch(config, "prompt", 5)
+        finally:
+            await pool.aclose()
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+
+def test_concurrent_misses_coalesce_into_one_batch(monkeypatch):
+    calls = []
+
+    async def batch(config, prompt, count):
+        calls.append(count)
+        await asyncio.sleep(0.05)
+        return [f"line {i}" for i in range(count)]
+
+    async def single(config, prompt):
+        raise AssertionError("single-line request should not be needed")
+
+    monkeypatch.setattr(LLMClient, "request_commentary_batch", batch)
+    monkeypatch.setattr(LLMClient, "request_commentary", single)
+    cache = CommentaryCache(variants=20, batch_size=20)
+    config = LLMConfig(provider="openai", api_key="k", model="gpt-4o-mini", commentary_deadline=1.0)
+
+    async def run():
+        return await asyncio.gather(*(cache.commentary(config, SPIN, STATE) for _ in range(50)))
+
+    texts = asyncio.run(run())
+    # 50 个并发未命中共用一次批量请求（不超过 2 次），且都拿到了缓存中的评论
+    assert len(calls) <= 2
+    assert cache.stats()["provider_calls"] == len(calls)
+    assert set(texts) <= {f"line {i}" for i in range(20)}
+    lines = [text for text, _ in next(iter(cache._pools.values()))["lines"]]
+    assert len(lines) == len(set(lines)) == 20
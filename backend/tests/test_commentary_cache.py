@@ -0,0 +1,183 @@
+import asyncio
+
+import pytest
+
+from commentary_cache import MAX_REFILL_BACKOFF, REFILL_BACKOFF, CommentaryCache
+from llm_client import FALLBACK_COMMENTARY, LLMClient
+from models import LLMConfig, SpinResponse, UserState
+
+
+def spin(bucket="Loss_Random", payout=0.0):
+    return SpinResponse(matrix=[["L1"] * 5] * 3, winning_lines=[], total_payout=payout, is_win=payout > 0,
+                        reasoning="", balance_update=payout - 10.0, history_rtp=0.0, bucket_type=bucket)
+
+
+STATE = UserState(current_bet=10.0, wallet_balance=1000.0)
+
+
+def config(api_key="key-a", deadline=1.0):
+    return LLMConfig(provider="openai", api_key=api_key, model="gpt-4o-mini", commentary_deadline=deadline)
+
+
+class FakeProvider:
+    """替换 LLMClient 的批量 / 单句请求，记录每次调用使用的 API Key"""
+
+    def __init__(self, lines=None, fail=False, delay=0.0):
+        self.lines = lines
+        self.fail = fail
+        self.delay = delay
+        self.batch_calls = []
+        self.single_calls = []
+
+    async def batch(self, config, prompt, count):
+        self.batch_calls.append(config.api_key)
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ValueError("batch failed")
+        lines = self.lines if self.lines is not None else [f"{config.api_key} line {i}" for i in range(count)]
+        return lines[:count]
+
+    async def single(self, config, prompt):
+        self.single_calls.append(config.api_key)
+        if self.fail:
+            raise ConnectionError("refused")
+        return f"{config.api_key} single"
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    def install(**kwargs):
+        fake = FakeProvider(**kwargs)
+        monkeypatch.setattr(LLMClient, "request_commentary_batch", fake.batch)
+        monkeypatch.setattr(LLMClient, "request_commentary", fake.single)
+        return fake
+    return install
+
+
+def test_miss_is_served_by_one_batch_then_hits(provider):
+    fake = provider()
+    cache = CommentaryCache(variants=5, batch_size=5)
+
+    async def run():
+        first = await cache.commentary(config(), spin(), STATE)
+        rest = [await cache.commentary(config(), spin(), STATE) for _ in range(20)]
+        return first, rest
+
+    first, rest = asyncio.run(run())
+    lines = {f"key-a line {i}" for i in range(5)}
+    assert first in lines and set(rest) <= lines
+    # 第一次未命中只发一次批量请求，不再另发单句请求
+    assert fake.batch_calls == ["key-a"] and fake.single_calls == []
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 20
+    assert cache.stats()["provider_calls"] == 1
+
+
+def test_failed_batch_falls_back_to_one_single_line_call(provider, monkeypatch):
+    fake = provider()
+
+    async def failing_batch(config, prompt, count):
+        fake.batch_calls.append(config.api_key)
+        raise ValueError("not JSON")
+
+    monkeypatch.setattr(LLMClient, "request_commentary_batch", failing_batch)
+    cache = CommentaryCache(variants=5, batch_size=5)
+    assert asyncio.run(cache.commentary(config(), spin(), STATE)) == "key-a single"
+    assert len(fake.batch_calls) == 1 and len(fake.single_calls) == 1
+    assert cache.stats()["provider_calls"] == 2
+
+
+def test_late_refill_is_delivered_through_on_late(provider):
+    provider(delay=0.2)
+    cache = CommentaryCache(variants=5, batch_size=5)
+
+    async def run():
+        late = asyncio.get_running_loop().create_future()
+        text = await cache.commentary(config(deadline=0.02), spin(), STATE, on_late=late.set_result)
+        return text, await asyncio.wait_for(late, timeout=2.0)
+
+    text, late_text = asyncio.run(run())
+    assert text == FALLBACK_COMMENTARY
+    assert late_text.startswith("key-a line")
+
+
+def test_entries_expire_after_ttl(provider):
+    fake = provider()
+    cache = CommentaryCache(variants=3, batch_size=3, ttl=0.05)
+
+    async def run():
+        await cache.commentary(config(), spin(), STATE)
+        await cache.commentary(config(), spin(), STATE)
+        await asyncio.sleep(0.1)
+        await cache.commentary(config(), spin(), STATE)
+
+    asyncio.run(run())
+    assert len(fake.batch_calls) == 2
+    assert cache.stats()["misses"] == 2 and cache.stats()["hits"] == 1
+
+
+def test_least_recently_used_signature_is_evicted(provider):
+    fake = provider()
+    cache = CommentaryCache(variants=3, batch_size=3, max_keys=2)
+    buckets = ["Loss_Random", "Loss_NearMiss", "Win_Tier_1"]
+
+    async def run():
+        for bucket in buckets:
+            await cache.commentary(config(), spin(bucket, 10.0 if bucket.startswith("Win") else 0.0), STATE)
+        await cache.commentary(config(), spin("Loss_Random"), STATE)
+
+    asyncio.run(run())
+    assert cache.stats()["keys"] == 2
+    # Loss_Random 最早写入，被淘汰后再次请求需要重新补充
+    assert len(fake.batch_calls) == 4 and cache.stats()["hits"] == 0
+
+
+def test_api_keys_do_not_share_lines(provider):
+    fake = provider()
+    cache = CommentaryCache(variants=3, batch_size=3)
+
+    async def run():
+        a = [await cache.commentary(config("key-a"), spin(), STATE) for _ in range(5)]
+        b = [await cache.commentary(config("key-b"), spin(), STATE) for _ in range(5)]
+        return a, b
+
+    a, b = asyncio.run(run())
+    assert all(text.startswith("key-a") for text in a)
+    assert all(text.startswith("key-b") for text in b)
+    assert fake.batch_calls == ["key-a", "key-b"]
+    # 条目中不保存请求方的配置（API Key）
+    assert all(set(entry) == {"lines", "prompt", "backoff", "retry_at"} for entry in cache._pools.values())
+
+
+def test_refills_that_add_nothing_back_off(provider):
+    fake = provider(lines=["same", "same", "other"])
+    cache = CommentaryCache(variants=5, batch_size=5)
+
+    async def run():
+        for _ in range(10):
+            await cache.commentary(config(), spin(), STATE)
+            await asyncio.sleep(0)
+
+    asyncio.run(run())
+    # 第一次补充得到 2 条；第二次全部重复 -> 退避，之后的命中不再触发补充
+    assert len(fake.batch_calls) == 2
+    assert cache.stats()["backoffs"] == 1
+    entry = next(iter(cache._pools.values()))
+    assert entry["backoff"] == REFILL_BACKOFF
+
+
+def test_failing_provider_backs_off_and_misses_fall_back(provider):
+    fake = provider(fail=True)
+    cache = CommentaryCache(variants=5, batch_size=5)
+
+    async def run():
+        return [await cache.commentary(config(), spin(), STATE) for _ in range(5)]
+
+    assert asyncio.run(run()) == [FALLBACK_COMMENTARY] * 5
+    assert len(fake.batch_calls) == 1 and len(fake.single_calls) == 1
+
+    # 退避期满后再次补充，仍然失败则退避时间加倍
+    entry = next(iter(cache._pools.values()))
+    entry["retry_at"] = 0.0
+    asyncio.run(cache.commentary(config(), spin(), STATE))
+    assert len(fake.batch_calls) == 2
+    assert entry["backoff"] == min(2 * REFILL_BACKOFF, MAX_REFILL_BACKOFF)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from downsample import MinMaxDownsampler, lttb, lttb_indices
+
+
+def random_walk(n, seed=0):
+    rng = np.random.default_rng(seed)
+    balances = 1000.0 + np.cumsum(rng.choice([-10.0, -10.0, -10.0, 15.0, 90.0], size=n))
+    rtps = rng.uniform(0.5, 1.5, size=n)
+    return balances, rtps
+
+
+def test_lttb_keeps_the_ends_and_point_count():
+    balances, rtps = random_walk(10000)
+    points = lttb(balances, rtps, 500)
+    assert len(points) == 500
+    spins = [p["spin"] for p in points]
+    assert spins[0] == 1 and spins[-1] == 10000
+    assert all(a < b for a, b in zip(spins, spins[1:]))
+    for p in points:
+        assert p["balance"] == balances[p["spin"] - 1] and p["rtp"] == rtps[p["spin"] - 1]
+    # 点数不少于曲线长度时原样返回
+    assert lttb_indices(balances[:100], 200).tolist() == list(range(100))
+
+
+def test_lttb_picks_isolated_spikes():
+    balances = np.zeros(1000)
+    balances[317] = 500.0
+    balances[801] = -500.0
+    spins = {p["spin"] for p in lttb(balances, np.zeros(1000), 20)}
+    assert {318, 802} <= spins
+
+
+@pytest.mark.parametrize("chunks", [[10000], [1, 2, 3, 4994, 5000], [777] * 12 + [676]])
+def test_minmax_chunking_does_not_change_the_points(chunks):
+    balances, rtps = random_walk(sum(chunks), seed=1)
+    whole = MinMaxDownsampler(len(balances), 300)
+    expected = whole.feed(balances, rtps) + whole.finish()
+
+    streamed = MinMaxDownsampler(len(balances), 300)
+    points, start = [], 0
+    for size in chunks:
+        points += streamed.feed(balances[start:start + size], rtps[start:start + size])
+        start += size
+    points += streamed.finish()
+    assert points == expected
+
+
+@pytest.mark.parametrize("n, points", [(10000, 300), (1001, 300), (7, 300), (50, 3)])
+def test_minmax_keeps_extremes_and_ends(n, points):
+    balances, rtps = random_walk(n, seed=2)
+    sampler = MinMaxDownsampler(n, points)
+    out = sampler.feed(balances, rtps) + sampler.finish()
+    spins = [p["spin"] for p in out]
+    assert spins[0] == 1 and spins[-1] == n
+    assert all(a < b for a, b in zip(spins, spins[1:]))
+    assert len(out) <= max(points, 2) + 2
+    values = [p["balance"] for p in out]
+    assert min(values) == balances.min() and max(values) == balances.max()
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import socket
+import time
+
+import httpx
+import pytest
+
+import llm_client
+from llm_client import FALLBACK_COMMENTARY, LLMClient, LLMClientPool
+from models import LLMConfig, SpinResponse, UserState
+
+SPIN = SpinResponse(matrix=[["L1"] * 5] * 3, winning_lines=[], total_payout=0.0, is_win=False,
+                    reasoning="", balance_update=-10.0, history_rtp=0.0, bucket_type="Loss_Random")
+STATE = UserState()
+
+
+class LocalServer:
+    """本地 HTTP/1.1 keep-alive 服务（模拟 Ollama）：记录建立的连接数、请求数和中途断开的请求"""
+
+    def __init__(self, delay: float = 0.0, text: str = "Keep spinning!"):
+        self.delay = delay
+        self.text = text
+        self.connections = 0
+        self.requests = 0
+        self.aborted = 0
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.decode().split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                await reader.readexactly(length)
+                self.requests += 1
+                # 处理期间客户端断开（请求被取消）时 read 立即返回 EOF
+                try:
+                    await asyncio.wait_for(reader.read(1), timeout=self.delay)
+                    self.aborted += 1
+                    return
+                except asyncio.TimeoutError:
+                    pass
+                body = json.dumps({"response": self.text}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n" % len(body) + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def ollama(url: str, deadline: float = 2.0) -> LLMConfig:
+    return LLMConfig(provider="ollama", model="test", base_url=url, commentary_deadline=deadline)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = LLMClientPool()
+    monkeypatch.setattr(llm_client, "client_pool", pool)
+    return pool
+
+
+def test_requests_reuse_one_pooled_connection(pool):
+    async def run():
+        async with LocalServer() as server:
+            texts = [await LLMClient.generate_commentary_async(ollama(server.url), SPIN, STATE) for _ in range(5)]
+            await pool.aclose()
+            return texts, server
+
+    texts, server = asyncio.run(run())
+    assert texts == ["Keep spinning!"] * 5
+    assert server.requests == 5
+    assert server.connections == 1
+
+
+def test_deadline_falls_back_and_delivers_late_commentary(pool):
+    async def run():
+        async with LocalServer(delay=0.5) as server:
+            late = asyncio.get_running_loop().create_future()
+            start = time.monotonic()
+            text = await LLMClient.generate_commentary_async(ollama(server.url, deadline=0.1), SPIN, STATE,
+                                                             on_late=late.set_result)
+            elapsed = time.monotonic() - start
+            late_text = await asyncio.wait_for(late, timeout=2.0)
+            await pool.aclose()
+            return text, elapsed, late_text
+
+    text, elapsed, late_text = asyncio.run(run())
+    assert text == FALLBACK_COMMENTARY
+    assert elapsed < 0.4
+    assert late_text == "Keep spinning!"
+
+
+def test_stalled_late_request_is_cancelled_at_overall_deadline(pool, monkeypatch):
+    monkeypatch.setattr(llm_client, "LATE_COMMENTARY_TIMEOUT", 0.3)
+
+    async def run():
+        async with LocalServer(delay=5.0) as server:
+            late = []
+            text = await LLMClient.generate_commentary_async(ollama(server.url, deadline=0.05), SPIN, STATE,
+                                                             on_late=late.append)
+            await asyncio.sleep(0.6)
+            aborted = server.aborted
+            await pool.aclose()
+            return text, late, aborted
+
+    text, late, aborted = asyncio.run(run())
+    assert text == FALLBACK_COMMENTARY
+    assert late == []
+    # 总时限到时请求被取消，连接随之断开（客户端仍在池中），而不是等服务端 5 秒后返回
+    assert aborted == 1
+
+
+def test_refused_connection_falls_back(pool):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    async def run():
+        text = await LLMClient.generate_commentary_async(ollama(f"http://127.0.0.1:{port}"), SPIN, STATE)
+        await pool.aclose()
+        return text
+
+    assert asyncio.run(run()) == FALLBACK_COMMENTARY
+
+
+def test_lru_eviction_closes_clients_after_delay():
+    pool = LLMClientPool(max_clients=2, read_timeout=0.2,
+                         transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})))
+
+    async def run():
+        first = pool.http_client("ollama", "http://a")
+        pool.http_client("ollama", "http://b")
+        assert pool.http_client("ollama", "http://a") is first  # 命中并标记为最近使用
+        pool.http_client("ollama", "http://c")  # 淘汰最久未用的 b
+        second = pool._retiring.copy().pop()
+        assert pool.stats() == {"clients": 2, "retiring": 1, "evicted": 1}
+        # 延迟关闭：淘汰后仍可完成进行中的请求
+        assert not second.is_closed
+        assert (await second.get("/")).status_code == 200
+        await asyncio.sleep(0.3)
+        assert second.is_closed
+        assert pool.stats()["retiring"] == 0
+        assert pool.http_client("ollama", "http://b") is not second
+        await pool.aclose()
+        assert first.is_closed
+
+    asyncio.run(run())
+
+
+def test_clients_from_a_previous_event_loop_are_replaced():
+    pool = LLMClientPool(transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})))
+
+    async def create():
+        return pool.http_client("ollama", "http://a")
+
+    async def reuse(old):
+        client = pool.http_client("ollama", "http://a")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return client, old.is_closed
+
+    old = asyncio.run(create())
+    client, old_closed = asyncio.run(reuse(old))
+    assert client is not old
+    assert old_closed
@@ -0,0 +1,109 @@
+import csv
+import glob
+import multiprocessing
+import time
+
+from logger import GameLogger
+
+
+def read_rows(path):
+    """按时间顺序（最旧的轮转文件在前）读出全部日志行，并检查每个文件都有表头"""
+    backups = sorted(glob.glob(path + ".[0-9]*"), key=lambda p: int(p.rsplit(".", 1)[1]), reverse=True)
+    rows = []
+    for name in backups + [path]:
+        with open(name, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            assert reader.fieldnames[:3] == ["Timestamp", "Spin_ID", "Bet"]
+            rows.extend(reader)
+    return rows
+
+
+def log_many(logger, prefix, n):
+    for i in range(n):
+        logger.log_spin(f"{prefix}{i}", 10.0, 25.0 if i % 4 == 0 else 0.0, 0.9, "test", 1.0)
+
+
+def test_rows_are_written_in_batches(tmp_path):
+    path = str(tmp_path / "game.csv")
+    logger = GameLogger(path, batch_size=10, flush_interval=30.0)
+    log_many(logger, "s", 25)
+    # 满 10 行写一批；剩余 5 行要等 flush_interval 或 close
+    deadline = time.time() + 5
+    while logger.written < 20 and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert logger.written == 20
+    assert len(read_rows(path)) == 20
+
+
+def test_close_drains_the_queue(tmp_path):
+    path = str(tmp_path / "game.csv")
+    logger = GameLogger(path, batch_size=1000, flush_interval=30.0)
+    log_many(logger, "s", 123)
+    logger.close()
+    assert [row["Spin_ID"] for row in read_rows(path)] == [f"s{i}" for i in range(123)]
+    assert logger.stats()["written"] == 123
+
+
+def test_rotation_keeps_every_row_in_order(tmp_path):
+    path = str(tmp_path / "game.csv")
+    logger = GameLogger(path, batch_size=20, flush_interval=0.01, max_bytes=4000, backup_count=50)
+    log_many(logger, "s", 600)
+    logger.close()
+    assert logger.rotations > 3
+    assert [row["Spin_ID"] for row in read_rows(path)] == [f"s{i}" for i in range(600)]
+
+
+def test_rotation_drops_the_oldest_backup(tmp_path):
+    path = str(tmp_path / "game.csv")
+    logger = GameLogger(path, batch_size=20, flush_interval=0.01, max_bytes=4000, backup_count=2)
+    log_many(logger, "s", 600)
+    logger.close()
+    assert sorted(glob.glob(path + ".*[0-9]")) == [path + ".1", path + ".2"]
+    ids = [row["Spin_ID"] for row in read_rows(path)]
+    assert ids == [f"s{i}" for i in range(600 - len(ids), 600)]
+
+
+def _worker_log(path, prefix, n):
+    logger = GameLogger(path, batch_size=25, flush_interval=0.01, max_bytes=6000, backup_count=1000)
+    log_many(logger, prefix, n)
+    logger.close()
+
+
+def test_workers_share_the_log_across_rotations(tmp_path):
+    path = str(tmp_path / "game.csv")
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_worker_log, args=(path, f"w{k}-", 1500)) for k in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+    rows = read_rows(path)
+    # 每行只出现一次，且没有进程写进已轮转的文件（否则该文件会远超 max_bytes）
+    assert sorted(row["Spin_ID"] for row in rows) == sorted(f"w{k}-{i}" for k in range(3) for i in range(1500))
+    for name in glob.glob(path + "*[0-9v]"):
+        with open(name, "rb") as f:
+            assert len(f.read()) < 6000 + 25 * 200
+    for k in range(3):
+        own = [int(row["Spin_ID"].split("-")[1]) for row in rows if row["Spin_ID"].startswith(f"w{k}-")]
+        assert own == sorted(own)
+
+
+def test_history_stats_scan_existing_logs_once(tmp_path):
+    path = str(tmp_path / "game.csv")
+    first = GameLogger(path, batch_size=20, flush_interval=0.01, max_bytes=4000, backup_count=50)
+    log_many(first, "s", 200)
+    first.close()
+
+    second = GameLogger(path)
+    assert not second.stats()["history_loaded"]
+    log_many(second, "t", 8)
+    total_bet, total_payout, rtp = second.get_history_stats()
+    assert second.stats()["history_loaded"]
+    # 200 + 8 次旋转，每 4 次中 25，另加 100 / 95 的虚拟样本
+    assert total_bet == 208 * 10.0 + 100.0
+    assert total_payout == (50 + 2) * 25.0 + 95.0
+    assert rtp == round(total_payout / total_bet, 4)
+    second.close()
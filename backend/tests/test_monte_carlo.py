@@ -0,0 +1,83 @@
+import copy
+import math
+import os
+
+import numpy as np
+import pytest
+
+from monte_carlo import merge_results, player_rng, run_monte_carlo, split_spins
+from outcome_engine import OutcomeEngine
+
+DETERMINISTIC = ("spins", "rtp", "variance", "hit_rate", "max_fail_streak", "bucket_counts", "standard_error", "rtp_ci")
+
+
+@pytest.fixture
+def sampled_config(default_config):
+    """30 个停止位置、均匀采样构建的配置；测试开始时没有缓存文件，结束时删除测试写入的缓存"""
+    config = copy.deepcopy(default_config)
+    config["reel_sets"] = [(reel * 2)[:30] for reel in config["reel_sets"]]
+    config["reels_length"] = 30
+    config["settings"]["build_workers"] = 1
+    path = OutcomeEngine(config_override=copy.deepcopy(config), lazy=True)._get_cache_path()
+    if os.path.exists(path):
+        pytest.skip("bucket cache for the test config already exists")
+    yield config
+    for suffix in ("", ".tmp"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def test_workers_share_one_sampled_build(sampled_config):
+    # 缓存不存在：主进程采样构建一次并写入缓存，worker 只加载它；之后的单进程运行读到同一份奖池
+    parallel = run_monte_carlo(copy.deepcopy(sampled_config), 10, 20000, players=4, seed=99, workers=2)
+    assert parallel["workers"] == 2
+    serial = run_monte_carlo(copy.deepcopy(sampled_config), 10, 20000, players=4, seed=99, workers=1)
+    again = run_monte_carlo(copy.deepcopy(sampled_config), 10, 20000, players=4, seed=99, workers=2)
+    for key in DETERMINISTIC:
+        assert parallel[key] == serial[key] == again[key], key
+    assert parallel["per_player"] == serial["per_player"]
+
+
+def test_fixed_seed_is_reproducible_in_process(engine, small_config):
+    runs = [run_monte_carlo(copy.deepcopy(small_config), 10, 8000, players=5, seed=7, workers=1, engine=engine)
+            for _ in range(2)]
+    for key in DETERMINISTIC:
+        assert runs[0][key] == runs[1][key], key
+    other = run_monte_carlo(copy.deepcopy(small_config), 10, 8000, players=5, seed=8, workers=1, engine=engine)
+    assert other["rtp"] != runs[0]["rtp"]
+
+
+def test_merge_results_matches_one_pass_over_all_spins():
+    rng = np.random.default_rng(4)
+    players = [rng.choice([0.0, 0.0, 0.0, 0.5, 2.0, 25.0], size=n) for n in (1000, 2500, 1, 400)]
+    results = [{
+        "spins": len(m),
+        "multiplier_sum": float(m.sum()),
+        "multiplier_sq_sum": float((m * m).sum()),
+        "hits": int((m > 0).sum()),
+        "max_fail_streak": i,
+        "bucket_counts": {"Loss_Random": int((m == 0).sum()), "Win_Tier_1": int((m > 0).sum())},
+    } for i, m in enumerate(players)]
+
+    merged = merge_results(results, confidence=0.9)
+    everything = np.concatenate(players)
+    assert merged["spins"] == len(everything)
+    assert merged["rtp"] == pytest.approx(everything.mean(), rel=1e-12)
+    assert merged["variance"] == pytest.approx(everything.var(), rel=1e-9)
+    assert merged["hit_rate"] == pytest.approx((everything > 0).mean())
+    assert merged["max_fail_streak"] == 3
+    assert merged["bucket_counts"] == {"Loss_Random": int((everything == 0).sum()),
+                                       "Win_Tier_1": int((everything > 0).sum())}
+    se = math.sqrt(everything.var() / len(everything))
+    low, high = merged["rtp_ci"]["iid"]
+    assert (high - low) / 2 == pytest.approx(1.6448536 * se, rel=1e-6)
+    assert "players" in merged["rtp_ci"]
+
+
+def test_run_matches_players_simulated_one_by_one(engine, small_config):
+    result = run_monte_carlo(copy.deepcopy(small_config), 10, 9001, players=4, seed=3, workers=1, engine=engine)
+    singles = [engine.simulate_batch(10, n, runtime_config=small_config, record_history=False, rng=player_rng(3, i))
+               for i, n in enumerate(split_spins(9001, 4))]
+    assert result["per_player"] == [{"spins": r["spins"], "rtp": r["rtp"], "final_balance": r["final_balance"],
+                                     "max_fail_streak": r["max_fail_streak"]} for r in singles]
+    assert result["rtp"] == pytest.approx(sum(r["multiplier_sum"] for r in singles) / 9001, rel=1e-12)
@@ -0,0 +1,83 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+import bucket_builder
+import outcome_engine
+from bucket_builder import ReelEvaluator, build_buckets, build_buckets_parallel
+from outcome_engine import OutcomeEngine
+
+
+def assert_same_buckets(left, right):
+    assert list(left) == list(right)
+    for name in left:
+        for a, b in zip(left[name], right[name]):
+            assert np.array_equal(a, b), name
+
+
+@pytest.fixture(scope="module")
+def evaluator(engine):
+    return ReelEvaluator(engine.config)
+
+
+def test_parallel_exhaustive_build_matches_serial(engine, evaluator):
+    serial = build_buckets(evaluator, engine.buckets_config, evaluator.all_stops(), max_per_bucket=None)
+    shards = list(range(evaluator.reel_len))  # 按第一列停止位置分片
+    parallel = build_buckets_parallel(engine.config, engine.buckets_config, shards, workers=2)
+    assert_same_buckets(serial, parallel)
+
+
+def test_parallel_sampled_build_matches_serial_with_truncation(engine, evaluator):
+    rng = np.random.default_rng(7)
+    samples = rng.integers(0, evaluator.reel_len, size=(20000, 5))
+    serial = build_buckets(evaluator, engine.buckets_config, iter([samples]), max_per_bucket=500)
+    parallel = build_buckets_parallel(engine.config, engine.buckets_config, np.array_split(samples, 8),
+                                      workers=2, max_per_bucket=500)
+    assert_same_buckets(serial, parallel)
+
+
+@pytest.fixture(scope="module")
+def long_reel_config(default_config):
+    """30 个停止位置的卷轴：30^5 ≈ 2400 万个组合，超过穷举上限，走采样构建"""
+    config = copy.deepcopy(default_config)
+    config["reel_sets"] = [(reel * 2)[:30] for reel in config["reel_sets"]]
+    config["reels_length"] = 30
+    config["settings"]["sampling_max_draws"] = 200000
+    config["settings"]["sampling_target_per_bucket"] = 500
+    return config
+
+
+def build_engine(config, sampling_mode, workers, seed):
+    config = copy.deepcopy(config)
+    config["settings"]["sampling_mode"] = sampling_mode
+    config["settings"]["build_workers"] = workers
+    engine = OutcomeEngine(config_override=config, lazy=True)
+    random.seed(seed)
+    engine.initialize_buckets()
+    return engine
+
+
+@pytest.mark.parametrize("sampling_mode", ["uniform", "stratified"])
+def test_sampled_long_reel_build_uses_pool_and_matches_serial(long_reel_config, sampling_mode, monkeypatch):
+    calls = []
+
+    def spy(*args, **kwargs):
+        calls.append(len(args[2]))
+        return build_buckets_parallel(*args, **kwargs)
+
+    monkeypatch.setattr(outcome_engine, "build_buckets_parallel", spy)
+    monkeypatch.setattr(bucket_builder, "build_buckets_parallel", spy)
+
+    serial = build_engine(long_reel_config, sampling_mode, 1, seed=21)
+    assert not calls
+    parallel = build_engine(long_reel_config, sampling_mode, 2, seed=21)
+    assert calls and all(n >= 2 for n in calls)
+
+    assert parallel.win_patterns == serial.win_patterns
+    assert parallel.bucket_coverage == serial.bucket_coverage
+    assert parallel.bucket_stats == serial.bucket_stats
+    for name, bucket in serial.buckets.items():
+        assert np.array_equal(parallel.buckets[name].packed, bucket.packed), name
+        assert np.array_equal(parallel.buckets[name].win_ids, bucket.win_ids), name
@@ -0,0 +1,43 @@
+from collections import Counter
+
+import pytest
+
+from bucket_builder import ReelEvaluator
+from rtp_calculator import calculate_rtp, outcome_distribution
+
+
+@pytest.fixture(scope="module")
+def enumerated(engine):
+    """穷举全部停止位置得到的 (倍数, Near Miss) 计数"""
+    evaluator = ReelEvaluator(engine.config)
+    counts = Counter()
+    for stops in evaluator.all_stops():
+        multipliers, near_miss, _ = evaluator.evaluate(stops)
+        counts.update(zip(multipliers.tolist(), near_miss.tolist()))
+    return counts, evaluator.reel_len ** 5
+
+
+def test_outcome_distribution_matches_enumeration(engine, enumerated):
+    counts, total = enumerated
+    multipliers, near_miss, probs = outcome_distribution(ReelEvaluator(engine.config))
+    exact = {}
+    for m, nm, p in zip(multipliers.tolist(), near_miss.tolist(), probs.tolist()):
+        if p > 0:
+            exact[(m, nm)] = exact.get((m, nm), 0.0) + p
+    # 倍数取值逐位一致，概率在浮点误差内一致
+    assert set(exact) == set(counts)
+    for key, n in counts.items():
+        assert exact[key] == pytest.approx(n / total, rel=1e-9, abs=1e-15)
+
+
+def test_rtp_and_bucket_mass_match_enumeration(engine, small_config, enumerated):
+    counts, total = enumerated
+    result = calculate_rtp(small_config)
+
+    rtp = sum(m * n for (m, _), n in counts.items()) / total
+    hit_frequency = sum(n for (m, _), n in counts.items() if m > 0) / total
+    assert result["rtp"] == pytest.approx(rtp, rel=1e-12)
+    assert result["hit_frequency"] == pytest.approx(hit_frequency, rel=1e-12)
+
+    for name, bucket in engine.buckets.items():
+        assert result["buckets"][name]["probability"] == pytest.approx(len(bucket) / total, rel=1e-9, abs=1e-15)
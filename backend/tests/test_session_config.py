@@ -0,0 +1,52 @@
+import copy
+
+import pytest
+
+from outcome_engine import OutcomeEngine, compute_config_hash
+from session_config import SessionConfig
+
+
+def aliased(config):
+    """奖池范围改用 min/max 写法的同一配置"""
+    config = copy.deepcopy(config)
+    config["buckets"] = {k: {"weight": v["weight"], "min": v["min_win"], "max": v["max_win"]}
+                         for k, v in config["buckets"].items()}
+    return config
+
+
+@pytest.mark.parametrize("alias", [False, True])
+def test_hash_without_an_engine_matches_the_engine_hash(small_config, alias):
+    config = aliased(small_config) if alias else copy.deepcopy(small_config)
+    expected = OutcomeEngine(config_override=copy.deepcopy(config), lazy=True)._get_config_hash()
+    assert compute_config_hash(config) == expected
+    assert SessionConfig.from_dict(config).config_hash == expected
+    assert compute_config_hash(aliased(small_config)) == compute_config_hash(small_config)
+
+
+def change(config, path, value):
+    config = copy.deepcopy(config)
+    target = config
+    for key in path[:-1]:
+        target = target[key]
+    target[path[-1]] = value
+    return config
+
+
+@pytest.mark.parametrize("path, value", [
+    (("settings", "target_rtp"), 0.5),
+    (("settings", "base_c_value"), 0.9),
+    (("buckets", "Loss_Random", "weight"), 1),
+    (("llm_config",), {"provider": "ollama"}),
+])
+def test_tuning_parameters_do_not_change_the_hash(small_config, path, value):
+    assert compute_config_hash(change(small_config, path, value)) == compute_config_hash(small_config)
+
+
+@pytest.mark.parametrize("path, value", [
+    (("reels_length",), 9),
+    (("buckets", "Win_Tier_1", "max_win"), 123),
+    (("settings", "sampling_mode"), "uniform"),
+    (("lines", "0"), [[1, 0], [1, 1], [1, 2], [1, 3], [1, 4]]),
+])
+def test_structural_parameters_change_the_hash(small_config, path, value):
+    assert compute_config_hash(change(small_config, path, value)) != compute_config_hash(small_config)
@@ -0,0 +1,68 @@
+import threading
+
+from session_store import SessionStore, session_size
+
+
+class FakeSession:
+    def __init__(self, session_id, shared=None):
+        self.id = session_id
+        self.engine = shared
+        self.config = shared
+        self.history = list(range(100))
+        self.last_access = 0.0
+
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(FakeSession, max_sessions=3)
+    for sid in ("a", "b", "c"):
+        store.get_or_create(sid)
+    first = store.get_or_create("a")  # a 成为最近访问
+    store.get_or_create("d")
+
+    assert "b" not in store
+    assert [sid in store for sid in ("a", "c", "d")] == [True, True, True]
+    assert store.get_or_create("a") is first
+    assert store.stats()["evicted_lru"] == 1 and store.stats()["created"] == 4
+
+
+def test_sweep_removes_only_idle_sessions(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("session_store.time.time", lambda: now[0])
+    store = SessionStore(FakeSession, idle_ttl=60.0)
+    store.get_or_create("old")
+    now[0] += 50
+    store.get_or_create("recent")
+    now[0] += 20  # old 空闲 70 秒，recent 空闲 20 秒
+
+    assert store.sweep() == 1
+    assert "old" not in store and "recent" in store
+    assert store.stats()["evicted_idle"] == 1
+    assert store.stats()["bytes_per_session_avg"] > 0
+
+    now[0] += 100
+    assert store.sweep() == 1 and len(store) == 0
+    assert store.stats()["bytes_total_estimate"] == 0
+
+
+def test_footprint_skips_shared_objects():
+    shared = {"reel_sets": [list(range(1000)) for _ in range(5)]}
+    alone, with_shared = FakeSession("a"), FakeSession("b", shared)
+    assert session_size(with_shared) == session_size(alone)
+
+
+def test_concurrent_first_requests_share_one_session():
+    created = []
+
+    def factory(sid):
+        created.append(sid)
+        return FakeSession(sid)
+
+    store = SessionStore(factory)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_create("x"))) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(s) for s in results}) == 1
+    assert len(store) == 1 and store.stats()["created"] == 1
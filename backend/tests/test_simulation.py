@@ -0,0 +1,66 @@
+import random
+
+import numpy as np
+import pytest
+
+
+def spin_loop(engine, bet, spins, initial_balance):
+    """逐次调用 spin(simulation_mode=True) 的参考实现"""
+    balance = initial_balance
+    fail_streak = 0
+    balances, buckets = [], []
+    for _ in range(spins):
+        result = engine.spin({
+            "current_bet": bet,
+            "wallet_balance": balance,
+            "initial_balance": initial_balance,
+            "total_spins": 0,
+            "fail_streak": fail_streak,
+            "simulation_mode": True,
+        })
+        balance += result["balance_update"]
+        fail_streak = result["fail_streak"]
+        balances.append(balance)
+        buckets.append(result["bucket_type"])
+    return balances, buckets
+
+
+@pytest.mark.parametrize("bet,initial_balance", [(10, 1000.0), (60, 6000.0), (10, 50000.0)])
+def test_simulate_batch_matches_spin_loop(engine, bet, initial_balance):
+    spins = 3000
+    random.seed(1234)
+    balances, buckets = spin_loop(engine, bet, spins, initial_balance)
+
+    random.seed(1234)
+    result = engine.simulate_batch(bet, spins, initial_balance)
+
+    assert result["balance_curve"].tolist() == balances
+    assert result["final_balance"] == balances[-1]
+    assert result["bucket_counts"] == {name: buckets.count(name) for name in engine.buckets}
+
+
+def test_simulation_never_exceeds_safety_cap(engine):
+    bet, initial_balance = 10, 1000.0
+    result = engine.simulate_batch(bet, 20000, initial_balance, rng=random.Random(5))
+    cap = initial_balance * engine.settings.get("max_win_ratio", 1.2)
+    # 起始余额低于上限时，任何一次旋转后的余额都不会超过上限
+    assert result["balance_curve"].max() <= cap
+    assert result["max_balance"] <= cap
+
+
+def test_chunked_and_summary_runs_match_batch(engine):
+    full = engine.simulate_batch(10, 5000, 20000.0, rng=random.Random(9))
+
+    run = engine.iter_simulation(10, 5000, 20000.0, chunk_size=777, rng=random.Random(9))
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(run)[0])
+        except StopIteration as done:
+            summary = done.value
+            break
+    assert np.concatenate(chunks).tolist() == full["balance_curve"].tolist()
+
+    summary_only = engine.simulate_batch(10, 5000, 20000.0, record_history=False, rng=random.Random(9))
+    for key in ("final_balance", "total_won", "hits", "max_fail_streak", "multiplier_sum", "bucket_counts"):
+        assert summary[key] == full[key] == summary_only[key]
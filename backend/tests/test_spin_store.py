@@ -0,0 +1,129 @@
+import math
+import multiprocessing
+import os
+import random
+import time
+
+import pytest
+
+from spin_store import SpinStore
+
+
+def record_spins(store, session, n, rng, start_ts=0.0):
+    """写入 n 次旋转，返回写入的 (bet, payout, bucket, latency) 列表"""
+    rows = []
+    for i in range(n):
+        bet = rng.choice([1.0, 10.0, 50.0])
+        payout = bet * rng.choice([0, 0, 0, 1, 2, 20])
+        bucket = "Loss_Random" if payout == 0 else f"Win_Tier_{1 + (payout > 2 * bet)}"
+        latency = rng.lognormvariate(1.5, 0.8)
+        store.record(session, start_ts + i, bet, payout, bucket, 0, latency, 0.9)
+        rows.append((bet, payout, bucket, latency))
+    return rows
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SpinStore(str(tmp_path / "spins.db"))
+    yield store
+    store.close()
+
+
+def test_store_is_created_lazily(tmp_path):
+    path = tmp_path / "spins.db"
+    store = SpinStore(str(path))
+    assert not path.exists()
+    assert store.history("nobody") == []
+    assert path.exists()
+
+
+def test_seq_is_dense_per_session_and_history_pages(store):
+    rng = random.Random(1)
+    for _ in range(3):
+        record_spins(store, "a", 150, rng)
+        record_spins(store, "b", 40, rng)
+    assert store.flush(5.0)
+
+    page = store.history("a", limit=100)
+    assert [r["Seq"] for r in page] == list(range(450, 350, -1))
+    rest = store.history("a", limit=1000, before=page[-1]["Seq"])
+    assert [r["Seq"] for r in rest] == list(range(350, 0, -1))
+    assert [r["Seq"] for r in store.history("b", limit=1000)] == list(range(120, 0, -1))
+
+
+def test_rollups_and_percentiles_match_the_rows(store):
+    rng = random.Random(2)
+    rows_a = record_spins(store, "a", 3000, rng)
+    rows_b = record_spins(store, "b", 1000, rng)
+    assert store.flush(5.0)
+
+    for scope, rows in (("a", rows_a), (None, rows_a + rows_b)):
+        stats = store.stats(scope)
+        total_bet = math.fsum(r[0] for r in rows)
+        total_payout = math.fsum(r[1] for r in rows)
+        assert stats["spins"] == len(rows)
+        assert stats["total_bet"] == pytest.approx(total_bet)
+        assert stats["total_payout"] == pytest.approx(total_payout)
+        assert stats["rtp"] == pytest.approx(total_payout / total_bet)
+        assert stats["hit_rate"] == pytest.approx(sum(r[1] > 0 for r in rows) / len(rows))
+        for name, bucket in stats["buckets"].items():
+            assert bucket["spins"] == sum(r[2] == name for r in rows)
+
+        # 对数直方图的分位数误差在一个 bin（约 5%）以内
+        latencies = sorted(r[3] for r in rows)
+        for p in (50, 90, 99):
+            exact = latencies[math.ceil(p / 100 * len(latencies)) - 1]
+            assert stats["latency_ms"][f"p{p}"] == pytest.approx(exact, rel=0.06)
+        assert stats["latency_ms"]["max"] == round(latencies[-1], 2)
+
+    curve = store.stats("a", points=50)["rtp_curve"]
+    assert curve[0]["spin"] == 1 and curve[-1]["spin"] == 3000 and len(curve) <= 51
+
+
+def test_bad_rows_do_not_stop_the_writer(store):
+    store.record("a", 0.0, 10.0, 0.0, "Loss_Random", 0, 1.0, 0.9)
+    store.record("a", 1.0, 10.0, 0.0, "Loss_Random", 0, None, 0.9)  # 违反 NOT NULL（数据库错误）
+    store.record("a", 2.0, 10.0, 20.0, "Win_Tier_1", 0, 1.0, 0.9)
+    store.record("a", 3.0, 10.0, 0.0, "Loss_Random", 0, "slow", 0.9)  # 汇总时 TypeError（非数据库错误）
+    store.record("a", 4.0, 10.0, 0.0, "Loss_Random", 0, 2.0, 0.9)
+    start = time.time()
+    assert store.flush(2.0)
+    assert time.time() - start < 1.0
+    # 只跳过出错的行，序号保持连续
+    assert [(r["Seq"], r["Payout"]) for r in store.history("a")] == [(3, 0.0), (2, 20.0), (1, 0.0)]
+    assert store.writer_stats()["failed"] == 2
+    assert store.stats("a")["spins"] == 3
+
+    record_spins(store, "a", 10, random.Random(3))
+    assert store.flush(2.0)
+    assert store.stats("a")["spins"] == 13
+    assert store._writer.is_alive()
+
+
+def _worker(path, worker, n):
+    store = SpinStore(path, batch_size=50)
+    rng = random.Random(worker)
+    for i in range(n):
+        store.record(f"s{i % 4}", time.time(), 10.0, rng.choice([0.0, 20.0]), "Loss_Random", 0, 1.0, 0.9)
+        if i % 100 == 0:
+            time.sleep(0.001)  # 让各进程的批次交错
+    store.close(30.0)
+    os._exit(0 if store.writer_stats()["failed"] == 0 else 1)
+
+
+def test_processes_share_one_store(tmp_path):
+    path = str(tmp_path / "spins.db")
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_worker, args=(path, w, 1200)) for w in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(120)
+        assert p.exitcode == 0
+
+    store = SpinStore(path)
+    for s in range(4):
+        seqs = [r["Seq"] for r in store.history(f"s{s}", limit=1000)]
+        assert seqs == list(range(900, 0, -1))
+        assert store.stats(f"s{s}")["spins"] == 900
+    assert store.stats()["spins"] == 3600
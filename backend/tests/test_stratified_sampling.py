@@ -0,0 +1,85 @@
+import copy
+
+import numpy as np
+import pytest
+
+from bucket_builder import COLS, ReelEvaluator, build_buckets, build_buckets_stratified, importance_weights
+from rtp_calculator import calculate_rtp
+
+
+@pytest.fixture(scope="module")
+def small(engine):
+    evaluator = ReelEvaluator(engine.config)
+    exhaustive = build_buckets(evaluator, engine.buckets_config, evaluator.all_stops(), max_per_bucket=None)
+    return evaluator, engine.buckets_config, exhaustive
+
+
+@pytest.fixture(scope="module")
+def long_reels(default_config):
+    """30 个停止位置（约 2400 万个组合），稀有奖池在均匀抽样中很少出现"""
+    config = copy.deepcopy(default_config)
+    config["reel_sets"] = [(reel * 2)[:30] for reel in config["reel_sets"]]
+    config["reels_length"] = 30
+    return config, ReelEvaluator(config)
+
+
+def keys(stops, reel_len):
+    return (stops @ reel_len ** np.arange(COLS - 1, -1, -1)).tolist()
+
+
+def test_sampled_outcomes_are_valid_and_unique(small):
+    evaluator, buckets_config, exhaustive = small
+    built, coverage = build_buckets_stratified(evaluator, buckets_config, np.random.default_rng(3),
+                                               target_per_bucket=10 ** 6, max_draws=40000,
+                                               batch_size=5000, max_per_bucket=3000)
+    assert coverage["draws"] == {"uniform": 10000, "importance": 30000}
+    for name, (stops, multipliers, _) in built.items():
+        truth = dict(zip(keys(exhaustive[name][0], evaluator.reel_len), exhaustive[name][1].tolist()))
+        sampled = keys(stops, evaluator.reel_len)
+        # 每个组合落在穷举时的同一个奖池，倍数一致，且奖池内不重复
+        assert all(truth[k] == m for k, m in zip(sampled, multipliers.tolist()))
+        assert len(set(sampled)) == len(sampled) <= 3000
+        assert coverage["buckets"][name]["count"] == len(sampled)
+
+
+def test_sampling_stops_once_every_bucket_reaches_its_target(small):
+    evaluator, buckets_config, _ = small
+    reachable = {k: v for k, v in buckets_config.items() if k != "Loss_NearMiss"}  # 小卷轴上没有 NearMiss
+    built, coverage = build_buckets_stratified(evaluator, reachable, np.random.default_rng(4),
+                                               target_per_bucket=5, max_draws=10 ** 6, batch_size=5000)
+    # 均匀阶段在预算用完前就已覆盖全部奖池，不再进入重要性阶段
+    assert coverage["draws"]["importance"] == 0
+    assert coverage["draws"]["uniform"] < 10 ** 6 // 4 and coverage["draws"]["uniform"] % 5000 == 0
+    assert all(entry["covered"] for entry in coverage["buckets"].values())
+
+
+def test_importance_phase_finds_more_rare_outcomes(long_reels):
+    config, evaluator = long_reels
+    buckets_config = config["buckets"]
+    stratified, coverage = build_buckets_stratified(evaluator, buckets_config, np.random.default_rng(1),
+                                                    target_per_bucket=10 ** 6, max_draws=100000, batch_size=25000)
+    uniform = build_buckets(evaluator, buckets_config,
+                            iter([np.random.default_rng(1).integers(0, 30, size=(100000, COLS))]), max_per_bucket=None)
+    # 同样的抽样预算下，重要性阶段为高倍奖池找到明显更多的结果
+    for name in ("Win_Tier_4", "Win_Tier_5"):
+        assert len(stratified[name][0]) > 1.5 * len(uniform[name][0])
+
+    # 概率估计只来自均匀阶段，与精确计算一致（5 个标准差以内）
+    exact = calculate_rtp(config)["buckets"]
+    n = coverage["draws"]["uniform"]
+    for name, entry in coverage["buckets"].items():
+        p = exact[name]["probability"]
+        assert abs(entry["estimated_probability"] - p) <= 5 * (p * (1 - p) / n) ** 0.5 + 1e-9
+
+
+def test_importance_weights_favour_premium_windows(long_reels):
+    _, evaluator = long_reels
+    weights = importance_weights(evaluator)
+    assert weights.shape == (COLS, evaluator.reel_len)
+    assert np.allclose(weights.sum(axis=1), 1.0)
+    assert np.all(weights > 0)
+    wild_rows = [(evaluator.reel_table[c, (np.arange(evaluator.reel_len)[:, None] + np.arange(3)) % evaluator.reel_len]
+                  == evaluator.wild_code).any(axis=1) for c in range(COLS)]
+    for c in range(COLS):
+        if wild_rows[c].any() and (~wild_rows[c]).any():
+            assert weights[c][wild_rows[c]].mean() > weights[c][~wild_rows[c]].mean()
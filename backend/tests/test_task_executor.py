@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from task_executor import BoundedExecutor, ExecutorSaturated
+
+
+def test_submit_rejects_when_running_and_queued_are_full():
+    executor = BoundedExecutor("test", max_workers=2, max_queue=1)
+    release = threading.Event()
+    try:
+        futures = [executor.submit(release.wait, 5) for _ in range(3)]
+        with pytest.raises(ExecutorSaturated):
+            executor.submit(time.sleep, 0)
+        assert executor.stats()["pending"] == 3 and executor.stats()["rejected"] == 1
+
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        # 任务完成后名额释放
+        assert executor.submit(lambda: 42).result(timeout=5) == 42
+        deadline = time.time() + 5
+        while executor.stats()["pending"] and time.time() < deadline:
+            time.sleep(0.01)
+        assert executor.stats()["pending"] == 0
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def test_run_does_not_block_the_event_loop():
+    executor = BoundedExecutor("test", max_workers=1, max_queue=0)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        result = await executor.run(lambda: time.sleep(0.3) or "done")
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(run())
+    executor.shutdown()
+    assert result == "done" and ticks >= 10
+
+
+def test_iterate_streams_items_and_propagates_errors():
+    executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+
+    def numbers(n, fail_at=None):
+        for i in range(n):
+            if i == fail_at:
+                raise ValueError("boom")
+            yield i
+
+    async def collect(*args):
+        return [item async for item in executor.iterate(numbers, *args, buffer=2)]
+
+    assert asyncio.run(collect(50)) == list(range(50))
+    with pytest.raises(ValueError, match="boom"):
+        asyncio.run(collect(50, 10))
+    executor.shutdown()
+
+
+def test_iterate_stops_the_producer_when_the_consumer_leaves():
+    executor = BoundedExecutor("test", max_workers=1, max_queue=0)
+    produced = []
+
+    def endless():
+        i = 0
+        while True:
+            produced.append(i)
+            yield i
+            i += 1
+
+    async def take_three():
+        stream = executor.iterate(endless, buffer=2)
+        items = []
+        async for item in stream:
+            items.append(item)
+            if len(items) == 3:
+                break
+        await stream.aclose()
+        return items
+
+    assert asyncio.run(take_three()) == [0, 1, 2]
+    deadline = time.time() + 5
+    while executor.stats()["pending"] and time.time() < deadline:
+        time.sleep(0.05)
+    # 生产者最多领先 buffer 项后停止，并释放执行器名额
+    assert executor.stats()["pending"] == 0
+    assert len(produced) <= 3 + 2 + 2
+    executor.shutdown()
+